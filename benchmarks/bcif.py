@@ -0,0 +1,70 @@
+"""Compare the time to load a structure from text mmCIF and from BinaryCIF. A
+synthetic structure is built by replicating a small one, written as both text
+and BinaryCIF, and each is loaded and used to build the unit ids of every
+residue, which needs the atom_site table in full.
+
+Usage: python benchmarks/bcif.py files/1FAT.cif [copies]
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary import bcif
+from rnastructure.tertiary.cif import CIF
+
+from parsing import best_of
+from synthetic import replicate
+
+DEFAULT_COPIES = 10
+
+
+def load_text(raw):
+    return CIF(raw).unit_ids()
+
+
+def load_binary(raw):
+    return bcif.load(raw).unit_ids()
+
+
+def main(source, copies):
+    directory = tempfile.mkdtemp()
+    try:
+        text = os.path.join(directory, 'synthetic.cif')
+        with open(source, 'rb') as raw:
+            with open(text, 'wb') as out:
+                replicate(raw, copies, out)
+
+        binary = os.path.join(directory, 'synthetic.bcif')
+        with open(text, 'rb') as raw:
+            cif = CIF(raw, lazy=False)
+        start = time.time()
+        with open(binary, 'wb') as out:
+            bcif.dump(cif, out)
+        encoding = time.time() - start
+
+        for name, filename, function in [('text', text, load_text),
+                                         ('bcif', binary, load_binary)]:
+            size = os.path.getsize(filename) / float(1024 ** 2)
+            print('%s: %.1f MB, %.3fs' % (name, size,
+                                         best_of(function, filename)))
+        print('encoding: %.3fs' % encoding)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__)
+    copies = DEFAULT_COPIES
+    if len(sys.argv) == 3:
+        copies = int(sys.argv[2])
+    main(sys.argv[1], copies)
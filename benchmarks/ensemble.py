@@ -0,0 +1,96 @@
+"""Compare the memory used to visit every model of a large ensemble. A
+synthetic ensemble is built by replicating a small structure as new models,
+then each model is visited either through CIF.models, which indexes the
+whole structure at once, or CIF.model_iterator, which indexes one model at a
+time. For each model the coordinates and unit ids are computed, and the
+largest growth in anonymous resident memory is reported. The file is loaded
+from a cache, so the memory freed after parsing does not hide this growth,
+and the pages of the memory mapped cache are not counted.
+
+Usage: python benchmarks/ensemble.py files/1FAT.cif [models]
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary.cif import CIF
+
+from memory import megabytes
+from synthetic import replicate
+
+DEFAULT_MODELS = 40
+
+METHODS = ('models', 'model_iterator')
+
+
+def anonymous():
+    """Get the anonymous resident memory of this process in bytes, which
+    leaves out memory mapped files.
+    """
+    with open('/proc/self/status', 'rb') as raw:
+        for line in raw:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    raise OSError("RssAnon is not available")
+
+
+def visit(cif, method):
+    if method == 'models':
+        return cif.models()
+    return cif.model_iterator()
+
+
+def measure(filename, cache_dir, method):
+    cif = CIF.from_path(filename, cache_dir=cache_dir)
+
+    before = anonymous()
+    peak = 0
+    count = 0
+    start = time.time()
+    for model in visit(cif, method):
+        model.coordinates()
+        model.unit_ids()
+        peak = max(peak, anonymous() - before)
+        count += 1
+    elapsed = time.time() - start
+
+    print('%s: %d models, %.1f MB peak growth, %.2fs' % (
+        method, count, megabytes(peak), elapsed))
+
+
+def main(source, models):
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'ensemble.cif')
+        with open(source, 'rb') as raw:
+            with open(filename, 'wb') as out:
+                replicate(raw, models, out, models=True)
+        cache_dir = os.path.join(directory, 'cache')
+        CIF.from_path(filename, cache_dir=cache_dir)
+        for method in METHODS:
+            subprocess.check_call([sys.executable, __file__, '--measure',
+                                   filename, cache_dir, method])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(*sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__)
+    models = DEFAULT_MODELS
+    if len(sys.argv) == 3:
+        models = int(sys.argv[2])
+    main(sys.argv[1], models)
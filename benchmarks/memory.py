@@ -0,0 +1,72 @@
+"""Measure the memory used by Residue objects for a large structure. A
+synthetic structure is built by replicating a small one, every residue in
+it is created and kept, and the growth in resident memory is reported.
+
+Usage: python benchmarks/memory.py files/1FAT.cif [copies]
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.profile import resident
+
+from synthetic import replicate
+
+DEFAULT_COPIES = 30
+
+
+def megabytes(size):
+    return size / float(1024 ** 2)
+
+
+def measure(filename):
+    with open(filename, 'rb') as raw:
+        cif = CIF(raw)
+
+    symmetry = list(cif.symmetry_operators(nonpolymers=True))
+    atoms = sum(len(part._hierarchy) for part in symmetry)
+
+    before = resident()
+    start = time.time()
+    residues = []
+    for part in symmetry:
+        residues.extend(part.residue_iterator())
+    elapsed = time.time() - start
+    used = resident() - before
+
+    print('atoms: %d' % atoms)
+    print('residues: %d' % len(residues))
+    print('memory: %.1f MB (%.0f bytes per residue)' % (
+        megabytes(used), used / float(max(len(residues), 1))))
+    print('time: %.2fs' % elapsed)
+
+
+def main(source, copies):
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'synthetic.cif')
+        with open(source, 'rb') as raw:
+            with open(filename, 'wb') as out:
+                replicate(raw, copies, out)
+        measure(filename)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(__doc__)
+    copies = DEFAULT_COPIES
+    if len(sys.argv) == 3:
+        copies = int(sys.argv[2])
+    main(sys.argv[1], copies)
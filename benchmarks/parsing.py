@@ -0,0 +1,57 @@
+"""Compare the time to parse mmCIF files with rnastructure.tertiary.reader and
+with PdbxReader from the PDBx package, if it is installed.
+
+Usage: python benchmarks/parsing.py files/1FAT.cif [other.cif ...]
+"""
+
+import os
+import sys
+import time
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary.reader import Reader
+
+try:
+    from pdbx.reader.PdbxParser import PdbxReader
+except ImportError:
+    PdbxReader = None
+
+
+def best_of(function, filename, repeat=3):
+    times = []
+    for _ in xrange(repeat):
+        with open(filename, 'rb') as raw:
+            start = time.time()
+            function(raw)
+            times.append(time.time() - start)
+    return min(times)
+
+
+def read_native(raw):
+    return Reader(raw).read()
+
+
+def read_pdbx(raw):
+    data = []
+    PdbxReader(raw).read(data)
+    return data
+
+
+def main(filenames):
+    for filename in filenames:
+        native = best_of(read_native, filename)
+        line = '%s\treader: %.3fs' % (filename, native)
+        if PdbxReader is not None:
+            pdbx = best_of(read_pdbx, filename)
+            line += '\tPdbxReader: %.3fs\tspeedup: %.1fx' % (pdbx,
+                                                            pdbx / native)
+        print(line)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    main(sys.argv[1:])
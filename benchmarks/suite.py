@@ -0,0 +1,195 @@
+"""Benchmark each stage of loading and using a structure with
+rnastructure.tertiary.cif on a large synthetic structure. The structure is
+built by replicating a small one, 300 copies of 1FAT gives about two million
+atoms. Each stage is run in a new process, after loading the file. The wall
+time of the stage, the peak resident memory of the process and the growth in
+resident memory during the stage are reported. The peak is usually set by
+parsing, so the growth shows what each later stage adds.
+
+Results can be saved as JSON and compared against a saved baseline, stages
+which are slower or use more memory than the baseline by more than the
+tolerance are marked.
+
+Usage: python benchmarks/suite.py files/1FAT.cif --copies 300
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.profile import resident
+from rnastructure.tertiary.profile import peak_resident
+
+from memory import megabytes
+from synthetic import replicate
+
+DEFAULT_COPIES = 100
+
+DEFAULT_TOLERANCE = 0.2
+
+
+def load(filename):
+    with open(filename, 'rb') as raw:
+        cif = CIF(raw)
+    cif.atom_site
+    return cif
+
+
+def construct(filename):
+    return len(load(filename).atom_site)
+
+
+def symmetry_operators(cif):
+    return len(list(cif.symmetry_operators()))
+
+
+def chains(cif):
+    return len(list(cif.chains()))
+
+
+def polymers(cif):
+    return len(list(cif.polymers()))
+
+
+def residues(cif):
+    return sum(len(chain.residues()) for chain in cif.chains())
+
+
+def unit_ids(cif):
+    return len(cif.unit_ids())
+
+
+def sequence_mappings(cif):
+    return sum(len(mapping) for _, mapping in cif.sequence_mappings())
+
+
+STAGES = [
+    ('construct', construct),
+    ('symmetry_operators', symmetry_operators),
+    ('chains', chains),
+    ('polymers', polymers),
+    ('residues', residues),
+    ('unit_ids', unit_ids),
+    ('sequence_mappings', sequence_mappings),
+]
+
+
+def measure(filename, name):
+    """Run a single stage and print a JSON line with the result. Every stage
+    but construct is given the CIF after loading it, so the time only covers
+    the stage itself.
+    """
+    function = dict(STAGES)[name]
+    argument = filename
+    if name != 'construct':
+        argument = load(filename)
+
+    before = resident()
+    start = time.time()
+    count = function(argument)
+    elapsed = time.time() - start
+    print(json.dumps({'stage': name, 'count': count, 'seconds': elapsed,
+                      'peak': peak_resident(),
+                      'growth': max(resident() - before, 0)}))
+
+
+def run(filename, stages):
+    results = []
+    for name in stages:
+        output = subprocess.check_output([sys.executable, __file__,
+                                          '--measure', name, filename])
+        results.append(json.loads(output.strip().split('\n')[-1]))
+    return results
+
+
+def compare(result, baseline, tolerance):
+    """Get the marks for a stage which is slower or uses more memory than the
+    baseline by more than the tolerance.
+    """
+    if baseline is None:
+        return ''
+    marks = []
+    for key, label in [('seconds', 'time'), ('peak', 'peak'),
+                       ('growth', 'growth')]:
+        if key in baseline and result[key] > baseline[key] * (1 + tolerance):
+            marks.append('%s +%.0f%%' % (label, 100 * (result[key] /
+                                                       baseline[key] - 1)))
+    return ', '.join(marks)
+
+
+def report(results, baselines, tolerance):
+    print('%-20s %10s %10s %10s %10s  %s' % ('stage', 'count', 'seconds',
+                                             'peak MB', 'growth MB',
+                                             'regressions'))
+    regressed = False
+    for result in results:
+        marks = compare(result, baselines.get(result['stage']), tolerance)
+        regressed = regressed or bool(marks)
+        print('%-20s %10d %10.3f %10.1f %10.1f  %s' % (
+            result['stage'], result['count'], result['seconds'],
+            megabytes(result['peak']), megabytes(result['growth']), marks))
+    return regressed
+
+
+def main(args):
+    if args[:1] == ['--measure']:
+        measure(args[2], args[1])
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('source', help="The mmCIF file to replicate")
+    parser.add_argument('--copies', type=int, default=DEFAULT_COPIES,
+                        help="Number of copies of the source to make")
+    parser.add_argument('--stages', nargs='+', default=[s for s, _ in STAGES],
+                        choices=[s for s, _ in STAGES],
+                        help="Stages to run")
+    parser.add_argument('--keep', default=None,
+                        help="Write the synthetic file here and reuse it if "
+                        "it already exists")
+    parser.add_argument('--json', default=None,
+                        help="Save the results to this file")
+    parser.add_argument('--baseline', default=None,
+                        help="Compare against results saved with --json")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed fraction of slow down or memory growth")
+    options = parser.parse_args(args)
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = options.keep
+        if filename is None:
+            filename = os.path.join(directory, 'synthetic.cif')
+        if not os.path.exists(filename):
+            with open(options.source, 'rb') as raw:
+                with open(filename, 'wb') as out:
+                    replicate(raw, options.copies, out)
+        results = run(filename, options.stages)
+    finally:
+        shutil.rmtree(directory)
+
+    baselines = {}
+    if options.baseline is not None:
+        with open(options.baseline, 'rb') as raw:
+            baselines = dict((r['stage'], r) for r in json.load(raw))
+
+    regressed = report(results, baselines, options.tolerance)
+    if options.json is not None:
+        with open(options.json, 'wb') as out:
+            json.dump(results, out, indent=2)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,166 @@
+"""Create large synthetic mmCIF files by replicating a small structure. Each
+copy gets new asym and chain ids and is translated so that copies do not
+overlap. The tables which refer to chains, like pdbx_poly_seq_scheme and
+pdbx_unobs_or_zero_occ_residues, are replicated as well so the result can be
+used with everything in rnastructure.tertiary.cif.
+
+With the models option each copy is instead a new model of the same chains,
+like an NMR ensemble.
+
+Usage: python benchmarks/synthetic.py files/1FAT.cif 300 big.cif [models]
+"""
+
+import os
+import re
+import sys
+
+# Just mess with path a little so we can run this from anywhere.
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, here)
+
+from rnastructure.tertiary.reader import Reader
+
+CHAIN_COLUMNS = {
+    'atom_site': ('label_asym_id', 'auth_asym_id'),
+    'pdbx_poly_seq_scheme': ('asym_id', 'pdb_strand_id'),
+    'pdbx_nonpoly_scheme': ('asym_id', 'pdb_strand_id'),
+    'pdbx_unobs_or_zero_occ_residues': ('auth_asym_id', 'label_asym_id'),
+    'struct_asym': ('id',),
+}
+
+MODEL_COLUMNS = {
+    'atom_site': 'pdbx_PDB_model_num',
+    'pdbx_unobs_or_zero_occ_residues': 'PDB_model_num',
+}
+
+ID_COLUMNS = {
+    'atom_site': 'id',
+    'pdbx_unobs_or_zero_occ_residues': 'id',
+}
+
+COORDINATES = ('Cartn_x', 'Cartn_y', 'Cartn_z')
+
+SPACING = 80.0
+
+NEEDS_QUOTES = re.compile(r'\s|^[_#$\'"\[\];]|^$')
+
+
+def quote(value):
+    """Format a single value so it can be read back in.
+    """
+    if '\n' in value:
+        return '\n;%s\n;\n' % value
+    if not NEEDS_QUOTES.search(value):
+        return value
+    if "'" not in value:
+        return "'%s'" % value
+    return '"%s"' % value
+
+
+def chain_name(name, copy):
+    if copy == 0 or name in ('?', '.'):
+        return name
+    return '%s%s' % (name, copy)
+
+
+def offset(copy):
+    return (SPACING * (copy % 10), SPACING * (copy // 10 % 10),
+            SPACING * (copy // 100))
+
+
+def replicate_rows(category, copies, models=False):
+    """Generate the rows of a category for all copies.
+    """
+    attributes = category.attributes
+    chains = [attributes.index(c) for c in CHAIN_COLUMNS[category.name]
+              if c in attributes]
+    coordinates = [attributes.index(c) for c in COORDINATES
+                   if c in attributes]
+    model = None
+    if models:
+        chains = coordinates = []
+        model = attributes.index(MODEL_COLUMNS[category.name])
+    identifier = ID_COLUMNS.get(category.name)
+    if identifier in attributes:
+        identifier = attributes.index(identifier)
+    else:
+        identifier = None
+
+    count = 0
+    for copy in xrange(copies):
+        shift = offset(copy)
+        for index in xrange(len(category)):
+            row = category.row(index)
+            count += 1
+            for column in chains:
+                row[column] = chain_name(row[column], copy)
+            for axis, column in enumerate(coordinates):
+                row[column] = '%.3f' % (float(row[column]) + shift[axis])
+            if model is not None:
+                row[model] = str(copy + 1)
+            if identifier is not None:
+                row[identifier] = str(count)
+            yield row
+
+
+def assembly_rows(category, copies):
+    attributes = category.attributes
+    column = attributes.index('asym_id_list')
+    for index in xrange(len(category)):
+        row = category.row(index)
+        names = row[column].split(',')
+        row[column] = ','.join(chain_name(name, copy)
+                               for copy in xrange(copies) for name in names)
+        yield row
+
+
+def write_category(handle, name, attributes, rows):
+    rows = list(rows)
+    if len(rows) == 1:
+        width = max(len(a) for a in attributes) + len(name) + 3
+        handle.write('#\n')
+        for attribute, value in zip(attributes, rows[0]):
+            tag = '_%s.%s' % (name, attribute)
+            handle.write('%s %s\n' % (tag.ljust(width), quote(value)))
+        return
+
+    handle.write('#\nloop_\n')
+    for attribute in attributes:
+        handle.write('_%s.%s\n' % (name, attribute))
+    for row in rows:
+        handle.write(' '.join(quote(value) for value in row))
+        handle.write('\n')
+
+
+def replicate(source, copies, handle, models=False):
+    """Write a structure made of copies of the source to handle.
+
+    :source: An open mmCIF file to copy.
+    :copies: The number of copies to make.
+    :handle: The file handle to write to.
+    :models: If True each copy is a new model instead of new chains.
+    """
+    block = Reader(source).read()[0]
+    handle.write('data_%s\n' % block.name)
+    for category in block:
+        if models and category.name in MODEL_COLUMNS:
+            rows = replicate_rows(category, copies, models=True)
+        elif models:
+            rows = (category.row(i) for i in xrange(len(category)))
+        elif category.name in CHAIN_COLUMNS:
+            rows = replicate_rows(category, copies)
+        elif category.name == 'pdbx_struct_assembly_gen':
+            rows = assembly_rows(category, copies)
+        else:
+            rows = (category.row(i) for i in xrange(len(category)))
+        write_category(handle, category.name, category.attributes, rows)
+    handle.write('#\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5) or sys.argv[4:] not in ([], ['models']):
+        sys.exit(__doc__)
+
+    with open(sys.argv[1], 'rb') as raw:
+        with open(sys.argv[3], 'wb') as out:
+            replicate(raw, int(sys.argv[2]), out, models=len(sys.argv) == 5)
@@ -0,0 +1,273 @@
+"""This module runs an extraction over many CIF files at once, using a pool of
+processes. Each file is handled by a job, a function which takes a CIF and
+returns a list of rows. Results are produced in the order files finish, not
+the order they were given, so one slow file does not hold up the rest.
+
+Each file is isolated from the others. A file which fails or takes longer
+than the timeout is reported with an error, and the other files are still
+processed. When an output directory is given, the rows for each file are
+written to their own file there, and files whose output is newer than the
+input are skipped.
+
+When profiling is on, the time and memory used by each stage of loading a
+file is included in its result, see rnastructure.tertiary.profile.
+
+This can also be run from the command line, for example:
+
+    python -m rnastructure.tertiary.batch --output out/ --format json cifs/
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import argparse
+import traceback
+import multiprocessing as mp
+from collections import namedtuple
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.profile import Profile
+
+FORMATS = ('tsv', 'json')
+
+EXTENSIONS = ('.cif', '.cif.gz', '.cif.bz2', '.cif.xz')
+
+COMPRESSION = ('.gz', '.bz2', '.xz')
+
+Result = namedtuple('Result', ['path', 'status', 'rows', 'error', 'elapsed',
+                               'profile'])
+
+
+class FileTimeout(Exception):
+
+    """This is raised inside a worker when a file takes too long.
+    """
+    pass
+
+
+def sequence_mappings(cif):
+    """The default job, which gets the experimental sequence mapping for
+    every chain in a structure, like examples/mapping.py.
+
+    :cif: The CIF to process.
+    :returns: A list of (pdb, model, chain, sequence, seq_id, unit_id).
+    """
+    rows = []
+    for chain, mapping in cif.sequence_mappings():
+        for seq, seq_id, unit_id in mapping:
+            rows.append((cif.name, chain['model'], chain['chain'], seq,
+                         seq_id, unit_id))
+    return rows
+
+
+def find_files(paths, extensions=EXTENSIONS):
+    """Expand a list of files and directories into a sorted list of files.
+    Directories are searched recursively for files with one of the given
+    extensions.
+    """
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for root, _, names in os.walk(path):
+            for name in names:
+                if name.endswith(extensions):
+                    found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def output_path(path, output, format='tsv'):
+    """Get the file the rows for an input are written to. Any compression
+    suffix is ignored, so 1FAT.cif.gz is written to 1FAT.tsv.
+    """
+    name = os.path.basename(path)
+    if name.endswith(COMPRESSION):
+        name = os.path.splitext(name)[0]
+    name = os.path.splitext(name)[0]
+    return os.path.join(output, '%s.%s' % (name, format))
+
+
+def is_up_to_date(path, target):
+    """Check if target exists and is at least as new as path.
+    """
+    if not os.path.exists(target):
+        return False
+    return os.path.getmtime(target) >= os.path.getmtime(path)
+
+
+def format_row(row, format='tsv'):
+    """Format a row as a single line of TSV or JSON.
+    """
+    if format == 'json':
+        return json.dumps(row)
+    return '\t'.join('' if value is None else str(value) for value in row)
+
+
+def write_rows(rows, target, format='tsv'):
+    """Write rows to a file. The file is written to a temporary name and then
+    moved into place, so an incomplete file is never mistaken for a complete
+    one.
+    """
+    directory = os.path.dirname(target) or '.'
+    handle, temp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as out:
+        for row in rows:
+            out.write(format_row(row, format=format))
+            out.write('\n')
+    os.rename(temp, target)
+
+
+def on_timeout(signum, frame):
+    raise FileTimeout()
+
+
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process(task):
+    """Run a job on a single file. This never raises, any error is reported
+    in the result. When the rows are written to an output file they are not
+    also returned in the result.
+
+    :task: A tuple of (path, job, output, format, timeout, profile).
+    :returns: A Result for the file.
+    """
+    path, job, output, format, timeout, profile = task
+    start = time.time()
+
+    target = None
+    if output is not None:
+        target = output_path(path, output, format=format)
+        if is_up_to_date(path, target):
+            return Result(path, 'skipped', [], None, 0.0, None)
+
+    if profile:
+        profile = Profile()
+
+    if timeout:
+        previous = signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        rows = job(CIF.from_path(path, profile=profile))
+        if target is not None:
+            write_rows(rows, target, format=format)
+            rows = []
+        status, error = 'ok', None
+    except FileTimeout:
+        rows, status = [], 'timeout'
+        error = 'Took longer than %s seconds' % timeout
+    except Exception:
+        rows, status = [], 'error'
+        error = traceback.format_exc().strip().split('\n')[-1]
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    stats = None
+    if profile:
+        stats = profile.stats()
+    return Result(path, status, rows, error, time.time() - start, stats)
+
+
+def run(paths, job=sequence_mappings, output=None, format='tsv',
+        processes=None, timeout=None, profile=False):
+    """Process many files in parallel. This is a generator which produces a
+    Result for each file as it finishes.
+
+    :paths: The files to process.
+    :job: A function which takes a CIF and returns a list of rows. It must
+    be defined at the top level of a module so it can be sent to workers.
+    :output: A directory to write the rows of each file to. If given, files
+    whose output is up to date are skipped, and the rows are not returned in
+    the results.
+    :format: The format of output files, either 'tsv' or 'json'.
+    :processes: The number of worker processes, defaults to the number of
+    cores.
+    :timeout: The maximum number of seconds to spend on one file, which may
+    be fractional.
+    :profile: True to record the time and memory used by each stage of
+    loading a file, in the profile of its Result.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown format %s" % format)
+    if timeout is not None and timeout <= 0:
+        raise ValueError("Timeout must be positive, not %s" % timeout)
+
+    if output is not None and not os.path.isdir(output):
+        os.makedirs(output)
+
+    tasks = [(path, job, output, format, timeout, profile)
+             for path in paths]
+    if processes == 1:
+        for task in tasks:
+            yield process(task)
+        return
+
+    pool = mp.Pool(processes=processes, initializer=ignore_interrupts)
+    try:
+        for result in pool.imap_unordered(process, tasks, chunksize=1):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='+',
+                        help="CIF files or directories of CIF files")
+    parser.add_argument('--output', default=None,
+                        help="Directory to write one output file per input")
+    parser.add_argument('--format', default='tsv', choices=FORMATS,
+                        help="Format of the rows")
+    parser.add_argument('--processes', default=None, type=int,
+                        help="Number of worker processes")
+    parser.add_argument('--timeout', default=None, type=float,
+                        help="Maximum number of seconds per file")
+    parser.add_argument('--profile', action='store_true',
+                        help="Write the time and memory used by each stage "
+                        "of loading a file as a line of JSON to stderr")
+    options = parser.parse_args(args)
+
+    failed = 0
+    results = run(find_files(options.paths), output=options.output,
+                  format=options.format, processes=options.processes,
+                  timeout=options.timeout, profile=options.profile)
+    try:
+        for result in results:
+            if result.profile is not None:
+                sys.stderr.write(json.dumps({'path': result.path,
+                                             'stages': result.profile}))
+                sys.stderr.write('\n')
+            if result.error is not None:
+                failed += 1
+                sys.stderr.write('%s\t%s\t%s\n' % (result.path,
+                                                   result.status,
+                                                   result.error))
+            elif options.output is None:
+                for row in result.rows:
+                    sys.stdout.write(format_row(row, format=options.format))
+                    sys.stdout.write('\n')
+            else:
+                sys.stderr.write('%s\t%s\t%.2fs\n' % (result.path,
+                                                      result.status,
+                                                      result.elapsed))
+    finally:
+        results.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,578 @@
+"""This module reads and writes BinaryCIF, a binary form of mmCIF where each
+column is stored as a compressed array. A file is a MessagePack document
+which holds the data blocks, categories and columns, and each column is
+decoded by undoing a list of encodings such as run length, delta and integer
+packing.
+
+Columns are decoded with whole array operations straight into the codes and
+levels used by rnastructure.tertiary.cif.Column, so a BinaryCIF file gives a
+CIF with the same Table, Chain and Residue interface as a text file, without
+tokenizing any text.
+
+Files can also be written, which is mostly useful for creating fixtures. The
+encoder is lossless for text files, numbers are only stored as numbers if they
+are written back exactly the same way.
+"""
+
+import re
+import struct
+import collections as coll
+
+import numpy as np
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.cif import Table
+from rnastructure.tertiary.cif import Column
+from rnastructure.tertiary.cif import boundaries
+
+ENCODER = 'rnastructure'
+
+VERSION = '0.3.0'
+
+BYTE_TYPES = {
+    1: '<i1',
+    2: '<i2',
+    3: '<i4',
+    4: '<u1',
+    5: '<u2',
+    6: '<u4',
+    32: '<f4',
+    33: '<f8',
+}
+
+INT32 = 3
+
+FLOAT64 = 33
+
+MASKED = {1: '.', 2: '?'}
+
+INTEGER = re.compile(r'^(0|-?[1-9][0-9]{0,7})$')
+
+DECIMAL = re.compile(r'^-?[0-9]+\.([0-9]{1,6})$')
+
+FIXED_LIMIT = 2 ** 30
+
+
+class BinaryCIFError(Exception):
+
+    """This is raised when a file cannot be read as BinaryCIF, for example if
+    the MessagePack data is truncated or a column uses an unknown encoding.
+    """
+    pass
+
+
+class Binary(str):
+
+    """A string which should be written as MessagePack binary data rather than
+    text.
+    """
+    pass
+
+
+def unpack(data):
+    """Decode a MessagePack document.
+
+    :data: The encoded string.
+    :returns: The decoded object, binary data is given as str.
+    """
+    try:
+        value, offset = unpack_from(data, 0)
+    except (struct.error, IndexError):
+        raise BinaryCIFError("Truncated MessagePack data")
+    if offset != len(data):
+        raise BinaryCIFError("Unexpected data after MessagePack document")
+    return value
+
+
+def unpack_from(data, offset):
+    """Decode one MessagePack object starting at offset. This returns the
+    object and the offset just after it.
+    """
+    code = ord(data[offset])
+    offset += 1
+    if code <= 0x7f:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0x80 <= code <= 0x8f:
+        return unpack_map(data, offset, code & 0x0f)
+    if 0x90 <= code <= 0x9f:
+        return unpack_array(data, offset, code & 0x0f)
+    if 0xa0 <= code <= 0xbf:
+        size = code & 0x1f
+        return data[offset:offset + size], offset + size
+    if code == 0xc0:
+        return None, offset
+    if code == 0xc2:
+        return False, offset
+    if code == 0xc3:
+        return True, offset
+    if code in SIZED:
+        kind, format = SIZED[code]
+        size, = struct.unpack_from(format, data, offset)
+        offset += struct.calcsize(format)
+        if kind == 'map':
+            return unpack_map(data, offset, size)
+        if kind == 'array':
+            return unpack_array(data, offset, size)
+        if offset + size > len(data):
+            raise BinaryCIFError("Truncated MessagePack data")
+        return data[offset:offset + size], offset + size
+    if code in NUMBERS:
+        format = NUMBERS[code]
+        value, = struct.unpack_from(format, data, offset)
+        return value, offset + struct.calcsize(format)
+    raise BinaryCIFError("Unsupported MessagePack type 0x%x" % code)
+
+
+def unpack_map(data, offset, size):
+    value = {}
+    for _ in xrange(size):
+        key, offset = unpack_from(data, offset)
+        value[key], offset = unpack_from(data, offset)
+    return value, offset
+
+
+def unpack_array(data, offset, size):
+    value = []
+    for _ in xrange(size):
+        item, offset = unpack_from(data, offset)
+        value.append(item)
+    return value, offset
+
+
+SIZED = {
+    0xc4: ('bin', '>B'),
+    0xc5: ('bin', '>H'),
+    0xc6: ('bin', '>I'),
+    0xd9: ('str', '>B'),
+    0xda: ('str', '>H'),
+    0xdb: ('str', '>I'),
+    0xdc: ('array', '>H'),
+    0xdd: ('array', '>I'),
+    0xde: ('map', '>H'),
+    0xdf: ('map', '>I'),
+}
+
+NUMBERS = {
+    0xca: '>f',
+    0xcb: '>d',
+    0xcc: '>B',
+    0xcd: '>H',
+    0xce: '>I',
+    0xcf: '>Q',
+    0xd0: '>b',
+    0xd1: '>h',
+    0xd2: '>i',
+    0xd3: '>q',
+}
+
+
+def pack(value):
+    """Encode an object as MessagePack. Binary strings must be given as
+    Binary, all other str are written as text.
+    """
+    parts = []
+    pack_into(value, parts)
+    return ''.join(parts)
+
+
+def pack_into(value, parts):
+    if value is None:
+        parts.append('\xc0')
+    elif value is True:
+        parts.append('\xc3')
+    elif value is False:
+        parts.append('\xc2')
+    elif isinstance(value, (int, long, np.integer)):
+        pack_integer(int(value), parts)
+    elif isinstance(value, (float, np.floating)):
+        parts.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, Binary):
+        parts.append(sized(len(value), (0xc4, 0xc5, 0xc6)))
+        parts.append(value)
+    elif isinstance(value, str):
+        if len(value) < 32:
+            parts.append(chr(0xa0 | len(value)))
+        else:
+            parts.append(sized(len(value), (0xd9, 0xda, 0xdb)))
+        parts.append(value)
+    elif isinstance(value, (list, tuple)):
+        if len(value) < 16:
+            parts.append(chr(0x90 | len(value)))
+        else:
+            parts.append(sized(len(value), (None, 0xdc, 0xdd)))
+        for item in value:
+            pack_into(item, parts)
+    elif isinstance(value, dict):
+        if len(value) < 16:
+            parts.append(chr(0x80 | len(value)))
+        else:
+            parts.append(sized(len(value), (None, 0xde, 0xdf)))
+        for key in sorted(value):
+            pack_into(key, parts)
+            pack_into(value[key], parts)
+    else:
+        raise TypeError("Cannot pack %r" % (value,))
+
+
+def pack_integer(value, parts):
+    if 0 <= value <= 0x7f:
+        parts.append(chr(value))
+    elif -32 <= value < 0:
+        parts.append(chr(value + 0x100))
+    elif value >= 0:
+        parts.append(struct.pack('>BQ', 0xcf, value))
+    else:
+        parts.append(struct.pack('>Bq', 0xd3, value))
+
+
+def sized(size, codes):
+    """Get the header for a string, array or map of some size, using the
+    smallest of the 8, 16 or 32 bit forms which is available.
+    """
+    for code, format, limit in zip(codes, ('>BB', '>BH', '>BI'),
+                                   (0xff, 0xffff, 0xffffffff)):
+        if code is not None and size <= limit:
+            return struct.pack(format, code, size)
+    raise ValueError("Too large to pack")
+
+
+def decode(encoded):
+    """Decode a column of data by undoing each of its encodings in reverse
+    order.
+
+    :encoded: A dict with the encoded data and the list of encodings.
+    :returns: A numpy array, or a tuple of (strings, indexes) for string
+    columns.
+    """
+    data = encoded['data']
+    for encoding in reversed(encoded['encoding']):
+        kind = encoding['kind']
+        if kind not in DECODERS:
+            raise BinaryCIFError("Unknown encoding %s" % kind)
+        data = DECODERS[kind](data, encoding)
+    return data
+
+
+def decode_byte_array(data, encoding):
+    if encoding['type'] not in BYTE_TYPES:
+        raise BinaryCIFError("Unknown byte array type %s" % encoding['type'])
+    return np.frombuffer(data, dtype=BYTE_TYPES[encoding['type']])
+
+
+def decode_fixed_point(data, encoding):
+    return data / float(encoding['factor'])
+
+
+def decode_interval_quantization(data, encoding):
+    low, high = encoding['min'], encoding['max']
+    step = (high - low) / float(max(encoding['numSteps'] - 1, 1))
+    return low + step * data
+
+
+def decode_run_length(data, encoding):
+    decoded = np.repeat(data[0::2], data[1::2])
+    if len(decoded) != encoding['srcSize']:
+        raise BinaryCIFError("Run length data has the wrong size")
+    return decoded
+
+
+def decode_delta(data, encoding):
+    return encoding['origin'] + np.cumsum(data, dtype=np.int64)
+
+
+def decode_integer_packing(data, encoding):
+    """Undo integer packing, where large values are stored as a run of the
+    largest packed value followed by the remainder. Each output is the sum of
+    a run which ends at a value that is not a limit.
+    """
+    if encoding['isUnsigned']:
+        ends = data != np.iinfo(data.dtype).max
+    else:
+        info = np.iinfo(data.dtype)
+        ends = (data != info.max) & (data != info.min)
+    totals = np.cumsum(data, dtype=np.int64)[ends]
+    decoded = np.diff(np.append(0, totals))
+    if len(decoded) != encoding['srcSize']:
+        raise BinaryCIFError("Integer packed data has the wrong size")
+    return decoded
+
+
+def decode_string_array(data, encoding):
+    offsets = decode({'data': encoding['offsets'],
+                      'encoding': encoding['offsetEncoding']})
+    indexes = decode({'data': data, 'encoding': encoding['dataEncoding']})
+    text = encoding['stringData']
+    offsets = offsets.tolist()
+    strings = [text[start:stop] for start, stop in
+               zip(offsets[:-1], offsets[1:])]
+    return strings, indexes
+
+
+DECODERS = {
+    'ByteArray': decode_byte_array,
+    'FixedPoint': decode_fixed_point,
+    'IntervalQuantization': decode_interval_quantization,
+    'RunLength': decode_run_length,
+    'Delta': decode_delta,
+    'IntegerPacking': decode_integer_packing,
+    'StringArray': decode_string_array,
+}
+
+
+def decimals(encoding):
+    """Get the number of decimal places of a fixed point column, or None if
+    the column is not stored as fixed point.
+    """
+    if not encoding or encoding[0]['kind'] != 'FixedPoint':
+        return None
+    return int(round(np.log10(encoding[0]['factor'])))
+
+
+def build_column(column, size):
+    """Decode one BinaryCIF column into a Column.
+
+    :column: The decoded MessagePack dict for the column.
+    :size: The number of rows in the category.
+    """
+    decoded = decode(column['data'])
+    mask = None
+    if column.get('mask') is not None:
+        mask = decode(column['mask'])
+
+    numbers = None
+    if isinstance(decoded, tuple):
+        strings, indexes = decoded
+        missing = indexes < 0
+        if missing.any():
+            strings = strings + ['']
+            indexes = np.where(missing, len(strings) - 1, indexes)
+        strings = np.array(strings, dtype=str)
+        levels, codes = np.unique(strings, return_inverse=True)
+        codes = codes[indexes]
+    else:
+        numbers, codes = np.unique(decoded, return_inverse=True)
+        places = decimals(column['data']['encoding'])
+        if places is not None:
+            levels = np.char.mod('%%.%df' % places, numbers)
+        elif numbers.dtype.kind in 'iu':
+            levels = numbers.astype(str)
+        else:
+            levels = np.array([repr(value) for value in numbers.tolist()],
+                              dtype=str)
+
+    if len(codes) != size:
+        raise BinaryCIFError("Column %s has the wrong size" % column['name'])
+
+    codes = codes.astype(np.int32)
+    if mask is not None and mask.any():
+        levels = np.append(levels, [MASKED[1], MASKED[2]])
+        codes[mask == 1] = len(levels) - 2
+        codes[mask == 2] = len(levels) - 1
+
+    built = Column(codes, levels)
+    if numbers is not None:
+        values = np.append(numbers.astype(float), [np.nan, np.nan])
+        built.set_numeric(values[:len(levels)])
+    return built
+
+
+def load(handle):
+    """Read a BinaryCIF file into a CIF. Like CIF this only uses the first
+    data block.
+
+    :handle: An open file, read in binary mode.
+    """
+    document = unpack(handle.read())
+    if not isinstance(document, dict) or not document.get('dataBlocks'):
+        raise BinaryCIFError("No data blocks in file")
+
+    block = document['dataBlocks'][0]
+    tables = coll.OrderedDict()
+    for category in block['categories']:
+        name = re.sub('^_', '', category['name'])
+        columns = [column['name'] for column in category['columns']]
+        data = dict((column['name'],
+                     build_column(column, category['rowCount']))
+                    for column in category['columns'])
+        tables[name] = Table(None, name, columns, data)
+    return CIF.from_tables(block['header'], tables)
+
+
+def encode_byte_array(values):
+    values = np.asarray(values)
+    for type, dtype in sorted(BYTE_TYPES.items()):
+        if np.dtype(dtype) == values.dtype.newbyteorder('<'):
+            return {'kind': 'ByteArray', 'type': type}, \
+                values.astype(dtype).tostring()
+    raise ValueError("Cannot store arrays of %s" % values.dtype)
+
+
+def encode_delta(values):
+    if not len(values):
+        return {'kind': 'Delta', 'origin': 0, 'srcType': INT32}, values
+    deltas = np.diff(values)
+    deltas = np.append(0, deltas).astype(np.int32)
+    return {'kind': 'Delta', 'origin': int(values[0]),
+            'srcType': INT32}, deltas
+
+
+def encode_run_length(values):
+    starts = np.flatnonzero(boundaries(values))
+    counts = np.diff(np.append(starts, len(values)))
+    runs = np.empty(2 * len(starts), dtype=np.int32)
+    runs[0::2] = values[starts]
+    runs[1::2] = counts
+    return {'kind': 'RunLength', 'srcType': INT32,
+            'srcSize': len(values)}, runs
+
+
+def encode_integer_packing(values, dtype):
+    """Pack integers into a smaller type. Values beyond the range of the type
+    are written as a run of the largest value followed by the remainder. This
+    gives None if packing would not be smaller than 32 bit integers.
+    """
+    info = np.iinfo(dtype)
+    values = values.astype(np.int64)
+    limits = np.where(values >= 0, info.max, info.min)
+    counts = values // limits
+    sizes = counts + 1
+    if sizes.sum() * np.dtype(dtype).itemsize >= 4 * len(values):
+        return None
+
+    packed = np.repeat(limits, sizes)
+    packed[np.cumsum(sizes) - 1] = values - counts * limits
+    return {'kind': 'IntegerPacking', 'byteCount': np.dtype(dtype).itemsize,
+            'isUnsigned': bool(info.min == 0),
+            'srcSize': len(values)}, packed.astype(dtype)
+
+
+def encode_integers(values):
+    """Encode an array of integers, trying a few combinations of delta, run
+    length and integer packing and keeping the smallest.
+    """
+    values = np.asarray(values, dtype=np.int32)
+    best = None
+    for steps in ([], [encode_delta], [encode_run_length],
+                  [encode_delta, encode_run_length]):
+        encoding = []
+        data = values
+        for step in steps:
+            described, data = step(data)
+            encoding.append(described)
+
+        candidates = [(encoding, data)]
+        if len(data):
+            for dtype in (np.int8, np.int16, np.uint8, np.uint16):
+                if dtype in (np.uint8, np.uint16) and data.min() < 0:
+                    continue
+                packing = encode_integer_packing(data, dtype)
+                if packing is not None:
+                    described, packed = packing
+                    candidates.append((encoding + [described], packed))
+
+        for encoding, data in candidates:
+            described, raw = encode_byte_array(data)
+            if best is None or len(raw) < len(best['data']):
+                best = {'encoding': encoding + [described],
+                        'data': Binary(raw)}
+    return best
+
+
+def classify(levels):
+    """Decide how to store a column from its distinct values. This gives
+    ('int', None), ('fixed', places) or ('string', None). Numbers are only
+    used if every value is written the way it would be written back.
+    """
+    present = [level for level in levels if level not in ('.', '?')]
+    if not present:
+        return 'string', None
+    if all(INTEGER.match(level) for level in present):
+        return 'int', None
+
+    places = set()
+    for level in present:
+        match = DECIMAL.match(level)
+        if not match:
+            return 'string', None
+        places.add(len(match.group(1)))
+    if len(places) != 1:
+        return 'string', None
+
+    places = places.pop()
+    factor = 10 ** places
+    for level in present:
+        scaled = int(round(float(level) * factor))
+        if abs(scaled) >= FIXED_LIMIT or \
+                '%.*f' % (places, scaled / float(factor)) != level:
+            return 'string', None
+    return 'fixed', places
+
+
+def encode_column(name, column):
+    """Encode a Column as a BinaryCIF column dict.
+    """
+    levels = column.levels.tolist()
+    kind, places = classify(levels)
+    mask_levels = np.array([{'.': 1, '?': 2}.get(level, 0)
+                            for level in levels], dtype=np.int32)
+    mask = mask_levels[column.codes]
+
+    if kind == 'string':
+        lengths = [len(level) for level in levels]
+        offsets = np.append(0, np.cumsum(lengths)).astype(np.int32)
+        encoded_offsets = encode_integers(offsets)
+        encoded_indexes = encode_integers(column.codes)
+        data = {
+            'encoding': [{
+                'kind': 'StringArray',
+                'dataEncoding': encoded_indexes['encoding'],
+                'stringData': ''.join(levels),
+                'offsetEncoding': encoded_offsets['encoding'],
+                'offsets': encoded_offsets['data'],
+            }],
+            'data': encoded_indexes['data'],
+        }
+        return {'name': name, 'data': data, 'mask': None}
+
+    if kind == 'int':
+        numbers = [0 if code else int(level) for level, code in
+                   zip(levels, mask_levels)]
+        values = np.array(numbers, dtype=np.int64)[column.codes]
+        data = encode_integers(values)
+    else:
+        factor = 10 ** places
+        numbers = [0.0 if code else float(level) for level, code in
+                   zip(levels, mask_levels)]
+        values = np.array(numbers, dtype=float)[column.codes]
+        data = encode_integers(np.round(values * factor))
+        data['encoding'].insert(0, {'kind': 'FixedPoint', 'factor': factor,
+                                    'srcType': FLOAT64})
+
+    encoded_mask = None
+    if mask.any():
+        encoded_mask = encode_integers(mask)
+    return {'name': name, 'data': data, 'mask': encoded_mask}
+
+
+def dump(cif, handle):
+    """Write every table of a CIF to a file as BinaryCIF.
+
+    :cif: The CIF to write.
+    :handle: A file open for writing in binary mode.
+    """
+    categories = []
+    for name in cif.table_names():
+        table = cif.table(name)
+        columns = [encode_column(column, table._data[column])
+                   for column in table.columns]
+        categories.append({'name': '_' + name, 'rowCount': len(table),
+                           'columns': columns})
+
+    document = {
+        'version': VERSION,
+        'encoder': ENCODER,
+        'dataBlocks': [{'header': cif.name, 'categories': categories}],
+    }
+    handle.write(pack(document))
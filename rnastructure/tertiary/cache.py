@@ -0,0 +1,250 @@
+"""This module provides an on-disk cache of parsed CIF files. Each file is
+stored as a single binary sidecar which holds every column of every table as
+raw arrays, along with the assembly and entity maps. Loading a cached file
+memory maps the sidecar, so the arrays are only read from disk as they are
+used.
+
+A sidecar is reused as long as the source file has the same modification
+time and size, or failing that the same content hash. Sidecars written by a
+different format version are ignored and replaced. The total size of the
+cache is capped, and the least recently used sidecars are removed once it
+grows beyond the cap.
+"""
+
+from __future__ import with_statement
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+import collections as coll
+
+import numpy as np
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.cif import Table
+from rnastructure.tertiary.cif import Column
+
+FORMAT_VERSION = 2
+
+MAGIC = 'RNASTRUCTURE-CIF'
+
+PREFIX = struct.Struct('<%dsII' % len(MAGIC))
+
+ALIGNMENT = 8
+
+SUFFIX = '.rscif'
+
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+
+class StaleCacheEntry(Exception):
+
+    """This is raised when a sidecar cannot be used, either because it was
+    written by a different version of this module or because the source file
+    has changed.
+    """
+    pass
+
+
+def content_hash(path):
+    """Compute the sha1 of a file's contents.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as raw:
+        for chunk in iter(lambda: raw.read(1 << 20), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def as_str(value):
+    """Convert the unicode strings produced by json back into str.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [as_str(v) for v in value]
+    if isinstance(value, dict):
+        return dict((as_str(k), as_str(v)) for k, v in value.iteritems())
+    return value
+
+
+def padding(size):
+    return (ALIGNMENT - size % ALIGNMENT) % ALIGNMENT
+
+
+class Cache(object):
+
+    """A directory of cached CIF files.
+
+    :directory: The directory to store sidecars in, created if needed.
+    :max_size: The maximum total size in bytes of all sidecars.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def entry(self, path):
+        """Get the filename of the sidecar for a source file.
+        """
+        key = hashlib.sha1(os.path.abspath(path)).hexdigest()
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def load(self, path):
+        """Load a cached CIF for the given source file. This returns None if
+        there is no usable sidecar.
+        """
+        filename = self.entry(path)
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            cif, sha1 = self.__read__(filename, path)
+        except (StaleCacheEntry, ValueError, EnvironmentError):
+            self.remove(filename)
+            return None
+
+        if sha1 is not None:
+            self.store(path, cif, sha1=sha1)
+        else:
+            os.utime(filename, None)
+        return cif
+
+    def store(self, path, cif, sha1=None):
+        """Write a sidecar for a parsed CIF. All tables in the CIF are parsed
+        and written.
+
+        :path: The source file the CIF was read from.
+        :cif: The CIF to store.
+        :sha1: The content hash of the source file, computed if not given.
+        """
+        stat = os.stat(path)
+        if sha1 is None:
+            sha1 = content_hash(path)
+        header = {
+            'name': cif.name,
+            'source': {
+                'path': os.path.abspath(path),
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'sha1': sha1,
+            },
+            'assemblies': cif._assemblies,
+            'entities': cif._entities,
+            'tables': [],
+        }
+
+        arrays = []
+        offset = 0
+        for name in cif.table_names():
+            table = cif.table(name)
+            columns = []
+            for column in table.columns:
+                data = table._data[column]
+                described = [column]
+                for array in (data.codes, data.levels):
+                    array = np.ascontiguousarray(array)
+                    described.append([array.dtype.str, len(array), offset])
+                    arrays.append((offset, array))
+                    offset += array.nbytes + padding(array.nbytes)
+                columns.append(described)
+            header['tables'].append([name, columns])
+
+        encoded = json.dumps(header)
+        filename = self.entry(path)
+        handle, temp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as out:
+            out.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            out.write(encoded)
+            out.write('\0' * padding(PREFIX.size + len(encoded)))
+            for _, array in arrays:
+                out.write(array.tostring())
+                out.write('\0' * padding(array.nbytes))
+        os.rename(temp, filename)
+        self.evict(keep=filename)
+        return filename
+
+    def remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def entries(self):
+        """Get a list of (last used, size, filename) for all sidecars.
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            filename = os.path.join(self.directory, name)
+            stat = os.stat(filename)
+            found.append((stat.st_mtime, stat.st_size, filename))
+        return found
+
+    def evict(self, keep=None):
+        """Remove the least recently used sidecars until the cache is no
+        larger than max_size.
+
+        :keep: A sidecar which should not be removed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_size:
+                break
+            if filename == keep:
+                continue
+            self.remove(filename)
+            total -= size
+
+    def __read__(self, filename, path):
+        with open(filename, 'rb') as raw:
+            data = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, length = PREFIX.unpack(data[:PREFIX.size])
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise StaleCacheEntry("Sidecar has format version %s" % version)
+
+        header = as_str(json.loads(data[PREFIX.size:PREFIX.size + length]))
+        current = self.__validate__(header['source'], path)
+
+        start = PREFIX.size + length
+        start += padding(start)
+
+        def array(description):
+            dtype, count, offset = description
+            return np.frombuffer(data, dtype=np.dtype(dtype), count=count,
+                                 offset=start + offset)
+
+        tables = coll.OrderedDict()
+        for name, columns in header['tables']:
+            built = dict((column, Column(array(codes), array(levels)))
+                         for column, codes, levels in columns)
+            tables[name] = Table(None, name, [c[0] for c in columns], built)
+
+        assemblies = coll.defaultdict(list, header['assemblies'])
+        cif = CIF.from_tables(header['name'], tables, assemblies=assemblies,
+                              entities=header['entities'])
+        if current:
+            return cif, None
+        return cif, header['source']['sha1']
+
+    def __validate__(self, source, path):
+        """Check that a sidecar is for the current contents of its source.
+        This returns True if the modification time and size match, and False
+        if only the content hash does, in which case the sidecar should be
+        stored again so the next load does not hash the file.
+        """
+        stat = os.stat(path)
+        if stat.st_mtime == source['mtime'] and \
+                stat.st_size == source['size']:
+            return True
+        if content_hash(path) == source['sha1']:
+            return False
+        raise StaleCacheEntry("Source file %s has changed" % path)
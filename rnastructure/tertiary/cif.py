@@ -1,19 +1,83 @@
-""" This package contains a simple wrapper around the PDBx tools provided by
-PDB.  It is intended to provide a simple and pythonic way to interface with
-mmCIF data.
+""" This package contains a simple wrapper around the mmCIF reader in
+rnastructure.tertiary.reader. It is intended to provide a simple and pythonic
+way to interface with mmCIF data.
 """
 
+import os
 import re
-import functools as func
+import bisect
 import collections as coll
 import itertools as it
 
-from pdbx.reader.PdbxParser import PdbxReader as Reader
+import numpy as np
 
+from rnastructure.tertiary.reader import Block
+from rnastructure.tertiary.reader import Reader
+from rnastructure.tertiary.reader import open_file
+from rnastructure.tertiary.reader import is_compressed
+from rnastructure.tertiary.profile import profiler
+from rnastructure.tertiary.spatial import Grid
 from rnastructure.util.unit_ids import UnitIdGenerator
 
 UIDGenerator = UnitIdGenerator()
 
+MISSING = set(['?', '.'])
+
+COORDINATES = ('Cartn_x', 'Cartn_y', 'Cartn_z')
+
+BREAK_METHODS = ('unobs', 'geometry', 'both')
+
+LINK_ATOMS = {
+    'out': ("O3'", 'C'),
+    'in': ('P', 'N'),
+}
+
+DEFAULT_BREAK_CUTOFF = 2.0
+
+POLYMER_TYPES = ('polymer',)
+
+WATER_TYPES = ('water',)
+
+LIGAND_TYPES = ('non-polymer', 'branched', 'macrolide')
+
+HIGHEST_OCCUPANCY = 'highest_occupancy'
+
+INDEX_LIMIT = 2 ** 62
+
+REQUIRED_COLUMNS = {
+    'atom_site': ('label_atom_id', 'label_alt_id', 'label_comp_id',
+                  'label_asym_id', 'label_entity_id', 'pdbx_PDB_ins_code',
+                  'Cartn_x', 'Cartn_y', 'Cartn_z', 'auth_seq_id',
+                  'auth_comp_id', 'auth_asym_id', 'auth_atom_id',
+                  'pdbx_PDB_model_num'),
+    'entity': ('id', 'type'),
+    'pdbx_struct_assembly_gen': ('assembly_id', 'oper_expression',
+                                 'asym_id_list'),
+    'pdbx_struct_oper_list': ('id', 'name') + tuple(
+        'matrix[%d][%d]' % (i, j) for i in (1, 2, 3) for j in (1, 2, 3)) +
+    tuple('vector[%d]' % i for i in (1, 2, 3)),
+    'pdbx_poly_seq_scheme': ('asym_id', 'entity_id', 'seq_id', 'mon_id',
+                             'pdb_ins_code', 'auth_seq_num', 'auth_mon_id'),
+    'pdbx_unobs_or_zero_occ_residues': ('auth_asym_id', 'PDB_model_num',
+                                        'polymer_flag', 'auth_seq_id',
+                                        'PDB_ins_code'),
+}
+
+RESIDUE_FIELDS = (
+    ('pdb', None),
+    ('model', 'pdbx_PDB_model_num'),
+    ('chain', 'auth_asym_id'),
+    ('number', 'auth_seq_id'),
+    ('insertion_code', 'pdbx_PDB_ins_code'),
+    ('symmetry_operator', None),
+    ('residue', 'auth_comp_id'),
+)
+
+RESIDUE_COLUMNS = dict(RESIDUE_FIELDS)
+
+RESIDUE_ID_COLUMNS = ('pdbx_PDB_model_num', 'auth_asym_id', 'auth_comp_id',
+                      'auth_seq_id')
+
 
 class MissingBlockException(Exception):
 
@@ -42,13 +106,208 @@ class UnusableUnobservedTable(Exception):
     pass
 
 
-def atom_sorter(atom):
-    return (atom['label_asym_id'], int(atom['pdbx_PDB_model_num']),
-            atom['auth_asym_id'], int(atom['auth_seq_id']))
+def operator_names(expression):
+    """Parse the oper_expression of pdbx_struct_assembly_gen into a list of
+    operator ids. This handles single ids as well as lists and ranges, like
+    '(1-5,7)'. Products of operators, like '(1-60)(61-88)', are not handled
+    and raise a ComplexOperatorException.
+    """
+    expression = expression.strip()
+    if expression.startswith('(') and expression.endswith(')'):
+        expression = expression[1:-1]
+    if '(' in expression or ')' in expression:
+        raise ComplexOperatorException(expression)
+
+    names = []
+    for part in expression.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            try:
+                names.extend(str(n) for n in xrange(int(first), int(last) + 1))
+            except ValueError:
+                raise ComplexOperatorException(expression)
+        else:
+            names.append(part)
+    return names
+
+
+def unit_id_tail(atom_name, alt_id, insertion_code, symmetry_operator):
+    """Build the optional end of a unit id, in the same way as
+    UnitIdGenerator does for short ids. This is an empty string for most
+    residues.
+    """
+    if insertion_code is not None:
+        insertion_code = insertion_code.strip()
+        if insertion_code == '?' or not insertion_code:
+            insertion_code = None
+    if alt_id in MISSING:
+        alt_id = None
+    if symmetry_operator == '1_555':
+        symmetry_operator = None
+
+    tail = [atom_name, alt_id, insertion_code, symmetry_operator]
+    while tail and tail[-1] is None:
+        tail.pop()
+    if not tail:
+        return ''
+    return '|' + '|'.join(t or '' for t in tail)
+
+
+def polymer_breaks(numbers, codes, endpoints):
+    """Find where a chain is split by its unobserved residues. This walks the
+    residues and the endpoints together, so it is a single pass over both.
+
+    :numbers: The number of each residue in the chain, in order.
+    :codes: The insertion code of each residue in the chain.
+    :endpoints: A list of (number, insertion code) for each unobserved
+    residue, sorted by number.
+    :returns: A list of the index of the first residue after each endpoint.
+    """
+    breaks = []
+    index = 0
+    count = len(numbers)
+    for number, code in endpoints:
+        while index < count and (numbers[index] < number or
+                                 (numbers[index] == number and
+                                  (code == '?' or codes[index] < code))):
+            index += 1
+        breaks.append(index)
+    return breaks
+
+
+def first_atoms(codes, residues, count, choices):
+    """Find the first atom in each residue with one of the given names.
+
+    :codes: The code of the name of each atom.
+    :residues: The residue index of each atom.
+    :count: The number of residues.
+    :choices: The codes of the names to look for, in order of preference.
+    :returns: An array of the position of the chosen atom in each residue, or
+    -1 if the residue has none of them.
+    """
+    positions = np.repeat(-1, count)
+    for code in reversed(choices):
+        found = np.flatnonzero(codes == code)[::-1]
+        chosen = np.repeat(-1, count)
+        chosen[residues[found]] = found
+        positions = np.where(chosen >= 0, chosen, positions)
+    return positions
+
+
+def linkage_breaks(codes, residues, coordinates, count, outgoing, incoming,
+                   cutoff=DEFAULT_BREAK_CUTOFF):
+    """Find the residues which are not covalently linked to the residue before
+    them. Two residues are linked when the outgoing atom of the first, like
+    O3', is within cutoff of the incoming atom of the second, like P. This is
+    computed for all residues at once.
+
+    :codes: The code of the name of each atom.
+    :residues: The residue index of each atom.
+    :coordinates: An N x 3 array of the atom coordinates.
+    :count: The number of residues.
+    :outgoing: The codes of the possible outgoing atoms.
+    :incoming: The codes of the possible incoming atoms.
+    :cutoff: The largest distance for a link.
+    :returns: An array of the index of each residue which starts a new piece.
+    """
+    if count < 2:
+        return np.zeros(0, dtype=int)
+
+    tails = first_atoms(codes, residues, count, outgoing)[:-1]
+    heads = first_atoms(codes, residues, count, incoming)[1:]
+    missing = (tails < 0) | (heads < 0)
+    deltas = coordinates[tails] - coordinates[heads]
+    distances = np.sqrt(np.einsum('ij,ij->i', deltas, deltas))
+    return np.flatnonzero(missing | (distances > cutoff)) + 1
+
+
+def is_binary(path):
+    """Check if a path names a BinaryCIF file, which may be compressed.
+    """
+    if is_compressed(path):
+        path = os.path.splitext(path)[0]
+    return path.endswith('.bcif')
+
+
+def selected_columns(columns, name):
+    """Get the columns to keep for a table, or None to keep them all. The
+    columns used by this module are always kept.
+
+    :columns: A dict of table name to the columns requested for it.
+    :name: The name of the table.
+    """
+    if name not in columns:
+        return None
+    return list(columns[name]) + list(REQUIRED_COLUMNS.get(name, []))
+
+
+def operator_transform(operator):
+    """Get the rotation matrix and translation vector of a symmetry operator.
+
+    :operator: A row of pdbx_struct_oper_list.
+    """
+    axes = (1, 2, 3)
+    rotation = np.array([[float(operator['matrix[%d][%d]' % (i, j)])
+                          for j in axes] for i in axes])
+    translation = np.array([float(operator['vector[%d]' % i]) for i in axes])
+    return rotation, translation
+
+
+class EntityMemo(object):
+
+    """Values derived once per entity and shared by every chain of that
+    entity. Large assemblies often have many copies of one entity, and only
+    the labels differ between them. The number of hits and misses of each
+    kind of value is counted.
+    """
 
+    def __init__(self):
+        self._values = {}
+        self._hits = coll.defaultdict(int)
+        self._misses = coll.defaultdict(int)
 
-def filter_using(iterable, key, target):
-    return it.ifilter(lambda o: o[key] == target, iterable)
+    def get(self, kind, entity_id, compute):
+        """Get a value for an entity, computing it if it is not known.
+
+        :kind: The kind of value, like 'sequence'.
+        :entity_id: The entity the value is for.
+        :compute: A function of no arguments which computes the value.
+        """
+        key = (kind, entity_id)
+        if key in self._values:
+            self._hits[kind] += 1
+        else:
+            self._misses[kind] += 1
+            self._values[key] = compute()
+        return self._values[key]
+
+    def report(self):
+        """Get a dict from each kind of value to a dict of its hits and
+        misses. Each miss is one entity the value was computed for.
+        """
+        report = {}
+        for kind in set(self._hits.keys() + self._misses.keys()):
+            report[kind] = {'hits': self._hits[kind],
+                            'misses': self._misses[kind]}
+        return report
+
+
+class SequenceTemplate(object):
+
+    """The experimental sequence of an entity from pdbx_poly_seq_scheme,
+    which is the same for every chain of the entity.
+    """
+
+    __slots__ = ('mon_ids', 'suffixes', 'unique')
+
+    def __init__(self, mon_ids, seq_ids):
+        self.mon_ids = mon_ids
+        self.suffixes = ['%s|%s' % pair for pair in it.izip(mon_ids, seq_ids)]
+        self.unique = len(set(self.suffixes)) == len(self.suffixes)
+
+    def __len__(self):
+        return len(self.mon_ids)
 
 
 class CIF(object):
@@ -56,29 +315,175 @@ class CIF(object):
     """Top level container for all CIF related data. This assumes that each
     mmCIF file contains a single datablock. This doesn't have to be true but
     makes things easier.
+
+    By default only the position of each category in the file is found when
+    the CIF is created. A category is parsed the first time it is requested
+    and the resulting Table is cached, so the cost of loading depends on the
+    categories which are used.
+
+    If stream is True the file is instead read and parsed a chunk at a time,
+    which works for any file object, including compressed ones. All
+    categories are parsed up front, with columns and where applied as they
+    are read, and each is built into a Table as soon as it is finished so
+    the parsed values are not kept.
+
+    If profile is True, or a rnastructure.tertiary.profile.Profile, the time
+    and memory used by each stage of loading and using the CIF is recorded
+    in self.profile.
     """
 
-    def __init__(self, handle):
-        reader = Reader(handle)
-        self.data = []
-        reader.read(self.data)
-        self.data = self.data[0]
-        self.name = self.data.getName()
-        self._assemblies = self.__load_assemblies__()
-        self._entities = self.__load_entities__()
+    def __init__(self, handle, lazy=True, columns=None, where=None,
+                 stream=False, profile=False):
+        profile = profiler(profile)
+        tables = None
+        with profile.stage('read'):
+            reader = Reader(handle, stream=stream)
+            if stream:
+                data, tables = self.__stream__(reader, columns, where,
+                                               profile)
+            else:
+                data = reader.read(lazy=lazy)[0]
+        self.__setup__(data, tables=tables, columns=columns, where=where,
+                       profile=profile)
+
+    def __stream__(self, reader, columns, where, profile):
+        """Build the Table of each category in the first data block of a
+        streamed file as soon as the category has been parsed. Only one parsed
+        category is held at a time, and the returned Block holds none.
+
+        :returns: The Block and an OrderedDict of the tables.
+        """
+        attributes = None
+        if columns:
+            attributes = dict((name, selected_columns(columns, name))
+                              for name in columns)
+
+        name = None
+        tables = coll.OrderedDict()
+        for block_name, category, _ in reader.stream(attributes=attributes,
+                                                     predicates=where):
+            if name is None:
+                name = block_name
+            if block_name != name:
+                break
+            with profile.stage('tables'):
+                tables[category.name] = Table.build(self, category)
+
+        if name is None:
+            raise MissingBlockException("No data blocks in file")
+        return Block(name), tables
+
+    def __setup__(self, data, tables=None, assemblies=None, entities=None,
+                  columns=None, where=None, profile=False):
+        self.data = data
+        self.name = self.data.name
+        self.profile = profiler(profile)
+        self._tables = tables or {}
+        self._names = list(self.data.order)
+        known = set(self._names)
+        self._names.extend(name for name in self._tables if name not in known)
+        self._columns = columns or {}
+        self._where = where or {}
+        self._hierarchies = {}
+        self._order = None
+        self._masks = {}
+        self.entity_memo = EntityMemo()
+        self._assemblies = assemblies
+        if self._assemblies is None:
+            with self.profile.stage('assemblies'):
+                self._assemblies = self.__load_assemblies__()
+        self._entities = entities
+        if self._entities is None:
+            with self.profile.stage('entities'):
+                self._entities = self.__load_entities__()
+
+    @classmethod
+    def from_tables(cls, name, tables, assemblies=None, entities=None,
+                    profile=False):
+        """Create a CIF from tables which have already been built, for example
+        ones loaded from a cache.
+
+        :name: The name of the data block.
+        :tables: A dict of table name to Table. If this is ordered, like an
+        OrderedDict, the order is kept as the order of table_names.
+        :assemblies: The assembly map, computed from the tables if not given.
+        :entities: The entity map, computed from the tables if not given.
+        :profile: True or a Profile to record the time and memory used.
+        """
+        cif = cls.__new__(cls)
+        for table in tables.itervalues():
+            table._cif = cif
+        cif.__setup__(Block(name), tables=tables, assemblies=assemblies,
+                      entities=entities, profile=profile)
+        return cif
+
+    @classmethod
+    def from_path(cls, path, cache_dir=None, profile=False, **kwargs):
+        """Load a CIF from a filename. If a cache directory is given then the
+        parsed file is stored there and later loads will use the stored copy,
+        as long as the file has not changed. Files ending in .gz, .bz2 or .xz
+        are decompressed as they are parsed. BinaryCIF files, ending in .bcif,
+        are decoded with rnastructure.tertiary.bcif and are never cached,
+        since they load about as quickly as a cached file.
+
+        :path: The file to load.
+        :cache_dir: A directory to cache parsed files in.
+        :profile: True or a Profile to record the time and memory used. Loading
+        from the cache or a BinaryCIF file is recorded as the read stage.
+        :kwargs: Keyword arguments for rnastructure.tertiary.cache.Cache.
+        """
+        profile = profiler(profile)
+        if cache_dir is None or is_binary(path):
+            return cls.__open_path__(path, profile)
+
+        from rnastructure.tertiary.cache import Cache
+        cache = Cache(cache_dir, **kwargs)
+        with profile.stage('read'):
+            cif = cache.load(path)
+        if cif is None:
+            cif = cls.__open_path__(path, profile)
+            cache.store(path, cif)
+        cif.profile = profile
+        return cif
+
+    @classmethod
+    def __open_path__(cls, path, profile):
+        raw = open_file(path)
+        try:
+            if is_binary(path):
+                from rnastructure.tertiary.bcif import load
+                with profile.stage('read'):
+                    cif = load(raw)
+                cif.profile = profile
+                return cif
+            return cls(raw, stream=is_compressed(path), profile=profile)
+        finally:
+            raw.close()
 
     def __load_assemblies__(self):
-        operators = dict((op['id'], op) for op in self.pdbx_struct_oper_list)
         assemblies = coll.defaultdict(list)
-        for assembly in self.pdbx_struct_assembly_gen:
-            operator = assembly['oper_expression']
-            if operator not in operators:
-                raise ComplexOperatorException()
-            for asym_ids in assembly['asym_id_list'].split(','):
-                for asym_id in asym_ids:
-                    assemblies[asym_id].append(operators[operator])
+        for _, operators, asym_ids in self.__generators__():
+            for asym_id in asym_ids:
+                for operator in operators:
+                    if operator not in assemblies[asym_id]:
+                        assemblies[asym_id].append(operator)
         return assemblies
 
+    def __generators__(self):
+        """Get a list of (assembly id, operators, asym ids) for each row of
+        pdbx_struct_assembly_gen.
+        """
+        operators = dict((op['id'], op) for op in self.pdbx_struct_oper_list)
+        generators = []
+        for assembly in self.pdbx_struct_assembly_gen:
+            names = operator_names(assembly['oper_expression'])
+            if any(name not in operators for name in names):
+                raise ComplexOperatorException(assembly['oper_expression'])
+            asym_ids = [a.strip() for a in assembly['asym_id_list'].split(',')]
+            generators.append((assembly['assembly_id'],
+                               [operators[name] for name in names], asym_ids))
+        return generators
+
     def __load_entities__(self):
         entities = {}
         for entity in self.entity:
@@ -86,29 +491,277 @@ class CIF(object):
         return entities
 
     def symmetry_operators(self, **kwargs):
-        atoms = sorted(self.atom_site.rows, key=atom_sorter)
         for operator in self.pdbx_struct_oper_list:
-            fn = lambda a: operator in self.operators(a['label_asym_id'])
-            yield Symmetry(self, operator, it.ifilter(fn, atoms), **kwargs)
+            hierarchy = self.hierarchy(operator, **kwargs)
+            yield Symmetry(self, operator, hierarchy)
 
     def symmetry_operator(self, name, **kwargs):
-        operator = None
-        for row in self.pdbx_struct_oper_list:
-            if row['name'] == name:
-                operator = row
-                break
-
-        if not operator:
+        operators = self.pdbx_struct_oper_list.where(name=name)
+        if not operators:
             return None
+        operator = operators[0]
 
-        atoms = sorted(self.atom_site.rows, key=atom_sorter)
-        fn = lambda a: operator in self.operators(a['label_asym_id'])
-        op = Symmetry(self, operator, it.ifilter(fn, atoms), **kwargs)
+        op = Symmetry(self, operator, self.hierarchy(operator, **kwargs))
 
         if not op:
             return None
         return op
 
+    def hierarchy(self, operator, nonpolymers=False, asym_ids=None,
+                  entity_types=None):
+        """Get the Hierarchy of all atoms which the given operator applies to.
+        This is built once per operator and cached. The atoms are taken from
+        the sorted order of all atoms, so they are not sorted again.
+
+        :operator: The row of pdbx_struct_oper_list for the operator.
+        :nonpolymers: True to include atoms which are not part of a polymer.
+        :asym_ids: If given only atoms in these asyms are included.
+        :entity_types: If given only atoms of entities with these values of
+        entity.type are included, this overrides nonpolymers.
+        """
+        if asym_ids is not None:
+            asym_ids = frozenset(asym_ids)
+        entity_types = self.__entity_types__(nonpolymers, entity_types)
+        key = (operator['id'], entity_types, asym_ids)
+        if key not in self._hierarchies:
+            self._hierarchies[key] = self.__hierarchy__(operator, entity_types,
+                                                        asym_ids)
+        return self._hierarchies[key]
+
+    def __hierarchy__(self, operator, entity_types, asym_ids):
+        """Build a new Hierarchy of the atoms an operator applies to, without
+        caching it.
+        """
+        order = self.__atom_order__()
+        mask = self.__atom_mask__(operator, entity_types, asym_ids)
+        return Hierarchy(self.atom_site, order[mask[order]], operator=operator,
+                         asym_ids=asym_ids, profile=self.profile)
+
+    def __entity_types__(self, nonpolymers, entity_types):
+        """Get the entity types a hierarchy is restricted to, or None for
+        all atoms.
+        """
+        if entity_types is not None:
+            return frozenset(entity_types)
+        if nonpolymers:
+            return None
+        return frozenset(POLYMER_TYPES)
+
+    def __atom_order__(self):
+        """Get the rows of atom_site sorted by model, chain and residue. This
+        is computed once and shared by every operator and model, since the
+        atoms of each are a subset of this order.
+        """
+        if self._order is None:
+            with self.profile.stage('sort'):
+                self._order = atom_order(self.atom_site)
+        return self._order
+
+    def __atom_mask__(self, operator, entity_types, asym_ids):
+        """Get a boolean array which is True for each row of atom_site that an
+        operator applies to.
+        """
+        asyms = self.atom_site._data['label_asym_id']
+        if asym_ids is None:
+            mask = [operator in self.operators(a) for a in asyms.levels]
+        else:
+            mask = [a in asym_ids for a in asyms.levels]
+        mask = np.array(mask, dtype=bool)[asyms.codes]
+
+        if entity_types is not None:
+            mask &= self.entity_mask(types=entity_types)
+        return mask
+
+    def entity_mask(self, types=None, polymer_types=None):
+        """Get a boolean array which is True for each row of atom_site whose
+        entity has one of the given types. The type of each distinct entity id
+        is looked up once and spread over the atoms, and the mask is cached.
+
+        :types: The values of entity.type to select, like 'polymer',
+        'non-polymer' or 'water'. All types are selected if not given.
+        :polymer_types: The values of entity_poly.type to select, like
+        'polyribonucleotide'. If given only polymers of these types are
+        selected.
+        """
+        if types is not None:
+            types = frozenset(types)
+        if polymer_types is not None:
+            polymer_types = frozenset(polymer_types)
+
+        key = (types, polymer_types)
+        if key not in self._masks:
+            entities = self.atom_site._data['label_entity_id']
+            selected = []
+            for entity_id in entities.levels:
+                entity = self._entities.get(entity_id, {})
+                keep = types is None or entity.get('type') in types
+                if polymer_types is not None:
+                    keep = keep and \
+                        self.polymer_type(entity_id) in polymer_types
+                selected.append(keep)
+            self._masks[key] = np.array(selected, dtype=bool)[entities.codes]
+        return self._masks[key]
+
+    def polymer_type(self, entity_id):
+        """Get the type of a polymer entity from entity_poly, like
+        'polyribonucleotide' or 'polypeptide(L)'. This is None for entities
+        which are not polymers.
+        """
+        try:
+            rows = self.table('entity_poly').where(entity_id=entity_id)
+        except (MissingBlockException, MissingColumn):
+            return None
+        if not rows:
+            return None
+        return rows[0].get('type')
+
+    def model_iterator(self, operator=None, nonpolymers=False,
+                       entity_types=None):
+        """Iterate over models one at a time, without building the hierarchy
+        of the whole structure. Each model is a run of the sorted order of all
+        atoms, and only that run is indexed. Only the order is cached, so the
+        atoms and coordinates of a model are released once it is no longer
+        used. This is meant for large ensembles, like NMR structures, where
+        only one model is needed at a time.
+
+        :operator: The name of a symmetry operator to use, if not given all
+        operators are used in turn.
+        :nonpolymers: True to include atoms which are not part of a polymer.
+        :entity_types: If given only atoms of entities with these values of
+        entity.type are included, this overrides nonpolymers.
+        """
+        operators = self.pdbx_struct_oper_list.rows
+        if operator is not None:
+            operators = self.pdbx_struct_oper_list.where(name=operator)
+
+        table = self.atom_site
+        order = self.__atom_order__()
+        entity_types = self.__entity_types__(nonpolymers, entity_types)
+        for op in operators:
+            mask = self.__atom_mask__(op, entity_types, None)
+            rows = order[mask[order]]
+            numbers = table._data['pdbx_PDB_model_num'].numeric(
+                dtype=int, missing=0, rows=rows)
+            bounds = np.flatnonzero(boundaries(numbers)).tolist()
+            bounds.append(len(rows))
+            for start, stop in it.izip(bounds[:-1], bounds[1:]):
+                hierarchy = Hierarchy(table, rows[start:stop], operator=op,
+                                      profile=self.profile)
+                symmetry = Symmetry(self, op, hierarchy)
+                number = hierarchy.value('pdbx_PDB_model_num', 0)
+                yield Model(self, number, symmetry, hierarchy, 0,
+                            len(hierarchy))
+
+    def assemblies(self):
+        """Get a list of the ids of all biological assemblies.
+        """
+        ids = []
+        for assembly_id, _, _ in self.__generators__():
+            if assembly_id not in ids:
+                ids.append(assembly_id)
+        return ids
+
+    def assembly(self, assembly_id, nonpolymers=False, entity_types=None):
+        """Iterate over the parts of a biological assembly. This yields one
+        Symmetry for each operator used to build the assembly, containing only
+        the asyms that operator is applied to. This is lazy, the atoms and
+        coordinates for an operator are only computed when it is reached, and
+        they are not cached so each part is freed once it is no longer used.
+
+        :assembly_id: The id of the assembly to build.
+        :nonpolymers: True to include atoms which are not part of a polymer.
+        :entity_types: If given only atoms of entities with these values of
+        entity.type are included, this overrides nonpolymers.
+        """
+        entity_types = self.__entity_types__(nonpolymers, entity_types)
+        for current, operators, asym_ids in self.__generators__():
+            if current != str(assembly_id):
+                continue
+            asym_ids = frozenset(asym_ids)
+            for operator in operators:
+                hierarchy = self.__hierarchy__(operator, entity_types,
+                                               asym_ids)
+                yield Symmetry(self, operator, hierarchy)
+
+    def unit_ids(self, level='residue', **kwargs):
+        """Get the unit ids of every residue or atom in all symmetry
+        operators. The ids are built directly from the columns of atom_site,
+        one operator at a time.
+
+        :level: Either 'residue' or 'atom'.
+        :kwargs: Keyword arguments for hierarchy.
+        """
+        ids = []
+        for symmetry in self.symmetry_operators(**kwargs):
+            ids.extend(symmetry.unit_ids(level=level))
+        return ids
+
+    def unit_id_ranges(self, level='residue', **kwargs):
+        """Get a dict from each unit id to the (operator name, start, stop)
+        of its atoms. The start and stop are positions in the sorted atoms of
+        the hierarchy for that operator.
+
+        :level: Either 'residue' or 'atom'.
+        :kwargs: Keyword arguments for hierarchy.
+        """
+        ranges = {}
+        for symmetry in self.symmetry_operators(**kwargs):
+            name = symmetry['symmetry_operator']
+            for unit_id, (start, stop) in \
+                    symmetry.unit_id_ranges(level=level).iteritems():
+                ranges[unit_id] = (name, start, stop)
+        return ranges
+
+    def sequence_scheme(self, asym_id):
+        """Get the rows of pdbx_poly_seq_scheme for one asym, in the order
+        they appear in the file. This uses the index of the table by asym_id,
+        which is built the first time it is needed.
+
+        :asym_id: The asym to get the sequence of.
+        """
+        return self.pdbx_poly_seq_scheme.where(asym_id=asym_id)
+
+    def sequence_template(self, asym_id):
+        """Get the SequenceTemplate of an asym and the rows of
+        pdbx_poly_seq_scheme for it, as an array. The template is computed
+        once per entity and shared by all asyms of that entity.
+
+        :asym_id: The asym to get the sequence of.
+        """
+        table = self.pdbx_poly_seq_scheme
+        rows = table.group_by('asym_id').get(asym_id, np.arange(0))
+        data = table._data
+
+        def compute():
+            return SequenceTemplate(
+                data['mon_id'].levels[data['mon_id'].codes[rows]].tolist(),
+                data['seq_id'].levels[data['seq_id'].codes[rows]].tolist())
+
+        if not len(rows) or 'entity_id' not in table.columns:
+            return compute(), rows
+
+        entity_id = data['entity_id'][int(rows[0])]
+        template = self.entity_memo.get('sequence', entity_id, compute)
+        if len(template) != len(rows):
+            template = compute()
+        return template, rows
+
+    def sequence_mappings(self, **kwargs):
+        """Get the experimental sequence mapping of every chain. This uses the
+        grouped pdbx_poly_seq_scheme, so the table is only scanned once.
+
+        :kwargs: Keyword arguments for symmetry_operators.
+        :returns: A list of (chain, mapping) for each chain, where mapping is
+        as from Chain.experimental_sequence_mapping.
+        """
+        mappings = []
+        for symmetry in self.symmetry_operators(**kwargs):
+            for model in symmetry.models():
+                for chain in model.chains():
+                    mapping = chain.experimental_sequence_mapping()
+                    mappings.append((chain, mapping))
+        return mappings
+
     def models(self):
         for op in self.symmetry_operators():
             for model in op.models():
@@ -137,7 +790,19 @@ class CIF(object):
                 yield polymer
 
     def table(self, name):
-        return Table(self, self.__block__(name))
+        block_name = re.sub('^_', '', name)
+        if block_name not in self._tables:
+            with self.profile.stage('parse'):
+                block = self.__block__(name)
+            with self.profile.stage('tables'):
+                self._tables[block_name] = Table.build(self, block)
+        return self._tables[block_name]
+
+    def table_names(self):
+        """Get the names of every table in this CIF, in the order they appear
+        in the file. This includes tables which have not been parsed yet.
+        """
+        return list(self._names)
 
     def operators(self, asym_id):
         return self._assemblies[asym_id]
@@ -151,47 +816,219 @@ class CIF(object):
     def is_polymeric_atom(self, atom):
         return self.is_polymeric(atom['label_entity_id'])
 
+    def __columns__(self, name):
+        """Get the columns to keep for a table, or None to keep them all. The
+        columns used by this module are always kept.
+        """
+        return selected_columns(self._columns, name)
+
     def __block__(self, name):
         block_name = re.sub('^_', '', name)
-        block = self.data.getObj(block_name)
-        if not block:
+        block = self.data.category(block_name,
+                                   attributes=self.__columns__(block_name),
+                                   predicate=self._where.get(block_name))
+        if block is None:
             raise MissingBlockException("Unknown block " + name)
         return block
 
     def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
         try:
             return self.table(name)
         except MissingBlockException:
             raise AttributeError("Unknown block " + name)
 
 
+class Column(object):
+
+    """A single column of a table. Rather than keeping one string per row we
+    store an array of integer codes into an array of the distinct values. Most
+    columns in a CIF file, like residue names or chain ids, only have a few
+    distinct values so this is much more compact than a list of strings.
+    """
+
+    def __init__(self, codes, levels):
+        self.codes = codes
+        self.levels = levels
+        self._numeric = {}
+        self._numeric_levels = {}
+
+    @classmethod
+    def build(cls, values):
+        """Create a column from a sequence of strings.
+
+        :values: The values of the column, in row order.
+        """
+        lookup = {}
+        codes = np.fromiter((lookup.setdefault(value, len(lookup))
+                             for value in values), dtype=np.int32)
+        levels = [None] * len(lookup)
+        for value, code in lookup.iteritems():
+            levels[code] = value
+        return cls(codes, np.array(levels, dtype=str))
+
+    def values(self):
+        """Get an array of the values of this column.
+        """
+        return self.levels[self.codes]
+
+    def set_numeric(self, levels, dtype=float, missing=np.nan):
+        """Record the numeric value of each distinct value, for columns which
+        were read as numbers, so they do not need to be parsed again.
+
+        :levels: An array of the number for each level.
+        :dtype: The type this is used for.
+        :missing: The value used for missing entries.
+        """
+        key = (np.dtype(dtype).str, repr(missing))
+        self._numeric_levels[key] = np.asarray(levels, dtype=dtype)
+
+    def numeric(self, dtype=float, missing=np.nan, rows=None):
+        """Get the values of this column as a numeric array. The conversion is
+        only done once per distinct value and is cached.
+
+        :dtype: The type of array to produce.
+        :missing: The value to use for missing entries, '?' and '.'.
+        :rows: If given, only the values of these rows are produced. The
+        result is not cached, so no array the size of the column is kept.
+        """
+        key = (np.dtype(dtype).str, repr(missing))
+        if key not in self._numeric_levels:
+            convert = float
+            if np.dtype(dtype).kind in 'iu':
+                convert = int
+            levels = [missing if l in MISSING else convert(l)
+                      for l in self.levels]
+            self._numeric_levels[key] = np.array(levels, dtype=dtype)
+
+        levels = self._numeric_levels[key]
+        if rows is not None:
+            if key in self._numeric:
+                return self._numeric[key][rows]
+            return levels[self.codes[rows]]
+        if key not in self._numeric:
+            self._numeric[key] = levels[self.codes]
+        return self._numeric[key]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, np.integer)):
+            return self.levels[self.codes[index]]
+        return Column(self.codes[index], self.levels)
+
+    def __len__(self):
+        return len(self.codes)
+
+
 class Table(object):
 
     """Container for a single table in the data block. This provides some
-    useful methods for accessing the data.
+    useful methods for accessing the data. The data is stored by column and
+    rows are only created when they are requested.
     """
 
-    def __init__(self, cif, block, rows=None):
+    def __init__(self, cif, name, columns, data):
         self._cif = cif
-        self.block = block
-        self.rows = rows
-
-        self.columns = self.block.getItemNameList()
-        self.columns = [re.sub('_.+\.', '', name) for name in self.columns]
+        self.name = name
+        self.columns = columns
+        self._data = data
+        self._rows = None
+        self._indexes = {}
+
+    @classmethod
+    def build(cls, cif, block):
+        """Create a table from a parsed category. Only the columns built from
+        the category are kept, not the category itself.
+
+        :cif: The CIF this table belongs to.
+        :block: The category to build the table from.
+        """
+        columns = list(block.attributes)
+        data = dict((name, Column.build(block.column(index)))
+                    for index, name in enumerate(columns))
+        return cls(cif, block.name, columns, data)
 
-        if self.rows is None:
-            length = self.block.getRowCount()
-            self.rows = [self.__row__(index) for index in xrange(length)]
+    @property
+    def rows(self):
+        """A list of all rows in this table. This is built on first access.
+        """
+        if self._rows is None:
+            self._rows = [self.__row__(index) for index in xrange(len(self))]
+        return self._rows
 
     def column(self, name):
-        """Get a column by name"""
+        """Get a column by name. This returns an array of the values.
+        """
+        if name not in self.columns:
+            raise MissingColumn("Unknown column")
+        return self._data[name].values()
+
+    def numeric(self, name, dtype=float, missing=np.nan):
+        """Get a column by name as a numeric array.
+
+        :name: The column to get.
+        :dtype: The type of array to produce.
+        :missing: The value to use for missing entries, '?' and '.'.
+        """
         if name not in self.columns:
             raise MissingColumn("Unknown column")
+        return self._data[name].numeric(dtype=dtype, missing=missing)
 
-        values = []
-        for row in self.rows:
-            values.append(row[name])
-        return values
+    def group_by(self, *columns):
+        """Group the rows of this table by the values of some columns. The
+        index for each combination of columns is built the first time it is
+        requested and then cached, so later lookups are dictionary hits.
+
+        :columns: The names of the columns to group by.
+        :returns: A dict from the value, or tuple of values if there is more
+        than one column, to an array of the indexes of the rows with that
+        value, in file order.
+        """
+        if not columns:
+            raise ValueError("Must give at least one column")
+
+        if columns not in self._indexes:
+            for name in columns:
+                if name not in self.columns:
+                    raise MissingColumn("Unknown column %s" % name)
+
+            data = [self._data[name] for name in columns]
+            combined = np.zeros(len(self), dtype=np.int64)
+            size = 1
+            for column in data:
+                if size * len(column.levels) >= INDEX_LIMIT:
+                    _, combined = np.unique(combined, return_inverse=True)
+                    size = len(self)
+                combined = combined * len(column.levels) + column.codes
+                size *= len(column.levels)
+
+            index = {}
+            if len(combined):
+                order = np.argsort(combined, kind='mergesort')
+                starts = np.flatnonzero(boundaries(combined[order]))
+                for group in np.split(order, starts[1:]):
+                    key = tuple(str(column[group[0]]) for column in data)
+                    if len(key) == 1:
+                        key = key[0]
+                    index[key] = group
+            self._indexes[columns] = index
+        return self._indexes[columns]
+
+    def where(self, **equalities):
+        """Get the rows where each of the given columns has the given value,
+        for example table.where(auth_asym_id='A', PDB_model_num=1). This uses
+        the cached index from group_by.
+
+        :equalities: The value each column must have, compared as strings.
+        :returns: A list of the matching rows, in file order.
+        """
+        columns = tuple(sorted(equalities))
+        key = tuple(str(equalities[name]) for name in columns)
+        if len(key) == 1:
+            key = key[0]
+        indexes = self.group_by(*columns).get(key, [])
+        return [self[int(index)] for index in indexes]
 
     def size(self):
         """Get a tuple of (rowCount, columnCount).
@@ -204,11 +1041,14 @@ class Table(object):
         to be ordered. The row will be a dict of the form { attribute: value }.
         Each attribute will have the name of the block stripped.
         """
-        return dict(zip(self.columns, self.block.getRow(number)))
+        return dict((name, self._data[name][number]) for name in self.columns)
 
     def __getattr__(self, name):
         """Get the column with the given name.
         """
+        if name.startswith('_'):
+            raise AttributeError(name)
+
         try:
             return self.column(name)
         except MissingColumn:
@@ -221,18 +1061,331 @@ class Table(object):
             except MissingColumn:
                 raise KeyError("Unknown column: %s" % index)
 
-        if isinstance(index, int):
-            return self.rows[index]
+        if isinstance(index, (int, long, np.integer)):
+            if self._rows is not None:
+                return self._rows[index]
+            return self.__row__(index)
 
         if isinstance(index, slice):
-            return Table(self._cif, self.block, rows=self.rows[index])
+            data = dict((n, c[index]) for n, c in self._data.iteritems())
+            return Table(self._cif, self.name, self.columns, data)
 
         raise TypeError("Unknown key type, should be str, int or slice")
 
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
     def __len__(self):
         """Get the number of rows.
         """
-        return len(self.rows)
+        if not self.columns:
+            return 0
+        return len(self._data[self.columns[0]])
+
+
+def boundaries(values):
+    """Find where a sorted array changes value. This gives a boolean array
+    which is True at the first element of each run of equal values.
+    """
+    flags = np.ones(len(values), dtype=bool)
+    flags[1:] = values[1:] != values[:-1]
+    return flags
+
+
+def atom_order(table, rows=None):
+    """Sort the rows of an atom_site table by model, chain, asym and residue
+    number. Model and residue numbers are compared as numbers, and the sort
+    is stable so atoms in a residue stay in file order.
+
+    :table: The atom_site Table.
+    :rows: The rows to sort, all rows if not given.
+    :returns: An array of the rows in sorted order.
+    """
+    if rows is None:
+        rows = np.arange(len(table))
+    data = table._data
+    keys = [data['auth_seq_id'].numeric(dtype=int, missing=0, rows=rows),
+            ranks(data['label_asym_id'], rows=rows),
+            ranks(data['auth_asym_id'], rows=rows),
+            data['pdbx_PDB_model_num'].numeric(dtype=int, missing=0,
+                                               rows=rows)]
+    return rows[np.lexsort(keys)]
+
+
+def choose_altlocs(residues, codes, occupancy, preferred=None):
+    """Choose one alternate location for each residue. The preferred
+    location is used in every residue which has it, otherwise the location
+    with the highest mean occupancy is used, and ties go to the location which
+    comes first in the file.
+
+    :residues: An array of the residue index of each atom with an alternate
+    location.
+    :codes: An array of the code of the alternate location of each atom.
+    :occupancy: An array of the occupancy of each atom.
+    :preferred: The code of the preferred location, if any.
+    :returns: A boolean array which is True for the atoms of the chosen
+    locations.
+    """
+    if not len(codes):
+        return np.zeros(0, dtype=bool)
+
+    size = int(codes.max()) + 1
+    keys = np.asarray(residues, dtype=np.int64) * size + codes
+    groups, inverse = np.unique(keys, return_inverse=True)
+    mean = np.bincount(inverse, weights=occupancy) / np.bincount(inverse)
+    group_residues = groups // size
+    group_codes = groups % size
+    is_preferred = np.zeros(len(groups), dtype=int)
+    if preferred is not None:
+        is_preferred = (group_codes == preferred).astype(int)
+
+    order = np.lexsort((group_codes, -mean, -is_preferred, group_residues))
+    chosen = np.zeros(len(groups), dtype=bool)
+    chosen[order[boundaries(group_residues[order])]] = True
+    return chosen[inverse]
+
+
+def ranks(column, rows=None):
+    """Get an array which gives the rank of each row's value when the distinct
+    values are sorted, this can be used to sort rows by a string column.
+
+    :column: The column to rank.
+    :rows: If given, only the ranks of these rows are produced.
+    """
+    levels = np.empty(len(column.levels), dtype=np.int32)
+    levels[np.argsort(column.levels, kind='mergesort')] = \
+        np.arange(len(levels))
+    if rows is None:
+        return levels[column.codes]
+    return levels[column.codes[rows]]
+
+
+class Hierarchy(object):
+
+    """An index of a set of atoms sorted by model, chain and residue. Each
+    model, chain and residue is a contiguous range of the sorted atoms, so
+    looking one up only needs the start and stop of its range. Containers
+    refer to their atoms by a range of positions in this order. The rows
+    given must already be sorted, as by atom_order.
+    """
+
+    def __init__(self, table, rows, operator=None, asym_ids=None,
+                 profile=False):
+        self.table = table
+        self.operator = operator
+        self.asym_ids = asym_ids
+        self.profile = profiler(profile)
+        self._coordinates = None
+        self._grids = {}
+
+        self.order = rows
+
+        data = table._data
+        with self.profile.stage('group'):
+            models = data['pdbx_PDB_model_num'].numeric(dtype=int, missing=0,
+                                                        rows=rows)
+            numbers = data['auth_seq_id'].numeric(dtype=int, missing=0,
+                                                  rows=rows)
+            chains = data['auth_asym_id'].codes[rows]
+            asyms = data['label_asym_id'].codes[rows]
+            codes = data['pdbx_PDB_ins_code'].codes[rows]
+            new_model = boundaries(models)
+            new_chain = new_model | boundaries(chains)
+            new_residue = new_chain | boundaries(asyms) | \
+                boundaries(numbers) | boundaries(codes)
+
+            self.model_starts = np.flatnonzero(new_model)
+            self.chain_starts = np.flatnonzero(new_chain)
+            self.residue_starts = np.flatnonzero(new_residue)
+
+            size = len(self.order)
+            self.models = dict(it.izip(
+                self.values('pdbx_PDB_model_num', self.model_starts),
+                self.__pairs__(self.model_starts, size)))
+            self.chains = dict(it.izip(
+                it.izip(self.values('pdbx_PDB_model_num', self.chain_starts),
+                        self.values('auth_asym_id', self.chain_starts)),
+                self.__pairs__(self.chain_starts, size)))
+
+    def coordinates(self):
+        """Get an N x 3 array of the coordinates of all atoms in sorted order,
+        with the symmetry operator applied. The whole array is transformed in
+        one operation the first time this is called.
+        """
+        if self._coordinates is None:
+            with self.profile.stage('coordinates'):
+                self._coordinates = self.__coordinates__()
+        return self._coordinates
+
+    def __coordinates__(self):
+        data = self.table._data
+        xyz = np.column_stack([data[axis].numeric(rows=self.order)
+                               for axis in COORDINATES])
+        if self.operator is not None:
+            rotation, translation = operator_transform(self.operator)
+            if not np.array_equal(rotation, np.eye(3)) or translation.any():
+                xyz = xyz.dot(rotation.T) + translation
+        return xyz
+
+    def unit_ids(self, pdb, start, stop, level='residue'):
+        """Build the unit ids for all residues or atoms in a range. Each column
+        is gathered for the whole range at once and the ids are joined in a
+        single pass.
+
+        :pdb: The name of the structure.
+        :start: The start of the range.
+        :stop: The end of the range.
+        :level: Either 'residue' or 'atom'.
+        :returns: A tuple of the list of ids and arrays of the start and stop
+        of the atoms for each id.
+        """
+        if level == 'residue':
+            low, high = np.searchsorted(self.residue_starts, [start, stop])
+            starts = self.residue_starts[low:high]
+            stops = np.append(starts[1:], stop).astype(starts.dtype)
+        elif level == 'atom':
+            starts = np.arange(start, stop)
+            stops = starts + 1
+        else:
+            raise ValueError("Unknown unit id level %s" % level)
+
+        count = len(starts)
+        operator = None
+        if self.operator is not None:
+            operator = self.operator['name']
+
+        if level == 'atom':
+            names = self.values('auth_atom_id', starts)
+            alt_ids = self.values('label_alt_id', starts)
+        else:
+            names = alt_ids = [None] * count
+        codes = self.values('pdbx_PDB_ins_code', starts)
+
+        tails = {}
+        suffixes = []
+        for key in it.izip(names, alt_ids, codes):
+            if key not in tails:
+                tails[key] = unit_id_tail(*(key + (operator,)))
+            suffixes.append(tails[key])
+
+        prefix = [pdb.upper()] * count
+        columns = [self.values(name, starts) for name in RESIDUE_ID_COLUMNS]
+        ids = ['|'.join(parts) + tail for parts, tail in
+               it.izip(it.izip(prefix, *columns), suffixes)]
+        return ids, starts, stops
+
+    def grid(self, start, stop):
+        """Get a spatial index of the atoms in a range. This is built the
+        first time it is requested for a range and then cached.
+        """
+        key = (start, stop)
+        if key not in self._grids:
+            self._grids[key] = Grid(self.coordinates()[start:stop])
+        return self._grids[key]
+
+    def residue_bounds(self, positions):
+        """Get the start and stop of the residue which contains each of the
+        given positions, as two arrays.
+        """
+        index = np.searchsorted(self.residue_starts, positions, side='right')
+        index -= 1
+        stops = np.append(self.residue_starts[1:], len(self))
+        return self.residue_starts[index], stops[index]
+
+    def __pairs__(self, starts, stop):
+        bounds = starts.tolist() + [stop]
+        return zip(bounds[:-1], bounds[1:])
+
+    def __len__(self):
+        return len(self.order)
+
+    def values(self, name, positions):
+        """Get the values of a column for the atoms at some positions in the
+        sorted order, as a list.
+        """
+        column = self.table._data[name]
+        return column.levels[column.codes[self.order[positions]]].tolist()
+
+    def value(self, name, position):
+        """Get the value of a column for the atom at a position.
+        """
+        return self.table._data[name][int(self.order[position])]
+
+    def atom(self, position):
+        """Get the row for the atom at a position in the sorted order.
+        """
+        return self.table[int(self.order[position])]
+
+    def ranges(self, starts, start, stop):
+        """Get the (start, stop) of each model, chain or residue which lies in
+        the given range.
+
+        :starts: One of model_starts, chain_starts or residue_starts.
+        :start: The start of the range to look in.
+        :stop: The end of the range to look in.
+        """
+        low, high = np.searchsorted(starts, [start, stop])
+        return self.__pairs__(starts[low:high], stop)
+
+    def altloc_mask(self, start, stop, altloc=HIGHEST_OCCUPANCY):
+        """Get a boolean array which is True for the atoms in a range to keep
+        when choosing one alternate location per residue with choose_altlocs.
+        Atoms without an alternate location are always kept.
+
+        :start: The start of the range.
+        :stop: The end of the range.
+        :altloc: The alternate location to prefer, or 'highest_occupancy' to
+        use the location with the highest occupancy in each residue.
+        """
+        data = self.table._data
+        column = data['label_alt_id']
+        rows = self.order[start:stop]
+        codes = column.codes[rows]
+        missing = np.array([level in MISSING for level in
+                            column.levels.tolist()], dtype=bool)
+        has_alt = ~missing[codes]
+        keep = np.ones(len(rows), dtype=bool)
+        if not has_alt.any():
+            return keep
+
+        rows = rows[has_alt]
+        positions = np.arange(start, stop)[has_alt]
+        residues = np.searchsorted(self.residue_starts, positions,
+                                   side='right') - 1
+        if 'occupancy' in data:
+            occupancy = data['occupancy'].numeric(missing=1.0, rows=rows)
+        else:
+            occupancy = np.ones(len(rows))
+
+        preferred = None
+        if altloc != HIGHEST_OCCUPANCY:
+            found = np.flatnonzero(column.levels == altloc)
+            preferred = found[0] if len(found) else -1
+
+        keep[has_alt] = choose_altlocs(residues, codes[has_alt], occupancy,
+                                       preferred=preferred)
+        return keep
+
+    def residue_count(self, start, stop):
+        """Count the number of residues in a range.
+        """
+        low, high = np.searchsorted(self.residue_starts, [start, stop])
+        return int(high - low)
+
+    def residue_range(self, start, stop, index):
+        """Get the (start, stop) of the residue at the given index within a
+        range. Negative indexes count from the end of the range.
+        """
+        low, high = np.searchsorted(self.residue_starts, [start, stop])
+        if index < 0:
+            index += high - low
+        if index < 0 or index >= high - low:
+            raise IndexError("Residue index out of range")
+        first = int(self.residue_starts[low + index])
+        if low + index + 1 < high:
+            return first, int(self.residue_starts[low + index + 1])
+        return first, stop
 
 
 class GenericMapping(coll.Mapping):
@@ -257,45 +1410,180 @@ class GenericMapping(coll.Mapping):
 
 class ResidueContainer(object):
 
-    def __init__(self, cif, atoms, unobs=None, nonpolymers=False):
+    def __init__(self, cif, hierarchy, start, stop, unobs=None,
+                 unobs_start=0):
         self._cif = cif
-
-        if not nonpolymers:
-            atoms = it.ifilter(cif.is_polymeric_atom, atoms)
-
-        if not isinstance(atoms, list):
-            atoms = list(atoms)
-
-        self._atoms = atoms
+        self._hierarchy = hierarchy
+        self._start = start
+        self._stop = stop
         self._unobs = unobs
+        self._unobs_start = unobs_start
         self._residues = None
+        self._context = None
 
     @property
     def unobs(self):
         if self._unobs is None:
-            unobs = self._cif.pdbx_unobs_or_zero_occ_residues.rows
-
+            equalities = {'polymer_flag': 'Y'}
             if 'chain' in self:
-                unobs = filter_using(unobs, 'auth_asym_id', self['chain'])
-
+                equalities['auth_asym_id'] = self['chain']
             if 'model' in self:
-                unobs = filter_using(unobs, 'PDB_model_num', self['model'])
+                equalities['PDB_model_num'] = self['model']
 
-            unobs = it.ifilter(lambda u: u['polymer_flag'] == 'Y', unobs)
+            table = self._cif.pdbx_unobs_or_zero_occ_residues
+            unobs = table.where(**equalities)
             self._unobs = sorted(unobs, key=lambda u: int(u['auth_seq_id']))
 
+        if self._unobs_start:
+            return self._unobs[self._unobs_start:]
         return self._unobs
 
     def atoms(self):
-        for atom in self._atoms:
-            yield atom
+        for position in xrange(self._start, self._stop):
+            yield self._hierarchy.atom(position)
+
+    def coordinates(self):
+        """Get an N x 3 array of the coordinates of all atoms in this
+        container, with the symmetry operator applied.
+        """
+        return self._hierarchy.coordinates()[self._start:self._stop]
+
+    def write_cif(self, handle, symmetry=False):
+        """Write the atoms in this container to a file as mmCIF. The
+        atom_site table is written with atoms in the same order as the
+        residues, along with the entity, pdbx_struct_oper_list and
+        pdbx_struct_assembly_gen rows needed to load the file as a CIF. Rows
+        are written in blocks, so the whole text is never held in memory.
+
+        :handle: The file to write to.
+        :symmetry: If True the coordinates are written with the symmetry
+        operator applied and the operator written is the identity, otherwise
+        they are copied unchanged from the file along with the operator.
+        """
+        from rnastructure.tertiary import writer
+        rows = self.__rows__()
+        table = self._hierarchy.table
+        coordinates = None
+        operator = self._hierarchy.operator
+        if symmetry:
+            coordinates = self.coordinates()
+            operator = None
+        tables = writer.assembly_tables(self._cif.entity, table, rows,
+                                        operator=operator)
+        writer.write_cif(handle, self._cif.name, table, rows,
+                         coordinates=coordinates, tables=tables)
+
+    def write_pdb(self, handle, symmetry=False):
+        """Write the atoms in this container to a file in PDB format. This
+        raises writer.PDBFormatError if some value does not fit in its PDB
+        column, such as a chain id longer than one character.
+
+        :handle: The file to write to.
+        :symmetry: If True the coordinates are written with the symmetry
+        operator applied.
+        """
+        from rnastructure.tertiary import writer
+        coordinates = None
+        if symmetry:
+            coordinates = self.coordinates()
+        writer.write_pdb(handle, self._hierarchy.table, self.__rows__(),
+                         coordinates=coordinates)
+
+    def __rows__(self):
+        return self._hierarchy.order[self._start:self._stop]
 
     def residues(self):
         if self._residues is None:
-            self._residues = list(self.residue_iterator())
+            with self._cif.profile.stage('residues'):
+                self._residues = list(self.residue_iterator())
 
         return self._residues
 
+    def unit_ids(self, level='residue'):
+        """Get the unit ids of all residues or atoms in this container.
+
+        :level: Either 'residue' or 'atom'.
+        """
+        ids, _, _ = self._hierarchy.unit_ids(self._cif.name, self._start,
+                                             self._stop, level=level)
+        return ids
+
+    def unit_id_ranges(self, level='residue'):
+        """Get a dict from each unit id in this container to the (start, stop)
+        of its atoms in the hierarchy.
+
+        :level: Either 'residue' or 'atom'.
+        """
+        ids, starts, stops = self._hierarchy.unit_ids(self._cif.name,
+                                                      self._start, self._stop,
+                                                      level=level)
+        return dict(it.izip(ids, it.izip(starts.tolist(), stops.tolist())))
+
+    def within(self, residue, cutoff):
+        """Find all residues in this container with an atom within cutoff of
+        any atom in the given residue. The residue itself is not included.
+
+        :residue: The residue to search around.
+        :cutoff: The distance in angstroms to search within.
+        """
+        return self.within_many([residue], cutoff)[0]
+
+    def within_many(self, residues, cutoff):
+        """Find the residues near each of several residues at once. This is
+        done with a single query of the spatial index.
+
+        :residues: A list of residues to search around.
+        :cutoff: The distance in angstroms to search within.
+        :returns: A list with the list of nearby residues for each residue.
+        """
+        residues = list(residues)
+        if not residues:
+            return []
+
+        points = np.concatenate([r.coordinates() for r in residues])
+        owners = np.repeat(np.arange(len(residues)),
+                           [len(r) for r in residues])
+        found, atoms = self.__grid__().query(points, cutoff)
+        starts, _ = self._hierarchy.residue_bounds(atoms + self._start)
+        found = set(it.izip(owners[found].tolist(), starts.tolist()))
+
+        nearby = [[] for residue in residues]
+        built = {}
+        for index, start in sorted(found):
+            residue = residues[index]
+            if residue._hierarchy is self._hierarchy and \
+                    residue._start == start:
+                continue
+            nearby[index].append(self.__residue_at__(start, built))
+        return nearby
+
+    def pairs_within(self, cutoff):
+        """Find all pairs of residues in this container which have an atom
+        within cutoff of each other. Each pair is given once, in the order the
+        residues appear in the container.
+
+        :cutoff: The distance in angstroms to search within.
+        """
+        first, second = self.__grid__().pairs(cutoff)
+        first, _ = self._hierarchy.residue_bounds(first + self._start)
+        second, _ = self._hierarchy.residue_bounds(second + self._start)
+        pairs = set(it.izip(np.minimum(first, second).tolist(),
+                            np.maximum(first, second).tolist()))
+
+        built = {}
+        return [(self.__residue_at__(a, built), self.__residue_at__(b, built))
+                for a, b in sorted(pairs) if a != b]
+
+    def __grid__(self):
+        return self._hierarchy.grid(self._start, self._stop)
+
+    def __residue_at__(self, start, built):
+        if start not in built:
+            _, stop = self._hierarchy.residue_bounds([start])
+            built[start] = Residue(self.__context__(), self._hierarchy,
+                                   start, int(stop[0]))
+        return built[start]
+
     def first(self):
         return self.residue(0)
 
@@ -303,165 +1591,290 @@ class ResidueContainer(object):
         return self.residue(-1)
 
     def residue(self, target):
-        self.residues()
-        return self.residues()[target]
+        if self._residues is not None:
+            return self._residues[target]
+        start, stop = self._hierarchy.residue_range(self._start, self._stop,
+                                                    target)
+        return Residue(self.__context__(), self._hierarchy, start, stop)
 
     def residue_iterator(self):
-        sym_op = self['symmetry_operator']
-        cif = self._cif
-        for _, atoms in self.__grouped__():
-            yield Residue(cif, sym_op, list(atoms))
+        context = self.__context__()
+        hierarchy = self._hierarchy
+        for start, stop in self.__grouped__():
+            yield Residue(context, hierarchy, start, stop)
+
+    def __context__(self):
+        if self._context is None:
+            self._context = ResidueContext(self._cif,
+                                           self['symmetry_operator'])
+        return self._context
+
+    def __view__(self, entity_types):
+        """Get the Hierarchy of the atoms of some entity types that the
+        operator of this container applies to. This is a filter of the same
+        sorted atoms, so models and chains line up with this container.
+        """
+        hierarchy = self._hierarchy
+        return self._cif.hierarchy(hierarchy.operator,
+                                   asym_ids=hierarchy.asym_ids,
+                                   entity_types=entity_types)
 
     def __grouped__(self):
-        fn = lambda r: (r['auth_seq_id'], r['pdbx_PDB_ins_code'])
-        return it.groupby(self._atoms, fn)
+        return self._hierarchy.ranges(self._hierarchy.residue_starts,
+                                      self._start, self._stop)
 
     def __bool__(self):
-        return bool(self._atoms)
+        return self._stop > self._start
 
     __nonzero__ = __bool__
 
     def __len__(self):
-        return len(self.residues())
+        if self._residues is not None:
+            return len(self._residues)
+        return self._hierarchy.residue_count(self._start, self._stop)
 
 
 class Symmetry(ResidueContainer, GenericMapping):
 
-    def __init__(self, cif, operator, atoms):
-        super(Symmetry, self).__init__(cif, atoms)
+    def __init__(self, cif, operator, hierarchy):
+        super(Symmetry, self).__init__(cif, hierarchy, 0, len(hierarchy))
         self.inherit({'pdb': cif.name, 'symmetry_operator': operator['name']})
+        self.rotation, self.translation = operator_transform(operator)
+
+    def transform(self, coordinates):
+        """Apply this operator to an N x 3 array of coordinates.
+        """
+        coordinates = np.asarray(coordinates, dtype=float)
+        return coordinates.dot(self.rotation.T) + self.translation
 
     def model(self, number, **kwargs):
         num = str(number)
-        fn = lambda r: r['pdbx_PDB_model_num'] == num
-        atoms = it.ifilter(fn, self.atoms())
-        model = Model(self._cif, num, self, atoms, **kwargs)
-        if not model:
+        if num not in self._hierarchy.models:
             return None
-        return model
+        start, stop = self._hierarchy.models[num]
+        return Model(self._cif, num, self, self._hierarchy, start, stop,
+                     **kwargs)
 
     def models(self, **kwargs):
-        fn = lambda r: r['pdbx_PDB_model_num']
-        for model_number, atoms in it.groupby(self.atoms(), fn):
-            model = Model(self._cif, model_number, self, atoms, **kwargs)
-            if model:
-                yield model
+        hierarchy = self._hierarchy
+        for start, stop in hierarchy.ranges(hierarchy.model_starts,
+                                            self._start, self._stop):
+            model_number = hierarchy.value('pdbx_PDB_model_num', start)
+            yield Model(self._cif, model_number, self, hierarchy, start, stop,
+                        **kwargs)
 
 
 class Model(ResidueContainer, GenericMapping):
 
-    def __init__(self, cif, model_number, operator, atoms):
-        super(Model, self).__init__(cif, atoms)
-        self.unit_id = func.partial(UnitIdGenerator(), self)
+    def __init__(self, cif, model_number, operator, hierarchy, start, stop):
+        super(Model, self).__init__(cif, hierarchy, start, stop)
         self.inherit(operator, model=model_number)
 
+    def unit_id(self, **kwargs):
+        return UIDGenerator(self, **kwargs)
+
     def chain(self, chain_id, **kwargs):
-        fn = lambda r: r['auth_asym_id'] == chain_id
-        atoms = it.ifilter(fn, self.atoms())
-        chain = Chain(self._cif, chain_id, self, atoms, **kwargs)
-        if not chain:
+        key = (self['model'], chain_id)
+        if key not in self._hierarchy.chains:
             return None
-        return chain
+        start, stop = self._hierarchy.chains[key]
+        return Chain(self._cif, chain_id, self, self._hierarchy, start, stop,
+                     **kwargs)
 
     def chains(self, **kwargs):
-        grouped = it.groupby(self.atoms(), lambda r: r['auth_asym_id'])
-        for chain_id, atoms in grouped:
-            chain = Chain(self._cif, chain_id, self, atoms, **kwargs)
-            if chain:
-                yield chain
+        hierarchy = self._hierarchy
+        for start, stop in hierarchy.ranges(hierarchy.chain_starts,
+                                            self._start, self._stop):
+            chain_id = hierarchy.value('auth_asym_id', start)
+            yield Chain(self._cif, chain_id, self, hierarchy, start, stop,
+                        **kwargs)
+
+    def waters(self):
+        """Get the waters of this model as a Model, or None if there are no
+        waters in it.
+        """
+        hierarchy = self.__view__(WATER_TYPES)
+        if self['model'] not in hierarchy.models:
+            return None
+        start, stop = hierarchy.models[self['model']]
+        return Model(self._cif, self['model'], self, hierarchy, start, stop)
+
+    def select_altloc(self, altloc=HIGHEST_OCCUPANCY):
+        """Get this model with one alternate location chosen for each
+        residue. The locations of the whole model are resolved at once, and
+        the result refers to the same atom rows, which are not copied.
+
+        :altloc: The alternate location to use, like 'A', or
+        'highest_occupancy' to use the location with the highest mean
+        occupancy in each residue. Residues without the given location use
+        the one with the highest occupancy.
+        """
+        hierarchy = self._hierarchy
+        keep = hierarchy.altloc_mask(self._start, self._stop, altloc=altloc)
+        rows = hierarchy.order[self._start:self._stop][keep]
+        selected = Hierarchy(hierarchy.table, rows,
+                             operator=hierarchy.operator,
+                             asym_ids=hierarchy.asym_ids,
+                             profile=hierarchy.profile)
+        return Model(self._cif, self['model'], self, selected, 0,
+                     len(selected))
 
 
 class Chain(ResidueContainer, GenericMapping):
 
-    def __init__(self, cif, chain_id, model, atoms, **kwargs):
-        super(Chain, self).__init__(cif, atoms, **kwargs)
+    def __init__(self, cif, chain_id, model, hierarchy, start, stop,
+                 **kwargs):
+        super(Chain, self).__init__(cif, hierarchy, start, stop, **kwargs)
         self.inherit(model, chain=chain_id)
-        self.unit_id = func.partial(UnitIdGenerator(), self)
         self._sequence = None
 
+    def unit_id(self, **kwargs):
+        return UIDGenerator(self, **kwargs)
+
+    def ligands(self):
+        """Get the atoms of this chain which are not part of a polymer or a
+        water, like bound ions and small molecules, as a Chain. This is None
+        if the chain has no ligands.
+        """
+        hierarchy = self.__view__(LIGAND_TYPES)
+        key = (self['model'], self['chain'])
+        if key not in hierarchy.chains:
+            return None
+        start, stop = hierarchy.chains[key]
+        return Chain(self._cif, self['chain'], self, hierarchy, start, stop)
+
     def experimental_sequence(self):
-        sequence = []
-        for row in self.cif.pdbx_poly_seq_scheme:
-            if self['chain'] != row['asym_id']:
-                continue
-            sequence.append(row['mon_id'])
-        return sequence
+        template, _ = self._cif.sequence_template(self['chain'])
+        return list(template.mon_ids)
 
     def experimental_sequence_mapping(self):
+        """Map each residue of the experimental sequence to its sequence id
+        and the unit id of the observed residue, or None if it was not
+        observed. The sequence is shared by every chain of an entity, so only
+        the labels and author numbering are built for each chain.
+        """
+        template, rows = self._cif.sequence_template(self['chain'])
+        if not template.unique:
+            raise ValueError("Can't map one sequence residue twice")
+        data = self._cif.pdbx_poly_seq_scheme._data
+
+        def values(name):
+            return data[name].levels[data[name].codes[rows]].tolist()
+
+        seq_prefix = '%s|Sequence|%s|' % (self['pdb'], self['chain'])
+        prefix = '|'.join([self['pdb'].upper(), str(self['model']),
+                           self['chain']])
+        tails = {}
         mapping = []
         seen = set()
-        for row in self._cif.pdbx_poly_seq_scheme:
-            if self['chain'] != row['asym_id']:
-                continue
-
-            insertion_code = row['pdb_ins_code']
-            if insertion_code == '.':
-                insertion_code = None
-
-            auth_number = row['auth_seq_num']
-            if auth_number == '?':
-                unit_id = None
-            else:
-                unit_id = UIDGenerator({
-                    'pdb': self['pdb'],
-                    'model': self['model'],
-                    'chain': self['chain'],
-                    'residue': row['auth_mon_id'],
-                    'number': auth_number,
-                    'insertion_code': insertion_code,
-                    'symmetry_operator': self['symmetry_operator'],
-                })
-
-            seq_id = '%s|Sequence|%s|%s|%s' % (self['pdb'], self['chain'],
-                                               row['mon_id'], row['seq_id'])
-
-            if seq_id in seen:
-                raise ValueError("Can't map one sequence residue twice")
-            if unit_id and unit_id in seen:
-                raise ValueError("Can't map unit %s twice", unit_id)
-
-            seen.add(seq_id)
-            seen.add(unit_id)
-            mapping.append((row['mon_id'], seq_id, unit_id))
+        for mon_id, suffix, auth_mon_id, auth_number, insertion_code in \
+                it.izip(template.mon_ids, template.suffixes,
+                        values('auth_mon_id'), values('auth_seq_num'),
+                        values('pdb_ins_code')):
+            unit_id = None
+            if auth_number != '?':
+                if insertion_code not in tails:
+                    code = insertion_code
+                    if code == '.':
+                        code = None
+                    tails[insertion_code] = unit_id_tail(
+                        None, None, code, self['symmetry_operator'])
+                unit_id = '|'.join([prefix, auth_mon_id, auth_number]) + \
+                    tails[insertion_code]
+                if unit_id in seen:
+                    raise ValueError("Can't map unit %s twice" % unit_id)
+                seen.add(unit_id)
+            mapping.append((mon_id, seq_prefix + suffix, unit_id))
 
         return mapping
 
-    def polymers(self):
+    def polymers(self, breaks='unobs', cutoff=DEFAULT_BREAK_CUTOFF):
         """Creates an iterator over each part of the chain which is a polymer.
         That means it is connected and marked as a polymer in the file. Any
         monomers that are unoboserved or have no occupancy cause a chain break.
-        """
-
-        def create_filter(endpoint):
-            number = int(endpoint['auth_seq_id'])
-
-            def func(atom):
-                atom_number = int(atom['auth_seq_id'])
-                if atom_number < number:
-                    return True
-                if atom_number == number:
-                    return endpoint['PDB_ins_code'] == '?' or \
-                        atom['PDB_ins_code'] < endpoint['PDB_ins_code']
-                return False
-
-            return func
-
-        atoms = self.atoms()
-        for index, endpoint in enumerate(self.unobs):
-            if 'auth_seq_id' not in endpoint:
-                raise UnusableUnobservedTable()
+        All break points are found at once, and each polymer is a view of part
+        of this chain's atoms.
 
-            polymer = list(it.takewhile(create_filter(endpoint), atoms))
-            atoms = it.dropwhile(create_filter(endpoint), atoms)
-
-            unobs = self.unobs[index + 1:]
-            chain = Chain(self._cif, self['chain'], self, polymer, unobs=unobs)
-            if chain:
-                yield chain
-
-        chain = Chain(self._cif, self['chain'], self, atoms, unobs=[])
-        if chain:
-            yield chain
+        :breaks: How to find breaks. With 'unobs' the unobserved residues are
+        used, with 'geometry' the distance between linking atoms is used, and
+        'both' uses either.
+        :cutoff: The longest link allowed when using geometry.
+        """
+        if breaks not in BREAK_METHODS:
+            raise ValueError("Unknown break method %s" % breaks)
+
+        starts = self.__residue_starts__()
+        splits = {}
+        unobs = []
+        unobs_breaks = []
+        if breaks != 'geometry':
+            unobs = self.unobs
+            unobs_breaks = self.__unobs_breaks__(starts)
+            for index, residue in enumerate(unobs_breaks):
+                splits.setdefault(residue, index + 1)
+
+        if breaks != 'unobs':
+            for residue in self.geometry_breaks(cutoff=cutoff).tolist():
+                splits.setdefault(residue,
+                                  bisect.bisect_left(unobs_breaks, residue))
+
+        hierarchy = self._hierarchy
+        start = self._start
+        for residue in sorted(splits):
+            stop = starts[residue]
+            if stop > start:
+                yield Chain(self._cif, self['chain'], self, hierarchy, start,
+                            stop, unobs=unobs, unobs_start=splits[residue])
+            start = stop
+
+        if self._stop > start:
+            yield Chain(self._cif, self['chain'], self, hierarchy, start,
+                        self._stop, unobs=[])
+
+    def geometry_breaks(self, cutoff=DEFAULT_BREAK_CUTOFF):
+        """Find the residues which are not linked to the residue before them,
+        using the O3'-P distance for nucleotides and the C-N distance for
+        amino acids. A residue which lacks the linking atoms is also a break.
+
+        :cutoff: The longest link allowed.
+        :returns: An array of the index of each residue, within this chain,
+        that starts a new piece.
+        """
+        hierarchy = self._hierarchy
+        starts = np.array(self.__residue_starts__())
+        positions = hierarchy.order[self._start:self._stop]
+        names = hierarchy.table._data['label_atom_id']
+        codes = names.codes[positions]
+        residues = np.searchsorted(starts, np.arange(self._start, self._stop),
+                                   side='right') - 1
+
+        def lookup(choices):
+            return [int(np.flatnonzero(names.levels == name)[0])
+                    if name in names.levels else -2 for name in choices]
+
+        coordinates = hierarchy.coordinates()[self._start:self._stop]
+        return linkage_breaks(codes, residues, coordinates, len(starts) - 1,
+                              lookup(LINK_ATOMS['out']),
+                              lookup(LINK_ATOMS['in']), cutoff=cutoff)
+
+    def __residue_starts__(self):
+        hierarchy = self._hierarchy
+        low, high = np.searchsorted(hierarchy.residue_starts,
+                                    [self._start, self._stop])
+        return hierarchy.residue_starts[low:high].tolist() + [self._stop]
+
+    def __unobs_breaks__(self, starts):
+        unobs = self.unobs
+        if any('auth_seq_id' not in endpoint for endpoint in unobs):
+            raise UnusableUnobservedTable()
+
+        hierarchy = self._hierarchy
+        numbers = [int(n) for n in hierarchy.values('auth_seq_id',
+                                                    starts[:-1])]
+        codes = hierarchy.values('pdbx_PDB_ins_code', starts[:-1])
+        endpoints = [(int(u['auth_seq_id']), u['PDB_ins_code'])
+                     for u in unobs]
+        return polymer_breaks(numbers, codes, endpoints)
 
     def polymer(self, target):
         for index, polymer in enumerate(self.polymers()):
@@ -469,9 +1882,23 @@ class Chain(ResidueContainer, GenericMapping):
                 return polymer
         raise IndexError()
 
-    def has_breaks(self):
-        first_seq_id = int(self._atoms[0]['auth_seq_id'])
-        last_seq_id = int(self._atoms[-1]['auth_seq_id'])
+    def has_breaks(self, breaks='unobs', cutoff=DEFAULT_BREAK_CUTOFF):
+        """Check if this chain has any breaks.
+
+        :breaks: One of 'unobs', 'geometry' or 'both', as for polymers.
+        :cutoff: The longest link allowed when using geometry.
+        """
+        if breaks not in BREAK_METHODS:
+            raise ValueError("Unknown break method %s" % breaks)
+
+        if breaks != 'unobs' and len(self.geometry_breaks(cutoff=cutoff)):
+            return True
+        if breaks == 'geometry' or not self.unobs:
+            return False
+
+        hierarchy = self._hierarchy
+        first_seq_id = int(hierarchy.value('auth_seq_id', self._start))
+        last_seq_id = int(hierarchy.value('auth_seq_id', self._stop - 1))
         first_unobs = int(self.unobs[0]['auth_seq_id'])
         last_unobs = int(self.unobs[-1]['auth_seq_id'])
         return last_seq_id > first_unobs and first_seq_id < last_unobs
@@ -485,32 +1912,121 @@ class Chain(ResidueContainer, GenericMapping):
         return self._sequence
 
 
-class Residue(GenericMapping):
+class ResidueContext(object):
 
-    def __init__(self, cif, symmetry_operator, atoms):
-        self._cif = cif
-        self._atoms = list(atoms)
-
-        super(Residue, self).__init__()
-        self.inherit({
-            'pdb': cif.name,
-            'model': atoms[0]['pdbx_PDB_model_num'],
-            'chain': atoms[0]['auth_asym_id'],
-            'number': atoms[0]['auth_seq_id'],
-            'insertion_code': atoms[0]['pdbx_PDB_ins_code'],
-            'symmetry_operator': symmetry_operator,
-            'residue': atoms[0]['auth_comp_id']
-        })
+    """The values shared by all residues from one container. Each Residue
+    refers to one of these instead of holding its own copy.
+    """
+
+    __slots__ = ('cif', 'pdb', 'symmetry_operator')
+
+    def __init__(self, cif, symmetry_operator):
+        self.cif = cif
+        self.pdb = cif.name
+        self.symmetry_operator = symmetry_operator
+
+
+class Residue(object):
+
+    """A single residue. This only stores a shared context and the range of
+    its atoms in the hierarchy, all other values are read from the atom
+    columns when requested. It can be used like a read only dict with the
+    keys pdb, model, chain, number, insertion_code, symmetry_operator and
+    residue.
+    """
+
+    __slots__ = ('_context', '_hierarchy', '_start', '_stop')
+
+    def __init__(self, context, hierarchy, start, stop):
+        self._context = context
+        self._hierarchy = hierarchy
+        self._start = start
+        self._stop = stop
+
+    def __getitem__(self, key):
+        if key == 'pdb':
+            return self._context.pdb
+        if key == 'symmetry_operator':
+            return self._context.symmetry_operator
+        if key not in RESIDUE_COLUMNS:
+            raise KeyError(key)
+        return self._hierarchy.value(RESIDUE_COLUMNS[key], self._start)
+
+    def __iter__(self):
+        return (key for key, _ in RESIDUE_FIELDS)
+
+    def __contains__(self, key):
+        return key in RESIDUE_COLUMNS
+
+    def keys(self):
+        return [key for key, _ in RESIDUE_FIELDS]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return (self[key] for key in self)
+
+    def iteritems(self):
+        return ((key, self[key]) for key in self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __eq__(self, other):
+        if not isinstance(other, coll.Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    __hash__ = None
 
     def unit_id(self, **kwargs):
         return UIDGenerator(self, **kwargs)
 
     def atoms(self):
-        for atom in self._atoms:
-            yield atom
+        for position in xrange(self._start, self._stop):
+            yield self._hierarchy.atom(position)
+
+    def coordinates(self):
+        """Get an N x 3 array of the coordinates of all atoms in this residue,
+        with the symmetry operator applied.
+        """
+        return self._hierarchy.coordinates()[self._start:self._stop]
+
+    def altlocs(self):
+        """Get the atoms of each alternate location in this residue, as a
+        dict from the alt id to an array of the indexes of its atoms in this
+        residue. Atoms without an alternate location are under None.
+        """
+        hierarchy = self._hierarchy
+        column = hierarchy.table._data['label_alt_id']
+        codes = column.codes[hierarchy.order[self._start:self._stop]]
+        groups = {}
+        for code in np.unique(codes).tolist():
+            alt_id = column.levels[code]
+            if alt_id in MISSING:
+                alt_id = None
+            indexes = np.flatnonzero(codes == code)
+            if alt_id in groups:
+                indexes = np.union1d(groups[alt_id], indexes)
+            groups[alt_id] = indexes
+        return groups
 
     def __len__(self):
-        return len(self._atoms)
+        return self._stop - self._start
 
     def __str__(self):
         return self.unit_id()
+
+
+coll.Mapping.register(Residue)
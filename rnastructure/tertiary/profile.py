@@ -0,0 +1,174 @@
+"""This module records how long each stage of loading and using a CIF takes
+and how much memory it uses. It is opt-in, a CIF created with profile=True
+records into a Profile, otherwise a Profile which does nothing is used so the
+cost of the hooks is a method call per stage.
+
+The stages are:
+
+    read         Reading the file, and for a lazy CIF finding its categories
+    parse        Parsing a category into values
+    tables       Building the columns of a Table from a parsed category
+    assemblies   Building the map of asyms to symmetry operators
+    entities     Building the map of entity ids to entities
+    sort         Sorting atoms into model, chain and residue order
+    group        Finding the models, chains and residues of sorted atoms
+    coordinates  Gathering and transforming the coordinates of atoms
+    residues     Creating the Residue objects of a container
+
+Stages may happen inside each other, for example a table may be parsed while
+sorting atoms, and the time and memory of a stage includes any inside it.
+Memory is measured as resident memory, since there is no way to trace
+allocations in this version of python.
+
+The stats of a Profile can be read as a dict, or written as a single line of
+JSON with the logging module, so they can be gathered from many jobs.
+"""
+
+from __future__ import with_statement
+
+import sys
+import json
+import time
+import logging
+import resource
+import contextlib
+import collections as coll
+
+LOGGER = logging.getLogger(__name__)
+
+
+def resident():
+    """Get the current resident memory of this process in bytes. This uses
+    /proc when it is available, and otherwise the peak memory use.
+    """
+    try:
+        with open('/proc/self/status', 'rb') as raw:
+            for line in raw:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return peak_resident()
+
+
+def peak_resident():
+    """Get the peak resident memory of this process in bytes.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return usage
+    return usage * 1024
+
+
+class NullProfile(object):
+
+    """A Profile which records nothing. This is used when profiling is off,
+    and it can be logged like a Profile but writes nothing.
+    """
+
+    def __init__(self):
+        self._stage = NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def stats(self):
+        return {}
+
+    def log_line(self, **fields):
+        return ''
+
+    def log(self, logger=LOGGER, level=logging.INFO, **fields):
+        pass
+
+
+class NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL = NullProfile()
+
+
+class Profile(object):
+
+    """Records the wall time, number of calls and memory use of each stage.
+    One Profile can be shared by many CIF objects, in which case the stats are
+    totals over all of them.
+    """
+
+    def __init__(self):
+        self._stats = coll.OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """A context manager which records the time and memory used by the
+        code inside it as part of a stage.
+
+        :name: The name of the stage.
+        """
+        before = resident()
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start, resident() - before)
+
+    def record(self, name, seconds, growth):
+        """Add a single call to the stats of a stage.
+
+        :name: The name of the stage.
+        :seconds: The wall time of the call.
+        :growth: The change in resident memory during the call, in bytes.
+        """
+        if name not in self._stats:
+            self._stats[name] = coll.OrderedDict([
+                ('calls', 0), ('seconds', 0.0), ('growth', 0), ('peak', 0)])
+        stats = self._stats[name]
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['growth'] += growth
+        stats['peak'] = max(stats['peak'], peak_resident())
+
+    def stats(self):
+        """Get the stats of every stage which has been recorded, in the order
+        they were first seen. Each is a dict of calls, seconds, growth, the
+        total change in resident memory in bytes, and peak, the highest peak
+        resident memory of the process at the end of a call, in bytes.
+        """
+        return coll.OrderedDict((name, coll.OrderedDict(stats))
+                                for name, stats in self._stats.iteritems())
+
+    def log_line(self, **fields):
+        """Format the stats as a single line of JSON.
+
+        :fields: Other values to include, like the name of the structure.
+        """
+        data = coll.OrderedDict(sorted(fields.items()))
+        data['stages'] = self.stats()
+        return json.dumps(data)
+
+    def log(self, logger=LOGGER, level=logging.INFO, **fields):
+        """Write the stats to a logger as a single line of JSON.
+
+        :logger: The logger to use.
+        :level: The level to log at.
+        :fields: Other values to include, like the name of the structure.
+        """
+        logger.log(level, self.log_line(**fields))
+
+
+def profiler(profile):
+    """Get the Profile to use for a profile argument, which may be True to
+    create a new Profile, an existing Profile to add to, or False to not
+    profile.
+    """
+    if profile is True:
+        return Profile()
+    if not profile:
+        return NULL
+    return profile
@@ -0,0 +1,884 @@
+"""This module contains a small and fast reader for mmCIF files. It reads the
+file in a single pass and produces the data for each category as a flat list
+of values, which is what the tables in rnastructure.tertiary.cif are built
+from.
+
+Most of the work is done by regular expressions and str.split, so large loops,
+like atom_site, are tokenized in a few calls instead of one python call per
+value.
+
+Compressed files can be streamed, in which case the file is decompressed and
+parsed a chunk at a time, so the whole decompressed text is never held in
+memory at once.
+"""
+
+import re
+import bz2
+import gzip
+import mmap
+import itertools as it
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+BOUNDARY = re.compile(r'\n(?=_|loop_|data_|;|#)')
+
+LINE_START = re.compile(r'_|loop_|data_|;|#')
+
+TEXT_END = re.compile(r'\n;')
+
+TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(#.*)|(\S+)""", re.M)
+
+QUOTED_LINE = re.compile(r"""^.*['"#].*$""", re.M)
+
+CHUNK_SIZE = 1 << 20
+
+
+class CIFSyntaxError(Exception):
+
+    """This is raised when the file cannot be parsed as mmCIF, for example if a
+    text field is never closed or a loop has the wrong number of values.
+    """
+    pass
+
+
+class UnsupportedCompression(Exception):
+
+    """This is raised when asked to open a compressed file that cannot be
+    decompressed, for example an xz file without the lzma module.
+    """
+    pass
+
+
+class Category(object):
+
+    """All values for a single category in a data block. The values are kept
+    as a single flat list in row order, so the column for an attribute is a
+    slice of it.
+    """
+
+    def __init__(self, name, attributes, values):
+        self.name = name
+        self.attributes = attributes
+        self.values = values
+
+    def column(self, index):
+        """Get all values for the attribute at the given index.
+        """
+        return self.values[index::len(self.attributes)]
+
+    def row(self, index):
+        """Get the values of one row as a list.
+        """
+        size = len(self.attributes)
+        return self.values[index * size:(index + 1) * size]
+
+    def select(self, attributes=None, predicate=None):
+        """Create a new category with only some of the attributes and rows of
+        this one.
+
+        :attributes: The attributes to keep, or None to keep all of them.
+        :predicate: A function given a RowView of each row, which returns
+        True for rows to keep.
+        """
+        selection = Selection(self.attributes, attributes, predicate)
+        values = []
+        selection.take(self.values, values)
+        return Category(self.name, selection.kept, values)
+
+    def __len__(self):
+        """The number of rows in this category.
+        """
+        if not self.attributes:
+            return 0
+        return len(self.values) // len(self.attributes)
+
+
+class RowView(object):
+
+    """A read only view of one row of values, used when filtering rows.
+    Values are looked up by attribute name. A single view is moved along the
+    rows, so it should not be kept.
+    """
+
+    __slots__ = ('_values', '_index', '_offset')
+
+    def __init__(self, attributes, values, offset=0):
+        self._values = values
+        self._index = dict((name, position) for position, name in
+                           enumerate(attributes))
+        self._offset = offset
+
+    def __getitem__(self, name):
+        return self._values[self._offset + self._index[name]]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def get(self, name, default=None):
+        if name not in self._index:
+            return default
+        return self[name]
+
+
+class Selection(object):
+
+    """Chooses which attributes and rows of a category to keep. This works on
+    the flat list of values, so it can be applied to part of a loop while it
+    is being read.
+
+    :attributes: All attributes of the category, in order.
+    :wanted: The attributes to keep, or None to keep all of them.
+    :predicate: A function given a RowView of each row, which returns True
+    for rows to keep.
+    """
+
+    def __init__(self, attributes, wanted=None, predicate=None):
+        self.attributes = attributes
+        self.predicate = predicate
+        self.indexes = range(len(attributes))
+        if wanted is not None:
+            wanted = set(wanted)
+            self.indexes = [index for index, name in enumerate(attributes)
+                            if name in wanted]
+        self.kept = [attributes[index] for index in self.indexes]
+
+    def take(self, values, selected):
+        """Add the selected parts of all complete rows in values to selected.
+
+        :values: A flat list of values, starting at the start of a row.
+        :selected: The list to add the selected values to.
+        :returns: The values of any incomplete row at the end.
+        """
+        size = len(self.attributes)
+        count = len(values) // size
+        used = count * size
+        columns = [values[index:used:size] for index in self.indexes]
+
+        if self.predicate is not None:
+            view = RowView(self.attributes, values)
+            rows = []
+            for row in xrange(count):
+                view._offset = row * size
+                if self.predicate(view):
+                    rows.append(row)
+            if len(rows) < count:
+                columns = [[column[row] for row in rows]
+                           for column in columns]
+
+        if columns:
+            selected.extend(it.chain.from_iterable(it.izip(*columns)))
+        return values[used:]
+
+
+class Block(object):
+
+    """A single data block, a named collection of categories. Categories may
+    either be parsed up front and added with add, or only located with locate.
+    Located categories are parsed from the raw data each time they are
+    requested, so callers should keep the result.
+    """
+
+    def __init__(self, name, data=None):
+        self.name = name
+        self.categories = {}
+        self.offsets = {}
+        self.order = []
+        self.selected = set()
+        self._data = data
+
+    def add(self, category, selected=False):
+        """Add a parsed category.
+
+        :category: The category to add.
+        :selected: True if the category has already had attributes and rows
+        selected from it, so later selections should not be applied.
+        """
+        if category.name not in self.categories and \
+                category.name not in self.offsets:
+            self.order.append(category.name)
+        self.categories[category.name] = category
+        if selected:
+            self.selected.add(category.name)
+        else:
+            self.selected.discard(category.name)
+
+    def locate(self, name, start, stop):
+        """Record where in the raw data a category can be found.
+
+        :name: The name of the category.
+        :start: The position the category starts at.
+        :stop: The position the category ends at.
+        """
+        if name not in self.categories and name not in self.offsets:
+            self.order.append(name)
+        self.offsets[name] = (start, stop)
+
+    def category(self, name, attributes=None, predicate=None):
+        """Get a category by name, or None if it is not in this block.
+
+        :attributes: If given, only these attributes are kept.
+        :predicate: If given, only rows for which this is true are kept. It is
+        given a RowView of each row.
+        """
+        if name in self.categories:
+            category = self.categories[name]
+            if name in self.selected:
+                return category
+            if attributes is not None or predicate is not None:
+                category = category.select(attributes, predicate)
+            return category
+        if name in self.offsets:
+            start, stop = self.offsets[name]
+            for _, category in categories(self._data, start, stop,
+                                          attributes=attributes,
+                                          predicate=predicate):
+                return category
+        return None
+
+    def __contains__(self, name):
+        return name in self.categories or name in self.offsets
+
+    def __iter__(self):
+        for name in self.order:
+            yield self.category(name)
+
+
+def split_quoted(text):
+    """Split text which may contain quoted values or comments.
+    """
+    return [bare or single or double
+            for single, double, comment, bare in TOKEN.findall(text)
+            if not comment]
+
+
+def tokenize(text):
+    """Split some text into a list of values. Quotes are removed and comments
+    are skipped. Text fields are not handled here, callers must split them out
+    first. Only lines which contain a quote or comment go through the regular
+    expression, everything else is handled by str.split.
+    """
+    if "'" not in text and '"' not in text and '#' not in text:
+        return text.split()
+
+    values = []
+    position = 0
+    for match in QUOTED_LINE.finditer(text):
+        values.extend(text[position:match.start()].split())
+        values.extend(split_quoted(match.group()))
+        position = match.end()
+    values.extend(text[position:].split())
+    return values
+
+
+def boundary(data, start, end):
+    """Find the start of the next line, at or after start, which begins a tag,
+    loop, data block, text field or comment. This returns -1 if there is no
+    such line. Searching for a newline followed by one of these is much faster
+    than using ^ in a multiline pattern.
+    """
+    if (start == 0 or data[start - 1] == '\n') and \
+            LINE_START.match(data, start, end):
+        return start
+    match = BOUNDARY.search(data, start, end)
+    if not match:
+        return -1
+    return match.end()
+
+
+def text_end(data, start, end):
+    """Find the semicolon which closes the text field starting at start.
+    """
+    close = TEXT_END.search(data, start + 1, end)
+    if not close:
+        raise CIFSyntaxError("Unterminated text field at %s" % start)
+    return close.start() + 1
+
+
+def text_field(data, start, end):
+    """Read a text field which starts at the given position. This returns the
+    value as well as the position just after the closing semicolon.
+    """
+    close = text_end(data, start, end)
+    value = data[start + 1:close - 1]
+    if value.endswith('\r'):
+        value = value[:-1]
+    return value, close + 1
+
+
+def chunks(data, start, end, size=CHUNK_SIZE):
+    """Split some data into pieces of about size characters, each of which
+    ends at the end of a line.
+    """
+    while start < end:
+        stop = min(start + size, end)
+        if stop < end:
+            newline = data.find('\n', stop, end)
+            stop = end if newline == -1 else newline + 1
+        yield data[start:stop]
+        start = stop
+
+
+def line_end(data, start, end):
+    """Find the position of the end of the line starting at start.
+    """
+    stop = data.find('\n', start, end)
+    if stop == -1:
+        return end
+    return stop
+
+
+def split_tag(tag):
+    """Split a tag like _atom_site.id into the category and attribute names.
+    """
+    category, _, attribute = tag[1:].partition('.')
+    return category, attribute
+
+
+def read_loop(data, start, end, attributes=None, predicate=None):
+    """Read a loop whose first tag is at start. This returns a Category and
+    the position where the next item begins.
+
+    :attributes: If given, only these attributes are kept.
+    :predicate: If given, only rows for which this is true are kept. Rows are
+    selected as the loop is read, so the unwanted values are never all held
+    in memory at once.
+    """
+    tags = []
+    position = start
+    while position < end and data[position] == '_':
+        stop = line_end(data, position, end)
+        parts = data[position:stop].split(None, 1)
+        tags.append(parts[0])
+        if len(parts) > 1:
+            position = position + data[position:stop].index(parts[1])
+            break
+        position = stop + 1
+
+    if not tags:
+        raise CIFSyntaxError("Loop without any tags at %s" % start)
+
+    names = [split_tag(tag) for tag in tags]
+    fields = [name for _, name in names]
+    selection = None
+    if attributes is not None or predicate is not None:
+        selection = Selection(fields, attributes, predicate)
+
+    values = []
+    pending = []
+    while position < end:
+        stop = boundary(data, position, end)
+        if stop == -1:
+            stop = end
+        for chunk in chunks(data, position, stop):
+            if selection is None:
+                values.extend(tokenize(chunk))
+            else:
+                pending.extend(tokenize(chunk))
+                pending = selection.take(pending, values)
+        if stop == end or data[stop] not in ';#':
+            position = stop
+            break
+        if data[stop] == '#':
+            position = line_end(data, stop, end) + 1
+            continue
+        value, position = text_field(data, stop, end)
+        if selection is None:
+            values.append(value)
+        else:
+            pending.append(value)
+            pending = selection.take(pending, values)
+
+    if selection is not None:
+        if pending:
+            raise CIFSyntaxError("Loop %s has an incomplete row" %
+                                 names[0][0])
+        return Category(names[0][0], selection.kept, values), position
+
+    if len(values) % len(names):
+        raise CIFSyntaxError("Loop %s has an incomplete row" % names[0][0])
+    category = Category(names[0][0], fields, values)
+    return category, position
+
+
+def read_item(data, start, end):
+    """Read a single tag and its value, which may be on the following line.
+    This returns the tag, the value and the position after the value.
+    """
+    stop = line_end(data, start, end)
+    parts = data[start:stop].split(None, 1)
+    tag = parts[0]
+    if len(parts) > 1:
+        values = tokenize(parts[1])
+        if values:
+            return tag, values[0], stop + 1
+
+    position = stop + 1
+    while position < end:
+        if data[position] == ';':
+            value, position = text_field(data, position, end)
+            return tag, value, line_end(data, position, end) + 1
+
+        stop = line_end(data, position, end)
+        values = tokenize(data[position:stop])
+        if values:
+            return tag, values[0], stop + 1
+        position = stop + 1
+
+    raise CIFSyntaxError("No value given for %s" % tag)
+
+
+def read_items(data, start, end):
+    """Read a category given as a series of tag value pairs. This returns a
+    Category with a single row and the position where the next item begins.
+    """
+    name = None
+    attributes = []
+    values = []
+    position = start
+    while position < end:
+        start = boundary(data, position, end)
+        if start != -1 and data[start] == '#':
+            position = line_end(data, start, end) + 1
+            continue
+        if start == -1 or data[start] != '_':
+            break
+
+        stop = line_end(data, start, end)
+        category, attribute = split_tag(data[start:stop].split()[0])
+        if name is None:
+            name = category
+        elif category != name:
+            break
+
+        _, value, position = read_item(data, start, end)
+        attributes.append(attribute)
+        values.append(value)
+
+    return Category(name, attributes, values), position
+
+
+def categories(data, start=0, end=None, attributes=None, predicate=None):
+    """Iterate over all categories in some data. This yields tuples of
+    (block name, category).
+
+    :data: The raw text to parse, this may be a string or an mmap.
+    :start: The position to start parsing at.
+    :end: The position to stop parsing at.
+    :attributes: If given, only these attributes of each category are kept.
+    :predicate: If given, only rows for which this is true are kept.
+    """
+    selected = attributes is not None or predicate is not None
+    if end is None:
+        end = len(data)
+
+    block = None
+    position = start
+    while position < end:
+        position = boundary(data, position, end)
+        if position == -1:
+            break
+
+        if data[position] == '_':
+            category, position = read_items(data, position, end)
+            if selected:
+                category = category.select(attributes, predicate)
+            yield block, category
+        elif data[position:position + 5] == 'loop_':
+            stop = line_end(data, position, end)
+            category, position = read_loop(data, stop + 1, end,
+                                           attributes=attributes,
+                                           predicate=predicate)
+            yield block, category
+        elif data[position:position + 5] == 'data_':
+            stop = line_end(data, position, end)
+            block = data[position + 5:stop].strip()
+            position = stop + 1
+        elif data[position] == '#':
+            position = line_end(data, position, end) + 1
+        else:
+            _, position = text_field(data, position, end)
+
+
+def locate(data, start=0, end=None):
+    """Find where each category is in some data without parsing the values.
+    This only looks at the start of lines, so it is much faster than parsing.
+    This yields tuples of (block name, category name, start, stop).
+
+    :data: The raw text to scan, this may be a string or an mmap.
+    :start: The position to start scanning at.
+    :end: The position to stop scanning at.
+    """
+    if end is None:
+        end = len(data)
+
+    block = None
+    current = None
+    position = start
+    while position < end:
+        position = boundary(data, position, end)
+        if position == -1:
+            break
+
+        if data[position] == ';':
+            position = text_end(data, position, end) + 1
+            continue
+
+        stop = line_end(data, position, end)
+        if data[position] == '#':
+            position = stop + 1
+            continue
+
+        name = None
+        if data[position] == '_':
+            name = split_tag(data[position:stop].split()[0])[0]
+            if current is not None and current[0] == name:
+                position = stop + 1
+                continue
+            if current is not None and current[0] is None:
+                current[0] = name
+                position = stop + 1
+                continue
+
+        if current is not None:
+            yield block, current[0], current[1], position
+            current = None
+
+        if data[position:position + 5] == 'data_':
+            block = data[position + 5:stop].strip()
+        else:
+            current = [name, position]
+        position = stop + 1
+
+    if current is not None:
+        yield block, current[0], current[1], end
+
+
+def read_lines(handle, size=CHUNK_SIZE):
+    """Iterate over the lines of a file, reading it in chunks of the given
+    size. Line endings are removed.
+    """
+    pending = ''
+    while True:
+        chunk = handle.read(size)
+        if not chunk:
+            break
+        parts = (pending + chunk).split('\n')
+        pending = parts.pop()
+        for part in parts:
+            yield part
+    if pending:
+        yield pending
+
+
+class LoopBuilder(object):
+
+    """Collects the tags and values of a loop as it is streamed. Lines of
+    values are buffered until there are about size characters and are then
+    tokenized together. If a selection is given for the loop then it is
+    applied to each buffer, so unwanted values are dropped right away.
+    """
+
+    def __init__(self, attributes=None, predicates=None, size=CHUNK_SIZE):
+        self.tags = []
+        self.values = []
+        self.collecting = True
+        self._attributes = attributes or {}
+        self._predicates = predicates or {}
+        self._size = size
+        self._buffer = []
+        self._buffered = 0
+        self._pending = []
+        self._selection = None
+
+    def add_tag(self, line):
+        """Add a line starting with a tag. Any text after the tag is the
+        start of the values.
+        """
+        parts = line.split(None, 1)
+        self.tags.append(parts[0])
+        if len(parts) > 1:
+            self.add_line(parts[1])
+
+    def add_line(self, line):
+        if self.collecting:
+            self.__start_values__()
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self._size:
+            self.flush()
+
+    def add_value(self, value):
+        """Add a single value, like a text field.
+        """
+        if self.collecting:
+            self.__start_values__()
+        self.flush()
+        self.__extend__([value])
+
+    def flush(self):
+        if self._buffer:
+            tokens = tokenize('\n'.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+            self.__extend__(tokens)
+
+    def category(self):
+        """Finish the loop and create its Category. This returns the category
+        and True if a selection was applied to it.
+        """
+        if not self.tags:
+            raise CIFSyntaxError("Loop without any tags")
+        if self.collecting:
+            self.__start_values__()
+        self.flush()
+
+        name = self.__names__()[0][0]
+        if self._selection is not None:
+            if self._pending:
+                raise CIFSyntaxError("Loop %s has an incomplete row" % name)
+            return Category(name, self._selection.kept, self.values), True
+
+        if len(self.values) % len(self.tags):
+            raise CIFSyntaxError("Loop %s has an incomplete row" % name)
+        fields = [field for _, field in self.__names__()]
+        return Category(name, fields, self.values), False
+
+    def __names__(self):
+        return [split_tag(tag) for tag in self.tags]
+
+    def __start_values__(self):
+        self.collecting = False
+        if not self.tags:
+            raise CIFSyntaxError("Loop without any tags")
+        names = self.__names__()
+        name = names[0][0]
+        if name in self._attributes or name in self._predicates:
+            fields = [field for _, field in names]
+            self._selection = Selection(fields, self._attributes.get(name),
+                                        self._predicates.get(name))
+
+    def __extend__(self, tokens):
+        if self._selection is None:
+            self.values.extend(tokens)
+        else:
+            self._pending.extend(tokens)
+            self._pending = self._selection.take(self._pending, self.values)
+
+
+def stream_categories(handle, attributes=None, predicates=None,
+                      size=CHUNK_SIZE):
+    """Iterate over all categories in a file, reading it a chunk at a time.
+    This works on any file object with a read method, including compressed
+    files, and never holds more than about size characters of unparsed text.
+    This yields tuples of (block name, category, selected).
+
+    :handle: The file to read.
+    :attributes: A dict from category name to the attributes to keep.
+    :predicates: A dict from category name to a function which is given a
+    RowView of each row and returns True for rows to keep.
+    :size: The number of characters to read and tokenize at once.
+    """
+    attributes = attributes or {}
+    predicates = predicates or {}
+    block = None
+    loop = None
+    items = None
+    waiting = False
+
+    def finish_items(items):
+        category = Category(*items)
+        name = category.name
+        if name in attributes or name in predicates:
+            selected = category.select(attributes.get(name),
+                                       predicates.get(name))
+            return block, selected, True
+        return block, category, False
+
+    lines = read_lines(handle, size=size)
+    for line in lines:
+        start = line[:1]
+        if start == ';':
+            text = [line[1:]]
+            for line in lines:
+                if line[:1] == ';':
+                    break
+                text.append(line)
+            else:
+                raise CIFSyntaxError("Unterminated text field")
+
+            value = '\n'.join(text)
+            if value.endswith('\r'):
+                value = value[:-1]
+            if waiting:
+                items[2].append(value)
+                waiting = False
+            elif loop is not None:
+                loop.add_value(value)
+                if line[1:].strip():
+                    loop.add_line(line[1:])
+            continue
+
+        if start == '#':
+            continue
+
+        if start == '_':
+            if loop is not None and loop.collecting:
+                loop.add_tag(line)
+                continue
+            if loop is not None:
+                category, selected = loop.category()
+                yield block, category, selected
+                loop = None
+            if waiting:
+                raise CIFSyntaxError("No value given for %s" % items[1][-1])
+
+            parts = line.split(None, 1)
+            name, attribute = split_tag(parts[0])
+            if items is not None and items[0] != name:
+                yield finish_items(items)
+                items = None
+            if items is None:
+                items = [name, [], []]
+            items[1].append(attribute)
+
+            values = []
+            if len(parts) > 1:
+                values = tokenize(parts[1])
+            if values:
+                items[2].append(values[0])
+            else:
+                waiting = True
+            continue
+
+        is_loop = line.startswith('loop_')
+        is_block = line.startswith('data_')
+        if is_loop or is_block:
+            if waiting:
+                raise CIFSyntaxError("No value given for %s" % items[1][-1])
+            if loop is not None:
+                category, selected = loop.category()
+                yield block, category, selected
+                loop = None
+            if items is not None:
+                yield finish_items(items)
+                items = None
+            if is_loop:
+                loop = LoopBuilder(attributes, predicates, size=size)
+            else:
+                block = line[5:].strip()
+            continue
+
+        if waiting:
+            values = tokenize(line)
+            if values:
+                items[2].append(values[0])
+                waiting = False
+        elif loop is not None:
+            loop.add_line(line)
+
+    if waiting:
+        raise CIFSyntaxError("No value given for %s" % items[1][-1])
+    if loop is not None:
+        category, selected = loop.category()
+        yield block, category, selected
+    if items is not None:
+        yield finish_items(items)
+
+
+def is_compressed(path):
+    """Check if a path names a gzip, bzip2 or xz compressed file.
+    """
+    return path.endswith(('.gz', '.bz2', '.xz'))
+
+
+def open_file(path):
+    """Open a file for reading, decompressing it if the name ends with .gz,
+    .bz2 or .xz.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    if path.endswith('.xz'):
+        if lzma is None:
+            raise UnsupportedCompression("Reading %s needs lzma" % path)
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class Reader(object):
+
+    """Reads an mmCIF file into a list of Blocks. Real files are memory
+    mapped, anything else with a read method is read into memory, unless
+    stream is True. Streamed files are read and parsed a chunk at a time.
+    """
+
+    def __init__(self, handle, stream=False):
+        self._stream = stream
+        self._handle = None
+        self._data = None
+        if stream:
+            self._handle = handle
+        else:
+            self._data = self.__load__(handle)
+
+    def __load__(self, handle):
+        if isinstance(handle, file):
+            try:
+                return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error, EnvironmentError):
+                pass
+        return handle.read()
+
+    def stream(self, attributes=None, predicates=None):
+        """Iterate over the categories of a streamed file as they are parsed,
+        without keeping them. This yields tuples of (block name, category,
+        selected), as from stream_categories.
+
+        :attributes: A dict from category name to the attributes to keep.
+        :predicates: A dict from category name to a function given a RowView
+        of each row, which returns True for rows to keep.
+        """
+        if not self._stream:
+            raise ValueError("Reader was not created for streaming")
+        return stream_categories(self._handle, attributes=attributes,
+                                 predicates=predicates)
+
+    def read(self, lazy=False, attributes=None, predicates=None):
+        """Parse all data blocks in the file.
+
+        :lazy: If True only the position of each category is found, and
+        categories are parsed when they are requested from the block. This
+        has no effect when streaming.
+        :attributes: When streaming, a dict from category name to the
+        attributes to keep.
+        :predicates: When streaming, a dict from category name to a function
+        given a RowView of each row, which returns True for rows to keep.
+        """
+        blocks = []
+        if self._stream:
+            for name, category, selected in self.stream(
+                    attributes=attributes, predicates=predicates):
+                if not blocks or blocks[-1].name != name:
+                    blocks.append(Block(name))
+                blocks[-1].add(category, selected=selected)
+            return blocks
+
+        if lazy:
+            for name, category, start, stop in locate(self._data):
+                if not blocks or blocks[-1].name != name:
+                    blocks.append(Block(name, data=self._data))
+                blocks[-1].locate(category, start, stop)
+            return blocks
+
+        for name, category in categories(self._data):
+            if not blocks or blocks[-1].name != name:
+                blocks.append(Block(name))
+            blocks[-1].add(category)
+        return blocks
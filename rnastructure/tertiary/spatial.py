@@ -0,0 +1,136 @@
+"""This module provides a spatial index for finding atoms which are near each
+other. Atoms are placed into a uniform grid of cubic cells, so finding all
+atoms within some distance of a point only needs to look at the cells around
+it. All queries are done on whole arrays of points at once.
+"""
+
+import itertools as it
+
+import numpy as np
+
+DEFAULT_CELL_SIZE = 5.0
+
+
+def expand(starts, stops):
+    """Expand a set of ranges into the positions they cover.
+
+    :starts: An array of the start of each range.
+    :stops: An array of the end of each range.
+    :returns: A tuple of two arrays, the index of the range each position
+    came from and the position itself.
+    """
+    counts = stops - starts
+    owners = np.repeat(np.arange(len(starts)), counts)
+    firsts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return owners, firsts + np.arange(len(owners))
+
+
+class Grid(object):
+
+    """A uniform grid over a set of coordinates.
+
+    :coordinates: An N x 3 array of coordinates to index.
+    :size: The length of the side of each cell.
+    """
+
+    def __init__(self, coordinates, size=DEFAULT_CELL_SIZE):
+        if size <= 0:
+            raise ValueError("Cell size must be positive")
+
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+        self.size = float(size)
+        if len(self.coordinates):
+            self.origin = self.coordinates.min(axis=0)
+        else:
+            self.origin = np.zeros(3)
+
+        cells = self.__cells__(self.coordinates)
+        if len(cells):
+            self.shape = cells.max(axis=0) + 1
+        else:
+            self.shape = np.ones(3, dtype=np.int64)
+
+        keys = self.__keys__(cells)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    def __cells__(self, points):
+        return np.floor((points - self.origin) / self.size).astype(np.int64)
+
+    def __keys__(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + \
+            cells[:, 2]
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def query(self, points, radius):
+        """Find all indexed atoms within some distance of each of a set of
+        points.
+
+        :points: An M x 3 array of points to search around.
+        :radius: The distance to search within.
+        :returns: A tuple of two arrays, the index of the point and the index
+        of the atom, for each atom that is close enough to a point.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(points) or not len(self) or radius < 0:
+            return empty, empty
+
+        reach = int(np.ceil(radius / self.size))
+        cells = self.__cells__(points)
+        steps = range(-reach, reach + 1)
+        found_points = []
+        found_atoms = []
+        for offset in it.product(steps, steps, steps):
+            near = cells + offset
+            valid = np.all((near >= 0) & (near < self.shape), axis=1)
+            if not valid.any():
+                continue
+
+            indexes = np.flatnonzero(valid)
+            keys = self.__keys__(near[indexes])
+            starts = np.searchsorted(self.keys, keys, side='left')
+            stops = np.searchsorted(self.keys, keys, side='right')
+            owners, positions = expand(starts, stops)
+            if not len(owners):
+                continue
+
+            owners = indexes[owners]
+            atoms = self.order[positions]
+            deltas = points[owners] - self.coordinates[atoms]
+            close = np.einsum('ij,ij->i', deltas, deltas) <= radius ** 2
+            found_points.append(owners[close])
+            found_atoms.append(atoms[close])
+
+        if not found_points:
+            return empty, empty
+
+        found_points = np.concatenate(found_points)
+        found_atoms = np.concatenate(found_atoms)
+        order = np.lexsort((found_atoms, found_points))
+        return found_points[order], found_atoms[order]
+
+    def within(self, points, radius):
+        """Find the set of indexed atoms within some distance of any of the
+        given points.
+
+        :points: An M x 3 array of points to search around.
+        :radius: The distance to search within.
+        :returns: A sorted array of atom indexes.
+        """
+        _, atoms = self.query(points, radius)
+        return np.unique(atoms)
+
+    def pairs(self, radius):
+        """Find all pairs of indexed atoms within some distance of each
+        other.
+
+        :radius: The distance to search within.
+        :returns: A tuple of two arrays, the first and second atom of each
+        pair. Each pair is only given once, with the first index smaller.
+        """
+        first, second = self.query(self.coordinates, radius)
+        keep = first < second
+        return first[keep], second[keep]
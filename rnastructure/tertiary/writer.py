@@ -0,0 +1,302 @@
+"""This module writes atoms from an atom_site table as mmCIF or PDB. Values are
+formatted once per distinct value of a column and then looked up by code, and
+coordinates are formatted a whole column at a time. Rows are written in
+blocks, so the text for a large structure is never built in memory at once.
+
+Normally these are used through the write_cif and write_pdb methods of the
+containers in rnastructure.tertiary.cif.
+"""
+
+import re
+import itertools as it
+
+import numpy as np
+
+from rnastructure.tertiary.cif import boundaries
+
+ROWS_PER_WRITE = 4096
+
+COORDINATES = ('Cartn_x', 'Cartn_y', 'Cartn_z')
+
+OPERATOR_COLUMNS = ['id', 'name'] + \
+    ['matrix[%d][%d]' % (i, j) for i in (1, 2, 3) for j in (1, 2, 3)] + \
+    ['vector[1]', 'vector[2]', 'vector[3]']
+
+IDENTITY = {
+    'id': '1', 'name': '1_555',
+    'matrix[1][1]': '1', 'matrix[1][2]': '0', 'matrix[1][3]': '0',
+    'matrix[2][1]': '0', 'matrix[2][2]': '1', 'matrix[2][3]': '0',
+    'matrix[3][1]': '0', 'matrix[3][2]': '0', 'matrix[3][3]': '1',
+    'vector[1]': '0', 'vector[2]': '0', 'vector[3]': '0',
+}
+
+ASSEMBLY_COLUMNS = ['assembly_id', 'oper_expression', 'asym_id_list']
+
+MISSING = ('.', '?')
+
+NEEDS_QUOTES = re.compile(r'\s|^[_#$\'"\[\];]|^$|'
+                          r'^(data|loop|save|global|stop)_', re.IGNORECASE)
+
+PDB_FIELDS = [
+    ('group_PDB', 6, 'left', 'ATOM'),
+    ('auth_atom_id', 4, 'left', ''),
+    ('label_alt_id', 1, 'left', ''),
+    ('auth_comp_id', 3, 'right', ''),
+    ('auth_asym_id', 1, 'left', ''),
+    ('auth_seq_id', 4, 'right', ''),
+    ('pdbx_PDB_ins_code', 1, 'left', ''),
+    ('type_symbol', 2, 'right', ''),
+]
+
+
+class PDBFormatError(Exception):
+
+    """This is raised when atoms cannot be written in the PDB format, for
+    example if a chain id is longer than one character.
+    """
+    pass
+
+
+def quote(value):
+    """Format a single value so it can be read back from an mmCIF file.
+    """
+    if '\n' in value or ("'" in value and '"' in value):
+        return '\n;%s\n;\n' % value
+    if not NEEDS_QUOTES.search(value):
+        return value
+    if "'" not in value:
+        return "'%s'" % value
+    return '"%s"' % value
+
+
+def blocks(rows, size=ROWS_PER_WRITE):
+    """Iterate over (start, stop) for each block of rows to write.
+    """
+    for start in xrange(0, len(rows), size):
+        yield start, min(start + size, len(rows))
+
+
+def distinct(table, column, rows):
+    """Get the distinct values of a column for some rows, in sorted order.
+    """
+    data = table._data[column]
+    return [data.levels[code] for code in np.unique(data.codes[rows])]
+
+
+def assembly_tables(entities, table, rows, operator=None):
+    """Get the tables, other than atom_site, which are needed to load some
+    written atoms as a CIF. These are the entities of the atoms, the operator
+    and a single assembly which applies it to the asyms of the atoms. Each
+    table is a tuple of (name, columns, rows), where each row is a dict.
+
+    :entities: The entity Table of the CIF the atoms come from.
+    :table: The atom_site Table.
+    :rows: An array of the rows of atom_site which are written.
+    :operator: The row of pdbx_struct_oper_list to write, if not given the
+    identity is written.
+    """
+    entity_rows = []
+    for entity_id in distinct(table, 'label_entity_id', rows):
+        entity_rows.extend(entities.where(id=entity_id))
+
+    if operator is None:
+        operator = IDENTITY
+    asym_ids = distinct(table, 'label_asym_id', rows)
+    assembly = {
+        'assembly_id': '1',
+        'oper_expression': operator['id'],
+        'asym_id_list': ','.join(asym_ids),
+    }
+    return [
+        ('entity', entities.columns, entity_rows),
+        ('pdbx_struct_oper_list', OPERATOR_COLUMNS, [operator]),
+        ('pdbx_struct_assembly_gen', ASSEMBLY_COLUMNS, [assembly]),
+    ]
+
+
+def write_loop(handle, name, columns, rows):
+    """Write a small table as an mmCIF loop. Values missing from a row are
+    written as '?'.
+
+    :handle: The file to write to.
+    :name: The name of the table.
+    :columns: The columns to write.
+    :rows: A list of dicts from column to value.
+    """
+    handle.write('loop_\n')
+    for column in columns:
+        handle.write('_%s.%s\n' % (name, column))
+    for row in rows:
+        handle.write(' '.join(quote(row.get(column, '?'))
+                              for column in columns) + '\n')
+    handle.write('#\n')
+
+
+def write_cif(handle, name, table, rows, coordinates=None, tables=()):
+    """Write some rows of an atom_site table as an mmCIF data block.
+
+    :handle: The file to write to.
+    :name: The name of the data block.
+    :table: The atom_site Table.
+    :rows: An array of the rows to write, in the order to write them.
+    :coordinates: An N x 3 array of coordinates to write in place of those
+    in the table, formatted with three decimal places.
+    :tables: Other tables to write before atom_site, as a list of (name,
+    columns, rows) like those from assembly_tables.
+    """
+    handle.write('data_%s\n#\n_entry.id %s\n#\n' % (name, quote(name)))
+    for other, columns, values in tables:
+        write_loop(handle, other, columns, values)
+
+    handle.write('loop_\n')
+    for column in table.columns:
+        handle.write('_%s.%s\n' % (table.name, column))
+
+    quoted = {}
+    for column in table.columns:
+        levels = table._data[column].levels.tolist()
+        quoted[column] = np.array([quote(level) for level in levels],
+                                  dtype=object)
+
+    replaced = {}
+    if coordinates is not None:
+        for axis, column in enumerate(COORDINATES):
+            replaced[column] = axis
+
+    for start, stop in blocks(rows):
+        part = rows[start:stop]
+        values = []
+        for column in table.columns:
+            if column in replaced:
+                axis = coordinates[start:stop, replaced[column]]
+                values.append(np.char.mod('%.3f', axis))
+            else:
+                codes = table._data[column].codes[part]
+                values.append(quoted[column][codes])
+        handle.write(''.join(' '.join(row) + '\n'
+                             for row in it.izip(*values)))
+    handle.write('#\n')
+
+
+def fixed_width(table, column, part, width, justify, default):
+    """Format a column of the table as fixed width text for the given rows.
+    Missing values are written as blanks, or the default if the column does
+    not exist.
+    """
+    if column not in table.columns:
+        return np.array([default.ljust(width)] * len(part), dtype=object)
+
+    data = table._data[column]
+    levels = [('' if level in MISSING else level)
+              for level in data.levels.tolist()]
+    lengths = np.array([len(level) for level in levels], dtype=int)
+    codes = data.codes[part]
+    too_long = lengths[codes] > width
+    if too_long.any():
+        value = levels[codes[np.flatnonzero(too_long)[0]]]
+        raise PDBFormatError("%s %s is too long for PDB format" %
+                             (column, value))
+
+    if justify == 'left':
+        padded = [level.ljust(width) for level in levels]
+    else:
+        padded = [level.rjust(width) for level in levels]
+    return np.array(padded, dtype=object)[codes]
+
+
+def atom_names(names, elements):
+    """Place atom names in the four PDB columns. Names shorter than four
+    characters with a one letter element are shifted right by one, so the
+    element is aligned with other atoms.
+    """
+    shifted = []
+    for name, element in it.izip(names, elements):
+        name = name.strip()
+        if len(name) < 4 and len(element.strip()) < 2:
+            name = ' ' + name
+        shifted.append(name.ljust(4))
+    return shifted
+
+
+def fixed_numbers(values, width, places, name):
+    """Format numbers in a fixed width field, raising a PDBFormatError if
+    any of them is too large to fit.
+    """
+    formatted = np.char.mod('%%%d.%df' % (width, places), values)
+    too_long = np.char.str_len(formatted) > width
+    if too_long.any():
+        value = values[np.flatnonzero(too_long)[0]]
+        raise PDBFormatError("%s %s is too large for PDB format" %
+                             (name, value))
+    return formatted
+
+
+def numeric_column(table, column, part, default):
+    if column not in table.columns:
+        return np.repeat(default, len(part))
+    return table._data[column].numeric(missing=default, rows=part)
+
+
+def write_pdb(handle, table, rows, coordinates=None):
+    """Write some rows of an atom_site table as PDB ATOM and HETATM records.
+    Atoms are numbered from 1 in the order they are written. A TER record is
+    written after each chain, and each model is wrapped in MODEL and ENDMDL
+    records if there is more than one.
+
+    :handle: The file to write to.
+    :table: The atom_site Table.
+    :rows: An array of the rows to write, in the order to write them.
+    :coordinates: An N x 3 array of coordinates to write in place of those
+    in the table.
+    """
+    models = table._data['pdbx_PDB_model_num'].codes[rows]
+    chains = table._data['auth_asym_id'].codes[rows]
+    new_model = boundaries(models)
+    new_chain = new_model | boundaries(chains)
+    many_models = new_model.sum() > 1
+    model_numbers = table._data['pdbx_PDB_model_num'].numeric(
+        dtype=int, missing=0, rows=rows)
+
+    serial = 0
+    for start, stop in blocks(rows):
+        part = rows[start:stop]
+        fields = dict((column, fixed_width(table, column, part, width,
+                                           justify, default))
+                      for column, width, justify, default in PDB_FIELDS)
+        names = atom_names(fields['auth_atom_id'], fields['type_symbol'])
+
+        if coordinates is None:
+            xyz = [numeric_column(table, axis, part, np.nan)
+                   for axis in COORDINATES]
+        else:
+            xyz = [coordinates[start:stop, axis] for axis in xrange(3)]
+        xyz = [fixed_numbers(values, 8, 3, name)
+               for values, name in it.izip(xyz, COORDINATES)]
+        occupancy = fixed_numbers(numeric_column(table, 'occupancy', part,
+                                                 1.0), 6, 2, 'occupancy')
+        bfactor = fixed_numbers(numeric_column(table, 'B_iso_or_equiv', part,
+                                               0.0), 6, 2, 'B_iso_or_equiv')
+
+        lines = []
+        records = it.izip(fields['group_PDB'], names, fields['label_alt_id'],
+                          fields['auth_comp_id'], fields['auth_asym_id'],
+                          fields['auth_seq_id'],
+                          fields['pdbx_PDB_ins_code'], xyz[0], xyz[1],
+                          xyz[2], occupancy, bfactor, fields['type_symbol'])
+        for index, record in enumerate(records, start):
+            if new_chain[index] and index > 0:
+                lines.append('TER\n')
+            if new_model[index] and many_models:
+                if index > 0:
+                    lines.append('ENDMDL\n')
+                lines.append('MODEL     %4d\n' % model_numbers[index])
+            serial = serial % 99999 + 1
+            lines.append('%s%5d %s%s%s %s%s%s   %s%s%s%s%s          %s\n' %
+                         ((record[0], serial) + record[1:]))
+        handle.write(''.join(lines))
+
+    if len(rows):
+        handle.write('TER\n')
+    if many_models:
+        handle.write('ENDMDL\n')
+    handle.write('END\n')
@@ -0,0 +1,129 @@
+from __future__ import with_statement
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from rnastructure.tertiary import batch
+
+
+def count_atoms(cif):
+    return [(cif.name, len(cif.atom_site))]
+
+
+def sleep(cif):
+    time.sleep(5)
+    return []
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        for name in ['first', 'second', 'third']:
+            path = os.path.join(self.directory, name + '.cif')
+            shutil.copy('files/1FAT.cif', path)
+            self.paths.append(path)
+        self.bad = os.path.join(self.directory, 'bad.cif')
+        with open(self.bad, 'wb') as out:
+            out.write('data_bad\nloop_\n_a.b\n_a.c\n1\n')
+        self.output = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def results(self, paths, **kwargs):
+        kwargs.setdefault('job', count_atoms)
+        found = batch.run(paths, **kwargs)
+        return dict((result.path, result) for result in found)
+
+    def test_finds_cif_files_in_directories(self):
+        val = batch.find_files([self.directory])
+        ans = sorted(self.paths + [self.bad])
+        self.assertEqual(ans, val)
+
+    def test_finds_compressed_files(self):
+        path = os.path.join(self.directory, 'fourth.cif.gz')
+        open(path, 'wb').close()
+        self.assertTrue(path in batch.find_files([self.directory]))
+
+    def test_strips_compression_from_output_names(self):
+        val = batch.output_path('cifs/1FAT.cif.gz', 'out', format='json')
+        ans = os.path.join('out', '1FAT.json')
+        self.assertEqual(ans, val)
+
+    def test_processes_every_file(self):
+        results = self.results(self.paths, processes=2)
+        val = sorted((r.path, r.status, r.rows) for r in results.values())
+        ans = [(path, 'ok', [('1FAT', 7248)]) for path in sorted(self.paths)]
+        self.assertEqual(ans, val)
+
+    def test_profiles_each_file(self):
+        results = self.results(self.paths[:1], processes=1, profile=True)
+        stages = results[self.paths[0]].profile
+        self.assertTrue('read' in stages)
+        self.assertTrue('tables' in stages)
+
+    def test_does_not_profile_by_default(self):
+        results = self.results(self.paths[:1], processes=1)
+        self.assertTrue(results[self.paths[0]].profile is None)
+
+    def test_isolates_errors(self):
+        results = self.results(self.paths + [self.bad], processes=2)
+        self.assertEqual('error', results[self.bad].status)
+        self.assertTrue('pdbx_struct_oper_list' in results[self.bad].error)
+        self.assertEqual('ok', results[self.paths[0]].status)
+
+    def test_stops_files_which_take_too_long(self):
+        results = self.results(self.paths[:1], job=sleep, timeout=1,
+                               processes=1)
+        self.assertEqual('timeout', results[self.paths[0]].status)
+
+    def test_writes_one_output_per_file(self):
+        self.results(self.paths, output=self.output, format='json',
+                     processes=1)
+        with open(os.path.join(self.output, 'second.json'), 'rb') as raw:
+            val = [json.loads(line) for line in raw]
+        self.assertEqual([['1FAT', 7248]], val)
+
+    def test_skips_files_with_current_output(self):
+        self.results(self.paths, output=self.output, processes=1)
+        later = time.time() + 10
+        os.utime(self.paths[1], (later, later))
+        results = self.results(self.paths, output=self.output, processes=1)
+        val = [results[path].status for path in self.paths]
+        self.assertEqual(['skipped', 'ok', 'skipped'], val)
+
+    def test_gets_sequence_mappings(self):
+        results = self.results(self.paths[:1], job=batch.sequence_mappings,
+                               processes=1)
+        val = results[self.paths[0]].rows[0]
+        ans = ('1FAT', '1', 'A', 'SER', '1FAT|Sequence|A|SER|1',
+               '1FAT|1|A|SER|1')
+        self.assertEqual(ans, val)
+
+    def test_formats_rows_as_tsv(self):
+        val = batch.format_row(('1FAT', 1, None))
+        self.assertEqual('1FAT\t1\t', val)
+
+    def test_stops_files_with_fractional_timeout(self):
+        start = time.time()
+        results = self.results(self.paths[:1], job=sleep, timeout=0.5,
+                               processes=1)
+        self.assertEqual('timeout', results[self.paths[0]].status)
+        self.assertTrue(time.time() - start < 2)
+
+    def test_rejects_non_positive_timeout(self):
+        self.assertRaises(ValueError, self.results, self.paths, timeout=0)
+
+    def test_does_not_return_rows_written_to_output(self):
+        results = self.results(self.paths[:1], output=self.output,
+                               processes=1)
+        self.assertEqual([], results[self.paths[0]].rows)
+
+    def test_rejects_unknown_format(self):
+        self.assertRaises(ValueError, self.results, self.paths, format='bob')
@@ -0,0 +1,170 @@
+from __future__ import with_statement
+
+import unittest
+
+from StringIO import StringIO
+
+import numpy as np
+
+from rnastructure.tertiary import bcif
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.bcif import BinaryCIFError
+
+
+def encoded(data, *encoding):
+    return {'data': data, 'encoding': list(encoding)}
+
+
+def byte_array(values, type):
+    return np.array(values, dtype=bcif.BYTE_TYPES[type]).tostring()
+
+
+class MessagePackTest(unittest.TestCase):
+
+    def test_unpacks_maps_and_arrays(self):
+        val = bcif.unpack('\x82\xa1a\x01\xa1b\x93\xc3\xc0\xff')
+        ans = {'a': 1, 'b': [True, None, -1]}
+        self.assertEqual(ans, val)
+
+    def test_unpacks_binary_and_numbers(self):
+        val = bcif.unpack('\x93\xc4\x02ab\xcd\x01\x00\xcb?\xf8\x00\x00'
+                          '\x00\x00\x00\x00')
+        ans = ['ab', 256, 1.5]
+        self.assertEqual(ans, val)
+
+    def test_packs_what_it_unpacks(self):
+        value = {'name': 'x' * 40, 'values': range(-40, 300, 7),
+                 'data': bcif.Binary('\x00' * 300), 'factor': 0.5,
+                 'flag': False}
+        self.assertEqual(value, bcif.unpack(bcif.pack(value)))
+
+    def test_complains_about_truncated_data(self):
+        self.assertRaises(BinaryCIFError, bcif.unpack, '\x92\x01')
+        self.assertRaises(BinaryCIFError, bcif.unpack, '\xc4\x05ab')
+
+
+class DecodeTest(unittest.TestCase):
+
+    def test_decodes_byte_arrays(self):
+        data = encoded(byte_array([1, -2, 300], 2),
+                       {'kind': 'ByteArray', 'type': 2})
+        self.assertEqual([1, -2, 300], bcif.decode(data).tolist())
+
+    def test_decodes_integer_packing(self):
+        data = encoded(byte_array([1, 127, 3, -128, -10, 0], 1),
+                       {'kind': 'IntegerPacking', 'byteCount': 1,
+                        'isUnsigned': False, 'srcSize': 4},
+                       {'kind': 'ByteArray', 'type': 1})
+        self.assertEqual([1, 130, -138, 0], bcif.decode(data).tolist())
+
+    def test_decodes_run_length_and_delta(self):
+        data = encoded(byte_array([0, 1, 1, 3, 5, 1], 3),
+                       {'kind': 'Delta', 'origin': 10, 'srcType': 3},
+                       {'kind': 'RunLength', 'srcType': 3, 'srcSize': 5},
+                       {'kind': 'ByteArray', 'type': 3})
+        self.assertEqual([10, 11, 12, 13, 18], bcif.decode(data).tolist())
+
+    def test_decodes_fixed_point(self):
+        data = encoded(byte_array([123, -5], 3),
+                       {'kind': 'FixedPoint', 'factor': 100, 'srcType': 33},
+                       {'kind': 'ByteArray', 'type': 3})
+        self.assertEqual([1.23, -0.05], bcif.decode(data).tolist())
+
+    def test_decodes_string_arrays(self):
+        data = encoded(byte_array([1, 0, -1, 1], 3),
+                       {'kind': 'StringArray',
+                        'dataEncoding': [{'kind': 'ByteArray', 'type': 3}],
+                        'stringData': 'AGC',
+                        'offsetEncoding': [{'kind': 'ByteArray', 'type': 3}],
+                        'offsets': byte_array([0, 1, 3], 3)})
+        strings, indexes = bcif.decode(data)
+        self.assertEqual(['A', 'GC'], strings)
+        self.assertEqual([1, 0, -1, 1], indexes.tolist())
+
+    def test_complains_about_unknown_encodings(self):
+        data = encoded('', {'kind': 'Bob'})
+        self.assertRaises(BinaryCIFError, bcif.decode, data)
+
+
+class EncodeTest(unittest.TestCase):
+
+    def test_stores_integers_as_numbers(self):
+        self.assertEqual(('int', None), bcif.classify(['1', '-20', '?']))
+
+    def test_stores_decimals_as_fixed_point(self):
+        self.assertEqual(('fixed', 2), bcif.classify(['1.50', '-2.00']))
+
+    def test_keeps_numbers_which_would_change_as_strings(self):
+        self.assertEqual('string', bcif.classify(['01'])[0])
+        self.assertEqual('string', bcif.classify(['-0.0'])[0])
+        self.assertEqual('string', bcif.classify(['1.5', '2.25'])[0])
+
+    def test_encodes_integers_compactly(self):
+        values = np.arange(1, 1001)
+        data = bcif.encode_integers(values)
+        self.assertTrue(len(data['data']) < 16)
+        self.assertEqual(values.tolist(), bcif.decode(data).tolist())
+
+    def test_round_trips_a_structure(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw, lazy=False)
+        out = StringIO()
+        bcif.dump(cif, out)
+        loaded = bcif.load(StringIO(out.getvalue()))
+        for name in cif.data.order:
+            table = cif.table(name)
+            other = loaded.table(name)
+            self.assertEqual(table.columns, other.columns)
+            for column in table.columns:
+                self.assertEqual(list(table.column(column)),
+                                 list(other.column(column)))
+
+
+class BinaryCIFTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.text = CIF(raw)
+        cls.cif = CIF.from_path('files/1FAT.bcif')
+
+    def test_gets_name(self):
+        self.assertEqual('1FAT', self.cif.name)
+
+    def test_reads_all_atoms(self):
+        self.assertEqual(7248, len(self.cif.atom_site))
+
+    def test_reads_masked_values(self):
+        val = self.cif.atom_site.column('pdbx_PDB_ins_code')[0]
+        self.assertEqual('?', val)
+
+    def test_reads_coordinates(self):
+        val = self.cif.atom_site.numeric('Cartn_x')
+        ans = self.text.atom_site.numeric('Cartn_x')
+        self.assertTrue(np.array_equal(ans, val))
+
+    def test_reads_multiline_values(self):
+        val = self.cif.entity_poly[0]['pdbx_seq_one_letter_code']
+        ans = self.text.entity_poly[0]['pdbx_seq_one_letter_code']
+        self.assertEqual(ans, val)
+
+    def test_round_trips_a_loaded_file(self):
+        out = StringIO()
+        bcif.dump(self.cif, out)
+        loaded = bcif.load(StringIO(out.getvalue()))
+        self.assertEqual(self.cif.table_names(), loaded.table_names())
+        self.assertEqual(self.cif.unit_ids(), loaded.unit_ids())
+        for name in self.cif.table_names():
+            self.assertEqual(list(self.cif.table(name).rows),
+                             list(loaded.table(name).rows))
+
+    def test_only_adds_empty_level_for_null_strings(self):
+        levels = self.cif.atom_site._data['label_asym_id'].levels.tolist()
+        self.assertFalse('' in levels)
+        self.assertFalse('' in self.cif._assemblies)
+
+    def test_builds_same_structure(self):
+        self.assertEqual(self.text.unit_ids(), self.cif.unit_ids())
+        chain = self.cif.chain('1_555', '1', 'A')
+        self.assertEqual(self.text.chain('1_555', '1', 'A').sequence,
+                         chain.sequence)
@@ -0,0 +1,127 @@
+from __future__ import with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.cache import Cache
+from rnastructure.tertiary.cache import PREFIX
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, '1FAT.cif')
+        shutil.copy('files/1FAT.cif', self.source)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.cache = Cache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def cached(self):
+        return CIF.from_path(self.source, cache_dir=self.cache_dir)
+
+    def test_stores_a_sidecar(self):
+        self.cached()
+        self.assertTrue(os.path.exists(self.cache.entry(self.source)))
+
+    def test_loads_from_sidecar(self):
+        self.cached()
+        self.assertTrue(self.cache.load(self.source) is not None)
+
+    def test_gives_none_without_sidecar(self):
+        self.assertTrue(self.cache.load(self.source) is None)
+
+    def test_cached_tables_match_parsed(self):
+        self.cached()
+        cif = self.cache.load(self.source)
+        with open(self.source, 'rb') as raw:
+            parsed = CIF(raw)
+        self.assertEqual(list(parsed.atom_site.column('Cartn_x')),
+                         list(cif.atom_site.column('Cartn_x')))
+        self.assertEqual(parsed.pdbx_poly_seq_scheme[3],
+                         cif.pdbx_poly_seq_scheme[3])
+
+    def test_cached_structure_is_usable(self):
+        self.cached()
+        cif = self.cache.load(self.source)
+        val = cif.chain('1_555', '1', 'D').first().unit_id()
+        ans = '1FAT|1|D|SER|1'
+        self.assertEqual(ans, val)
+
+    def test_keeps_assemblies_and_entities(self):
+        self.cached()
+        cif = self.cache.load(self.source)
+        self.assertEqual(['1_555'], [op['name'] for op in cif.operators('A')])
+        self.assertEqual([], cif.operators('bob'))
+        self.assertTrue(cif.is_water('5'))
+
+    def test_ignores_sidecar_for_changed_file(self):
+        self.cached()
+        with open(self.source, 'ab') as out:
+            out.write('#\n')
+        self.assertTrue(self.cache.load(self.source) is None)
+
+    def test_uses_sidecar_when_only_mtime_changes(self):
+        self.cached()
+        os.utime(self.source, (0, 0))
+        self.assertTrue(self.cache.load(self.source) is not None)
+
+    def test_refreshes_sidecar_when_only_mtime_changes(self):
+        self.cached()
+        os.utime(self.source, (0, 0))
+        self.cache.load(self.source)
+        cache = self.cache
+        hashed = []
+
+        def validate(source, path):
+            result = Cache.__validate__(cache, source, path)
+            hashed.append(result)
+            return result
+
+        cache.__validate__ = validate
+        cache.load(self.source)
+        self.assertEqual([True], hashed)
+
+    def test_stores_a_cif_loaded_from_a_sidecar(self):
+        self.cached()
+        cif = self.cache.load(self.source)
+        other = Cache(os.path.join(self.directory, 'other'))
+        other.store(self.source, cif)
+        val = other.load(self.source)
+        self.assertEqual(cif.table_names(), val.table_names())
+        self.assertEqual(len(cif.atom_site), len(val.atom_site))
+
+    def test_keeps_table_order(self):
+        with open(self.source, 'rb') as raw:
+            parsed = CIF(raw)
+        self.cached()
+        val = self.cache.load(self.source).table_names()
+        self.assertEqual(parsed.table_names(), val)
+
+    def test_ignores_sidecar_from_other_version(self):
+        self.cached()
+        filename = self.cache.entry(self.source)
+        with open(filename, 'r+b') as raw:
+            magic, version, length = PREFIX.unpack(raw.read(PREFIX.size))
+            raw.seek(0)
+            raw.write(PREFIX.pack(magic, version + 1, length))
+        self.assertTrue(self.cache.load(self.source) is None)
+        self.assertFalse(os.path.exists(filename))
+
+    def test_evicts_least_recently_used(self):
+        other = os.path.join(self.directory, 'other.cif')
+        shutil.copy(self.source, other)
+        cif = self.cached()
+        self.cache.store(other, cif)
+        first = self.cache.entry(self.source)
+        os.utime(first, (0, 0))
+        size = os.path.getsize(first)
+        small = Cache(self.cache_dir, max_size=size + size // 2)
+        small.evict()
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(small.entry(other)))
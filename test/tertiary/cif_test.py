@@ -1,8 +1,25 @@
 from __future__ import with_statement
 
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import weakref
 import unittest
+import collections as coll
+
+import numpy as np
+
+from StringIO import StringIO
 
 from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.cif import operator_names
+from rnastructure.tertiary.cif import polymer_breaks
+from rnastructure.tertiary.cif import linkage_breaks
+from rnastructure.tertiary.cif import SequenceTemplate
+from rnastructure.tertiary.cif import choose_altlocs
+from rnastructure.tertiary.cif import ComplexOperatorException
 # from rnastructure.tertiary.cif import Chain
 from rnastructure.tertiary.cif import MissingColumn
 from rnastructure.tertiary.cif import MissingBlockException
@@ -36,6 +53,107 @@ class SimpleCIFTest(unittest.TestCase):
         self.assertRaises(AttributeError, lambda: self.cif.bob)
 
 
+class LazyCIFTest(unittest.TestCase):
+    def setUp(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            self.cif = CIF(raw)
+
+    def test_only_parses_needed_tables(self):
+        val = sorted(self.cif._tables)
+        ans = ['entity', 'pdbx_struct_assembly_gen', 'pdbx_struct_oper_list']
+        self.assertEqual(ans, val)
+
+    def test_caches_tables(self):
+        self.assertTrue(self.cif.atom_site is self.cif.table('_atom_site'))
+
+    def test_can_parse_everything_up_front(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw, lazy=False)
+        self.assertEqual(len(self.cif.atom_site), len(cif.atom_site))
+
+
+class SelectedCIFTest(unittest.TestCase):
+    def setUp(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            self.cif = CIF(raw, columns={'atom_site': ['id']},
+                           where={'atom_site': self.keep})
+
+    def keep(self, row):
+        return row['label_comp_id'] != 'HOH' and row['auth_asym_id'] == 'A'
+
+    def test_keeps_requested_and_required_columns(self):
+        columns = self.cif.atom_site.columns
+        self.assertTrue('id' in columns)
+        self.assertTrue('Cartn_x' in columns)
+        self.assertFalse('occupancy' in columns)
+
+    def test_drops_unwanted_rows(self):
+        val = set(self.cif.atom_site.column('auth_asym_id'))
+        self.assertEqual(set(['A']), val)
+        self.assertFalse('HOH' in self.cif.atom_site.column('label_comp_id'))
+
+    def test_leaves_other_tables_alone(self):
+        self.assertEqual(7, len(self.cif.entity[0]))
+
+    def test_can_still_build_structure(self):
+        val = [chain['chain'] for chain in self.cif.chains()]
+        self.assertEqual(['A'], val)
+        self.assertEqual('1FAT|1|A|SER|1', self.cif.unit_ids()[0])
+
+    def test_can_select_while_streaming(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw, stream=True, columns={'atom_site': ['id']},
+                      where={'atom_site': self.keep})
+        self.assertEqual(list(self.cif.atom_site.column('id')),
+                         list(cif.atom_site.column('id')))
+        self.assertFalse('occupancy' in cif.atom_site.columns)
+
+
+class CompressedCIFTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, opener):
+        path = os.path.join(self.directory, name)
+        out = opener(path, 'wb')
+        with open('files/1FAT.cif', 'rb') as raw:
+            shutil.copyfileobj(raw, out)
+        out.close()
+        return path
+
+    def check(self, cif):
+        self.assertEqual(self.cif.unit_ids(), cif.unit_ids())
+        self.assertEqual(self.cif.entity[1], cif.entity[1])
+
+    def test_reads_gzip_files(self):
+        self.check(CIF.from_path(self.write('1FAT.cif.gz', gzip.open)))
+
+    def test_reads_bzip2_files(self):
+        self.check(CIF.from_path(self.write('1FAT.cif.bz2', bz2.BZ2File)))
+
+    def test_does_not_keep_parsed_values(self):
+        cif = CIF.from_path(self.write('1FAT.cif.gz', gzip.open))
+        self.assertEqual({}, cif.data.categories)
+        self.assertEqual(self.cif.table_names(), cif.table_names())
+        self.assertEqual(len(self.cif.atom_site),
+                         len(cif._tables['atom_site']))
+
+    def test_caches_compressed_files(self):
+        path = self.write('1FAT.cif.gz', gzip.open)
+        cache_dir = os.path.join(self.directory, 'cache')
+        CIF.from_path(path, cache_dir=cache_dir)
+        self.check(CIF.from_path(path, cache_dir=cache_dir))
+
+
 class SimpleTableTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -116,7 +234,7 @@ class SimpleTableTest(unittest.TestCase):
 
     def test_get_item_can_give_subtable(self):
         ans = ['SER', 'ASN']
-        val = self.data[0:2].mon_id
+        val = list(self.data[0:2].mon_id)
         self.assertEqual(val, ans)
 
     def test_get_item_can_give_column(self):
@@ -138,6 +256,104 @@ class SimpleTableTest(unittest.TestCase):
     def test_get_item_on_too_big_int_gives_index(self):
         self.assertRaises(IndexError, lambda: self.data[90000])
 
+    def test_iterates_over_rows(self):
+        val = [row['mon_id'] for row in self.data[0:3]]
+        ans = ['SER', 'ASN', 'ASP']
+        self.assertEqual(val, ans)
+
+
+class ColumnarTableTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.data = self.__class__.data.table('atom_site')
+
+    def test_does_not_build_rows_on_creation(self):
+        self.assertTrue(self.data._rows is None)
+
+    def test_column_is_an_array(self):
+        val = self.data.column('label_asym_id')
+        self.assertEqual(len(val), len(self.data))
+        self.assertEqual(val[0], 'A')
+
+    def test_stores_distinct_values_once(self):
+        val = len(self.data._data['label_comp_id'].levels)
+        self.assertTrue(val < 30)
+
+    def test_gets_a_numeric_column(self):
+        val = self.data.numeric('Cartn_x')[0:2].tolist()
+        ans = [22.898, 23.460]
+        self.assertEqual(ans, val)
+
+    def test_gets_an_integer_column(self):
+        val = self.data.numeric('auth_seq_id', dtype=int)[0:8].tolist()
+        ans = [1, 1, 1, 1, 1, 1, 2, 2]
+        self.assertEqual(ans, val)
+
+    def test_uses_given_value_for_missing_entries(self):
+        val = set(self.data.numeric('pdbx_formal_charge', dtype=int,
+                                    missing=0).tolist())
+        self.assertEqual(set([0]), val)
+
+    def test_row_matches_columns(self):
+        val = self.data[6]
+        self.assertEqual('ASN', val['label_comp_id'])
+        self.assertEqual('9.773', val['Cartn_y'])
+
+    def test_fails_getting_missing_numeric_column(self):
+        self.assertRaises(MissingColumn, self.data.numeric, 'bob')
+
+
+class TableIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+
+    def setUp(self):
+        self.unobs = self.cif.pdbx_unobs_or_zero_occ_residues
+
+    def test_groups_by_one_column(self):
+        groups = self.cif.atom_site.group_by('label_asym_id')
+        self.assertEqual(set(self.cif.atom_site.column('label_asym_id')),
+                         set(groups))
+        self.assertEqual(len(self.cif.atom_site),
+                         sum(len(rows) for rows in groups.values()))
+
+    def test_groups_by_several_columns(self):
+        groups = self.unobs.group_by('auth_asym_id', 'PDB_model_num')
+        val = sorted(groups)
+        ans = [('A', '1'), ('B', '1'), ('C', '1'), ('D', '1')]
+        self.assertEqual(ans, val)
+
+    def test_keeps_rows_in_file_order(self):
+        rows = self.unobs.group_by('auth_asym_id')['B']
+        self.assertEqual(sorted(rows.tolist()), rows.tolist())
+
+    def test_caches_indexes(self):
+        first = self.unobs.group_by('auth_asym_id')
+        self.assertTrue(first is self.unobs.group_by('auth_asym_id'))
+
+    def test_finds_matching_rows(self):
+        val = self.unobs.where(auth_asym_id='B', PDB_model_num=1)
+        ans = [row for row in self.unobs
+               if row['auth_asym_id'] == 'B' and row['PDB_model_num'] == '1']
+        self.assertEqual(ans, val)
+        self.assertTrue(len(val) > 0)
+
+    def test_gives_nothing_for_unknown_values(self):
+        self.assertEqual([], self.unobs.where(auth_asym_id='bob'))
+
+    def test_fails_for_unknown_columns(self):
+        self.assertRaises(MissingColumn, self.unobs.where, bob='A')
+
+    def test_groups_empty_tables(self):
+        table = self.cif.atom_site[0:0]
+        self.assertEqual({}, table.group_by('label_asym_id'))
+
 
 class SimpleSymmetryTest(unittest.TestCase):
     @classmethod
@@ -324,3 +540,712 @@ class CifPolymersTest(unittest.TestCase):
 
     # def test_can_generate_a_unit_id(self):
     #     self.fail()
+
+
+class HierarchyTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+        self.operator = self.cif.pdbx_struct_oper_list[0]
+        self.hierarchy = self.cif.hierarchy(self.operator)
+
+    def test_is_built_once_per_operator(self):
+        val = self.cif.hierarchy(self.operator)
+        self.assertTrue(val is self.hierarchy)
+
+    def test_only_includes_polymer_atoms(self):
+        val = len(self.hierarchy)
+        ans = sum(1 for a in self.cif.atom_site if a['label_entity_id'] == '1')
+        self.assertEqual(ans, val)
+
+    def test_can_include_nonpolymers(self):
+        val = len(self.cif.hierarchy(self.operator, nonpolymers=True))
+        ans = len(self.cif.atom_site)
+        self.assertEqual(ans, val)
+
+    def test_knows_range_of_each_chain(self):
+        val = sorted(self.hierarchy.chains)
+        ans = [('1', 'A'), ('1', 'B'), ('1', 'C'), ('1', 'D')]
+        self.assertEqual(ans, val)
+
+    def test_chain_ranges_cover_all_atoms(self):
+        ranges = sorted(self.hierarchy.chains.values())
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(len(self.hierarchy), ranges[-1][1])
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(stop, start)
+
+    def test_chain_atoms_come_from_its_range(self):
+        start, stop = self.hierarchy.chains[('1', 'B')]
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = sum(1 for _ in chain.atoms())
+        self.assertEqual(stop - start, val)
+
+    def test_gets_a_residue_without_building_all(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = chain.residue(2).unit_id()
+        self.assertTrue(chain._residues is None)
+        self.assertEqual('1FAT|1|B|ASP|3', val)
+
+    def test_residue_count_matches_residues(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        self.assertEqual(len(chain), len(list(chain.residue_iterator())))
+
+    def test_fails_getting_missing_residue(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        self.assertRaises(IndexError, chain.residue, 500)
+
+    def test_polymers_keep_every_atom(self):
+        chain = self.cif.chain('1_555', 1, 'A')
+        val = sum(len(r) for p in chain.polymers() for r in p.residues())
+        ans = sum(1 for _ in chain.atoms())
+        self.assertEqual(ans, val)
+
+    def test_sorts_all_atoms_once(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw, profile=True)
+        cif.hierarchy(self.operator)
+        cif.hierarchy(self.operator, nonpolymers=True)
+        list(cif.model_iterator())
+        self.assertEqual(1, cif.profile.stats()['sort']['calls'])
+
+    def test_takes_atoms_from_the_sorted_order(self):
+        order = self.cif.__atom_order__().tolist()
+        rows = set(self.hierarchy.order.tolist())
+        val = self.hierarchy.order.tolist()
+        ans = [row for row in order if row in rows]
+        self.assertEqual(ans, val)
+
+    def test_sorts_residue_numbers_numerically(self):
+        start, stop = self.hierarchy.chains[('1', 'A')]
+        numbers = [int(n) for n in self.hierarchy.values(
+            'auth_seq_id', np.arange(start, stop))]
+        self.assertEqual(sorted(numbers), numbers)
+
+
+class EntityMaskTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+        cls.model = cls.cif.model('1_555', 1)
+
+    def test_selects_atoms_by_entity_type(self):
+        val = self.cif.entity_mask(types=['water']).sum()
+        self.assertEqual(16, val)
+
+    def test_selects_atoms_by_polymer_type(self):
+        val = self.cif.entity_mask(polymer_types=['polypeptide(L)']).sum()
+        ans = self.cif.entity_mask(types=['polymer']).sum()
+        self.assertEqual(ans, val)
+
+    def test_selects_nothing_for_missing_polymer_type(self):
+        val = self.cif.entity_mask(polymer_types=['polyribonucleotide'])
+        self.assertFalse(val.any())
+
+    def test_caches_masks(self):
+        val = self.cif.entity_mask(types=['water'])
+        self.assertTrue(val is self.cif.entity_mask(types=('water',)))
+
+    def test_knows_polymer_type(self):
+        self.assertEqual('polypeptide(L)', self.cif.polymer_type('1'))
+        self.assertTrue(self.cif.polymer_type('5') is None)
+
+    def test_gets_waters_of_a_model(self):
+        waters = self.model.waters()
+        val = set(r['residue'] for r in waters.residues())
+        self.assertEqual(set(['HOH']), val)
+        self.assertEqual(16, len(waters))
+
+    def test_gets_ligands_of_a_chain(self):
+        chain = self.model.chain('A')
+        val = chain.ligands().unit_ids()
+        ans = ['1FAT|1|A|NAG|253', '1FAT|1|A|MN|254', '1FAT|1|A|CA|255']
+        self.assertEqual(ans, val)
+
+    def test_ligands_are_not_in_the_polymer_chain(self):
+        chain = self.model.chain('A')
+        ligands = set(chain.ligands().unit_ids())
+        self.assertFalse(ligands & set(chain.unit_ids()))
+
+    def test_ligands_share_the_sorted_atoms(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw, profile=True)
+        for chain in cif.chains():
+            chain.ligands()
+        self.assertEqual(1, cif.profile.stats()['sort']['calls'])
+
+
+ASSEMBLY = """data_TEST
+#
+loop_
+_entity.id
+_entity.type
+1 polymer
+#
+loop_
+_pdbx_struct_assembly_gen.assembly_id
+_pdbx_struct_assembly_gen.oper_expression
+_pdbx_struct_assembly_gen.asym_id_list
+1 '(1-2)' AA,BB
+2 1       AA
+#
+loop_
+_pdbx_struct_oper_list.id
+_pdbx_struct_oper_list.name
+_pdbx_struct_oper_list.matrix[1][1]
+_pdbx_struct_oper_list.matrix[1][2]
+_pdbx_struct_oper_list.matrix[1][3]
+_pdbx_struct_oper_list.vector[1]
+_pdbx_struct_oper_list.matrix[2][1]
+_pdbx_struct_oper_list.matrix[2][2]
+_pdbx_struct_oper_list.matrix[2][3]
+_pdbx_struct_oper_list.vector[2]
+_pdbx_struct_oper_list.matrix[3][1]
+_pdbx_struct_oper_list.matrix[3][2]
+_pdbx_struct_oper_list.matrix[3][3]
+_pdbx_struct_oper_list.vector[3]
+1 1_555 1 0 0 0 0 1 0 0 0 0 1 0
+2 2_555 -1 0 0 10 0 -1 0 0 0 0 1 5
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.label_entity_id
+_atom_site.label_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.auth_seq_id
+_atom_site.auth_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_atom_id
+_atom_site.pdbx_PDB_model_num
+ATOM 1 P P . A AA 1 1 ? 1.0 2.0 3.0 1 A A P 1
+ATOM 2 P P . G AA 1 2 ? 4.0 5.0 6.0 2 G A P 1
+ATOM 3 P P . C BB 1 1 ? 7.0 8.0 9.0 1 C B P 1
+#
+"""
+
+
+class OperatorNamesTest(unittest.TestCase):
+
+    def test_parses_single_operator(self):
+        self.assertEqual(['1'], operator_names('1'))
+
+    def test_parses_list_of_operators(self):
+        self.assertEqual(['1', '2', '5'], operator_names('(1,2,5)'))
+
+    def test_parses_ranges(self):
+        self.assertEqual(['1', '2', '3', '7'], operator_names('(1-3,7)'))
+
+    def test_fails_on_operator_products(self):
+        self.assertRaises(ComplexOperatorException, operator_names,
+                          '(1-60)(61-88)')
+
+
+class CoordinatesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+
+    def test_identity_keeps_coordinates(self):
+        residue = self.cif.chain('1_555', 1, 'D').first()
+        atom = next(residue.atoms())
+        val = list(residue.coordinates()[0])
+        ans = [float(atom[axis]) for axis in ('Cartn_x', 'Cartn_y', 'Cartn_z')]
+        self.assertEqual(ans, val)
+
+    def test_chain_coordinates_have_one_row_per_atom(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = chain.coordinates().shape
+        ans = (sum(1 for _ in chain.atoms()), 3)
+        self.assertEqual(ans, val)
+
+
+class AssemblyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cif = CIF(StringIO(ASSEMBLY))
+
+    def test_splits_multiple_character_asym_ids(self):
+        val = [op['name'] for op in self.cif.operators('BB')]
+        ans = ['1_555', '2_555']
+        self.assertEqual(ans, val)
+
+    def test_lists_all_assemblies(self):
+        self.assertEqual(['1', '2'], self.cif.assemblies())
+
+    def test_assembly_is_lazy(self):
+        cif = CIF(StringIO(ASSEMBLY), profile=True)
+        parts = cif.assembly('1')
+        self.assertFalse('group' in cif.profile.stats())
+        next(parts)
+        self.assertEqual(1, cif.profile.stats()['group']['calls'])
+
+    def test_assembly_does_not_keep_parts(self):
+        parts = self.cif.assembly('1')
+        part = weakref.ref(next(parts)._hierarchy)
+        next(parts)
+        self.assertTrue(part() is None)
+        self.assertEqual({}, self.cif._hierarchies)
+
+    def test_assembly_uses_each_operator(self):
+        val = [part['symmetry_operator'] for part in self.cif.assembly('1')]
+        ans = ['1_555', '2_555']
+        self.assertEqual(ans, val)
+
+    def test_assembly_only_uses_listed_asyms(self):
+        part = next(self.cif.assembly('2'))
+        val = sorted(set(atom['label_asym_id'] for atom in part.atoms()))
+        self.assertEqual(['AA'], val)
+
+    def test_transforms_coordinates(self):
+        part = list(self.cif.assembly('1'))[1]
+        val = part.coordinates().tolist()
+        ans = [[9.0, -2.0, 8.0], [6.0, -5.0, 11.0], [3.0, -8.0, 14.0]]
+        self.assertEqual(ans, val)
+
+    def test_keeps_operators_with_the_same_name_apart(self):
+        text = ASSEMBLY.replace(' 1_555 ', ' ? ').replace(' 2_555 ', ' ? ')
+        cif = CIF(StringIO(text))
+        val = [op.coordinates()[0].tolist()
+               for op in cif.symmetry_operators()]
+        ans = [[1.0, 2.0, 3.0], [9.0, -2.0, 8.0]]
+        self.assertEqual(ans, val)
+
+    def test_transform_matches_coordinates(self):
+        first, second = list(self.cif.assembly('1'))
+        val = second.transform(first.coordinates()).tolist()
+        ans = second.coordinates().tolist()
+        self.assertEqual(ans, val)
+
+
+class NeighborTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+        self.model = self.cif.symmetry_operator('1_555').model(1)
+
+    def test_finds_residues_near_a_residue(self):
+        residue = self.cif.chain('1_555', 1, 'A').residue(10)
+        val = [r.unit_id() for r in self.model.within(residue, 4.0)]
+        self.assertEqual('1FAT|1|A|ARG|10', val[0])
+        self.assertEqual(9, len(val))
+        self.assertFalse(residue.unit_id() in val)
+
+    def test_batched_query_matches_single_queries(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        residues = [chain.residue(i) for i in range(5)]
+        val = [[r.unit_id() for r in found]
+               for found in self.model.within_many(residues, 3.5)]
+        ans = [[r.unit_id() for r in self.model.within(residue, 3.5)]
+               for residue in residues]
+        self.assertEqual(ans, val)
+
+    def test_pairs_are_within_cutoff(self):
+        for first, second in self.model.pairs_within(3.0)[:50]:
+            delta = first.coordinates()[:, None] - second.coordinates()
+            self.assertTrue((delta ** 2).sum(axis=2).min() <= 9.0)
+
+    def test_pairs_include_neighbors_in_chain(self):
+        chain = self.cif.chain('1_555', 1, 'A')
+        pairs = set((a.unit_id(), b.unit_id())
+                    for a, b in chain.pairs_within(2.0))
+        ans = (chain.residue(0).unit_id(), chain.residue(1).unit_id())
+        self.assertTrue(ans in pairs)
+
+    def test_reuses_spatial_index(self):
+        chain = self.cif.chain('1_555', 1, 'A')
+        chain.pairs_within(2.0)
+        other = self.cif.chain('1_555', 1, 'A')
+        self.assertTrue(chain.__grid__() is other.__grid__())
+
+
+class UnitIdsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+
+    def test_matches_residue_unit_ids(self):
+        val = self.cif.unit_ids(nonpolymers=True)
+        ans = [r.unit_id() for s in self.cif.symmetry_operators(
+            nonpolymers=True) for r in s.residues()]
+        self.assertEqual(ans, val)
+
+    def test_gets_ids_for_one_chain(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = chain.unit_ids()[:2]
+        ans = ['1FAT|1|B|SER|1', '1FAT|1|B|ASN|2']
+        self.assertEqual(ans, val)
+
+    def test_gets_atom_level_ids(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = chain.unit_ids(level='atom')[:2]
+        ans = ['1FAT|1|B|SER|1|N', '1FAT|1|B|SER|1|CA']
+        self.assertEqual(ans, val)
+
+    def test_maps_ids_to_atom_ranges(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        residue = chain.residue(3)
+        val = chain.unit_id_ranges()[residue.unit_id()]
+        ans = (residue._start, residue._stop)
+        self.assertEqual(ans, val)
+
+    def test_maps_ids_to_operator_and_range(self):
+        ranges = self.cif.unit_id_ranges(level='atom')
+        self.assertEqual(len(self.cif.hierarchy(
+            self.cif.pdbx_struct_oper_list[0])), len(ranges))
+        self.assertEqual('1_555', ranges['1FAT|1|A|SER|1|N'][0])
+
+    def test_rejects_unknown_level(self):
+        self.assertRaises(ValueError, self.cif.unit_ids, level='bob')
+
+    def test_includes_other_symmetry_operators(self):
+        cif = CIF(StringIO(ASSEMBLY))
+        val = cif.unit_ids()
+        ans = ['TEST|1|A|A|1', 'TEST|1|A|G|2', 'TEST|1|B|C|1',
+               'TEST|1|A|A|1||||2_555', 'TEST|1|A|G|2||||2_555',
+               'TEST|1|B|C|1||||2_555']
+        self.assertEqual(ans, val)
+
+
+class SequenceMappingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+        self.chain = self.cif.chain('1_555', 1, 'A')
+
+    def test_groups_sequence_by_asym(self):
+        val = [row['asym_id'] for row in self.cif.sequence_scheme('B')]
+        self.assertEqual(252, len(val))
+        self.assertEqual(set(['B']), set(val))
+
+    def test_gives_empty_sequence_for_unknown_asym(self):
+        self.assertEqual([], self.cif.sequence_scheme('bob'))
+
+    def test_gets_experimental_sequence(self):
+        val = self.chain.experimental_sequence()[:3]
+        ans = ['SER', 'ASN', 'ASP']
+        self.assertEqual(ans, val)
+
+    def test_maps_observed_residues(self):
+        val = self.chain.experimental_sequence_mapping()[0]
+        ans = ('SER', '1FAT|Sequence|A|SER|1', '1FAT|1|A|SER|1')
+        self.assertEqual(ans, val)
+
+    def test_maps_unobserved_residues_to_none(self):
+        val = self.chain.experimental_sequence_mapping()[36]
+        ans = ('GLY', '1FAT|Sequence|A|GLY|37', None)
+        self.assertEqual(ans, val)
+
+    def test_gets_mappings_for_all_chains(self):
+        mappings = self.cif.sequence_mappings()
+        val = [chain['chain'] for chain, _ in mappings]
+        self.assertEqual(['A', 'B', 'C', 'D'], val)
+        self.assertEqual(self.chain.experimental_sequence_mapping(),
+                         mappings[0][1])
+
+    def test_shares_sequence_between_chains_of_an_entity(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw)
+        cif.sequence_mappings()
+        val = cif.entity_memo.report()
+        self.assertEqual({'sequence': {'hits': 3, 'misses': 1}}, val)
+
+    def test_relabels_shared_sequence_for_each_chain(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        val = chain.experimental_sequence_mapping()[0]
+        ans = ('SER', '1FAT|Sequence|B|SER|1', '1FAT|1|B|SER|1')
+        self.assertEqual(ans, val)
+
+    def test_shared_sequence_is_not_changed_by_callers(self):
+        self.chain.experimental_sequence().append('bob')
+        val = self.cif.chain('1_555', 1, 'B').experimental_sequence()
+        self.assertEqual(252, len(val))
+
+    def test_knows_if_sequence_maps_a_residue_twice(self):
+        val = SequenceTemplate(['A', 'A'], ['1', '1'])
+        self.assertFalse(val.unique)
+
+
+class PolymerBreaksTest(unittest.TestCase):
+
+    def test_breaks_after_each_endpoint(self):
+        val = polymer_breaks([1, 2, 5, 6, 9], ['?'] * 5, [(3, '?'), (7, '?')])
+        self.assertEqual([2, 4], val)
+
+    def test_uses_insertion_codes(self):
+        val = polymer_breaks([1, 2, 2, 3], ['?', '?', 'B', '?'], [(2, 'A')])
+        self.assertEqual([2], val)
+
+    def test_gives_end_for_trailing_endpoints(self):
+        val = polymer_breaks([1, 2], ['?', '?'], [(3, '?'), (4, '?')])
+        self.assertEqual([2, 2], val)
+
+    def test_polymers_share_the_unobserved_list(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            chain = CIF(raw).chain('1_555', 1, 'A')
+        polymers = list(chain.polymers())
+        self.assertTrue(polymers[0]._unobs is chain.unobs)
+        self.assertEqual(chain.unobs[1:], polymers[0].unobs)
+
+
+class GeometryBreaksTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+        self.chain = self.cif.chain('1_555', 1, 'A')
+
+    def test_finds_long_links(self):
+        codes = np.array([0, 1, 0, 1, 0, 1])
+        residues = np.array([0, 0, 1, 1, 2, 2])
+        coordinates = np.array([[0.0, 0, 0], [1.0, 0, 0], [2.5, 0, 0],
+                                [3.5, 0, 0], [9.0, 0, 0], [10.0, 0, 0]])
+        val = linkage_breaks(codes, residues, coordinates, 3, [1], [0])
+        self.assertEqual([2], val.tolist())
+
+    def test_breaks_when_link_atom_is_missing(self):
+        codes = np.array([0, 1, 0, 2])
+        residues = np.array([0, 0, 1, 1])
+        coordinates = np.zeros((4, 3))
+        val = linkage_breaks(codes, residues, coordinates, 2, [2], [0])
+        self.assertEqual([1], val.tolist())
+
+    def test_finds_breaks_in_chain(self):
+        val = self.chain.geometry_breaks().tolist()
+        self.assertEqual([36], val)
+        self.assertEqual('1FAT|1|A|ASN|38', self.chain.residue(36).unit_id())
+
+    def test_geometry_polymers_match_unobserved(self):
+        val = [p.unit_ids() for p in self.chain.polymers(breaks='geometry')]
+        ans = [p.unit_ids() for p in self.chain.polymers()]
+        self.assertEqual(ans, val)
+
+    def test_both_keeps_unobserved_residues(self):
+        val = [len(p.unobs) for p in self.chain.polymers(breaks='both')]
+        ans = [len(p.unobs) for p in self.chain.polymers()]
+        self.assertEqual(ans, val)
+
+    def test_detects_breaks_with_geometry(self):
+        chain = self.cif.chain('1_555', 1, 'B')
+        self.assertTrue(self.chain.has_breaks(breaks='geometry'))
+        self.assertFalse(chain.has_breaks(breaks='geometry'))
+
+    def test_rejects_unknown_break_method(self):
+        self.assertRaises(ValueError, list, self.chain.polymers(breaks='bob'))
+
+
+class CompactResidueTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.data = CIF(raw)
+
+    def setUp(self):
+        self.cif = self.__class__.data
+        self.chain = self.cif.chain('1_555', 1, 'B')
+        self.residue = self.chain.residue(1)
+
+    def test_has_no_instance_dict(self):
+        self.assertFalse(hasattr(self.residue, '__dict__'))
+
+    def test_is_a_mapping(self):
+        self.assertTrue(isinstance(self.residue, coll.Mapping))
+
+    def test_converts_to_dict(self):
+        val = dict(self.residue)
+        ans = {'pdb': '1FAT', 'model': '1', 'chain': 'B', 'number': '2',
+               'insertion_code': '?', 'symmetry_operator': '1_555',
+               'residue': 'ASN'}
+        self.assertEqual(ans, val)
+
+    def test_fails_getting_unknown_key(self):
+        self.assertRaises(KeyError, lambda: self.residue['bob'])
+        self.assertEqual(None, self.residue.get('bob'))
+
+    def test_residues_share_context(self):
+        first, second = self.chain.residues()[:2]
+        self.assertTrue(first._context is second._context)
+
+    def test_equal_residues_compare_equal(self):
+        self.assertEqual(self.residue, self.chain.residue(1))
+        self.assertNotEqual(self.residue, self.chain.residue(2))
+
+
+ENSEMBLE = ASSEMBLY.split('loop_\n_atom_site.group_PDB')[0] + """loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.label_entity_id
+_atom_site.label_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.auth_seq_id
+_atom_site.auth_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_atom_id
+_atom_site.pdbx_PDB_model_num
+ATOM 1 P P . G AA 1 2 ? 4.0 5.0 6.0 2 G A P 1
+ATOM 2 P P . A AA 1 1 ? 1.0 2.0 3.0 1 A A P 1
+ATOM 3 P P . A AA 1 1 ? 1.5 2.0 3.0 1 A A P 2
+ATOM 4 P P . G AA 1 2 ? 4.5 5.0 6.0 2 G A P 2
+ATOM 5 P P . C BB 1 1 ? 7.0 8.0 9.0 1 C B P 1
+#
+"""
+
+
+ALTLOCS = ASSEMBLY.split('loop_\n_atom_site.group_PDB')[0] + """loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_asym_id
+_atom_site.label_entity_id
+_atom_site.label_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.occupancy
+_atom_site.auth_seq_id
+_atom_site.auth_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_atom_id
+_atom_site.pdbx_PDB_model_num
+ATOM 1 P P   . A AA 1 1 ? 1.0 2.0 3.0 1.0 1 A A P   1
+ATOM 2 C C1' A A AA 1 1 ? 1.1 2.0 3.0 0.3 1 A A C1' 1
+ATOM 3 C C1' B A AA 1 1 ? 1.2 2.0 3.0 0.7 1 A A C1' 1
+ATOM 4 P P   B G AA 1 2 ? 4.0 5.0 6.0 0.4 2 G A P   1
+ATOM 5 P P   C G AA 1 2 ? 4.1 5.0 6.0 0.6 2 G A P   1
+ATOM 6 P P   . C BB 1 1 ? 7.0 8.0 9.0 1.0 1 C B P   1
+#
+"""
+
+
+class AltlocTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cif = CIF(StringIO(ALTLOCS))
+        cls.model = cls.cif.model('1_555', 1)
+
+    def atoms(self, model):
+        return [(a['auth_seq_id'], a['auth_atom_id'], a['label_alt_id'])
+                for a in model.atoms()]
+
+    def test_groups_atoms_by_altloc(self):
+        residue = self.model.chain('A').residue(0)
+        val = dict((k, v.tolist()) for k, v in residue.altlocs().items())
+        self.assertEqual({None: [0], 'A': [1], 'B': [2]}, val)
+
+    def test_selects_highest_occupancy(self):
+        val = self.atoms(self.model.select_altloc('highest_occupancy'))
+        ans = [('1', 'P', '.'), ('1', "C1'", 'B'), ('2', 'P', 'C'),
+               ('1', 'P', '.')]
+        self.assertEqual(ans, val)
+
+    def test_selects_given_altloc(self):
+        val = self.atoms(self.model.select_altloc('A'))
+        ans = [('1', 'P', '.'), ('1', "C1'", 'A'), ('2', 'P', 'C'),
+               ('1', 'P', '.')]
+        self.assertEqual(ans, val)
+
+    def test_selection_keeps_coordinates(self):
+        model = self.model.select_altloc('A')
+        val = model.coordinates()[:, 0].tolist()
+        self.assertEqual([1.0, 1.1, 4.1, 7.0], val)
+
+    def test_selection_refers_to_same_rows(self):
+        model = self.model.select_altloc('A')
+        self.assertTrue(model._hierarchy.table is self.model._hierarchy.table)
+        self.assertEqual([0, 1, 4, 5], model.__rows__().tolist())
+
+    def test_keeps_everything_without_altlocs(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw)
+        model = cif.model('1_555', 1)
+        self.assertEqual(len(model), len(model.select_altloc('A')))
+
+    def test_breaks_ties_by_file_order(self):
+        val = choose_altlocs(np.array([0, 0]), np.array([1, 0]),
+                             np.array([0.5, 0.5]))
+        self.assertEqual([False, True], val.tolist())
+
+
+class ModelIteratorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+        cls.ensemble = CIF(StringIO(ENSEMBLE))
+
+    def test_gives_same_models_as_full_hierarchy(self):
+        val = [(m['symmetry_operator'], m['model'], m.unit_ids())
+               for m in self.cif.model_iterator()]
+        ans = [(m['symmetry_operator'], m['model'], m.unit_ids())
+               for m in self.cif.models()]
+        self.assertEqual(ans, val)
+
+    def test_gives_one_model_at_a_time(self):
+        val = [(m['model'], m.unit_ids(level='atom'))
+               for m in self.ensemble.model_iterator(operator='1_555')]
+        ans = [('1', ['TEST|1|A|A|1|P', 'TEST|1|A|G|2|P',
+                      'TEST|1|B|C|1|P']),
+               ('2', ['TEST|2|A|A|1|P', 'TEST|2|A|G|2|P'])]
+        self.assertEqual(ans, val)
+
+    def test_applies_operators(self):
+        models = list(self.ensemble.model_iterator(operator='2_555'))
+        val = models[1].coordinates().tolist()
+        ans = [[8.5, -2.0, 8.0], [5.5, -5.0, 11.0]]
+        self.assertEqual(ans, val)
+
+    def test_does_not_cache_hierarchies(self):
+        cif = CIF(StringIO(ENSEMBLE))
+        list(cif.model_iterator())
+        self.assertEqual({}, cif._hierarchies)
+
+    def test_can_get_numeric_values_of_some_rows(self):
+        column = self.ensemble.atom_site._data['Cartn_x']
+        val = column.numeric(rows=np.array([4, 0])).tolist()
+        self.assertEqual([7.0, 4.0], val)
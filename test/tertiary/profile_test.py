@@ -0,0 +1,118 @@
+from __future__ import with_statement
+
+import json
+import logging
+import unittest
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.profile import NULL
+from rnastructure.tertiary.profile import Profile
+from rnastructure.tertiary.profile import profiler
+
+
+class ProfileTest(unittest.TestCase):
+
+    def test_records_each_call(self):
+        profile = Profile()
+        for _ in xrange(3):
+            with profile.stage('sort'):
+                pass
+        self.assertEqual(3, profile.stats()['sort']['calls'])
+
+    def test_records_stages_which_raise(self):
+        profile = Profile()
+        try:
+            with profile.stage('parse'):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(1, profile.stats()['parse']['calls'])
+
+    def test_keeps_stages_in_order_seen(self):
+        profile = Profile()
+        for name in ['read', 'tables', 'read']:
+            with profile.stage(name):
+                pass
+        self.assertEqual(['read', 'tables'], profile.stats().keys())
+
+    def test_formats_a_log_line(self):
+        profile = Profile()
+        with profile.stage('read'):
+            pass
+        val = json.loads(profile.log_line(name='1FAT'))
+        self.assertEqual('1FAT', val['name'])
+        self.assertEqual(['calls', 'growth', 'peak', 'seconds'],
+                         sorted(val['stages']['read']))
+
+    def test_logs_one_line(self):
+        lines = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                lines.append(record.getMessage())
+
+        logger = logging.getLogger('profile_test')
+        logger.addHandler(Collect())
+        logger.setLevel(logging.INFO)
+        profile = Profile()
+        with profile.stage('read'):
+            pass
+        profile.log(logger=logger, name='1FAT')
+        self.assertEqual(1, len(lines))
+        self.assertEqual('1FAT', json.loads(lines[0])['name'])
+
+    def test_profiler_uses_given_profile(self):
+        profile = Profile()
+        self.assertTrue(profiler(profile) is profile)
+        self.assertTrue(profiler(False) is NULL)
+        self.assertTrue(isinstance(profiler(True), Profile))
+
+
+class CIFProfileTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw, profile=True)
+        cls.residues = [len(chain.residues()) for chain in cls.cif.chains()]
+        cls.stats = cls.cif.profile.stats()
+
+    def test_records_loading_stages(self):
+        for name in ['read', 'parse', 'tables', 'assemblies', 'entities',
+                     'sort', 'group', 'residues']:
+            self.assertTrue(name in self.stats, name)
+
+    def test_counts_residue_grouping_per_chain(self):
+        self.assertEqual(len(self.residues), self.stats['residues']['calls'])
+
+    def test_does_not_profile_by_default(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cif = CIF(raw)
+        list(cif.chains())
+        self.assertEqual({}, cif.profile.stats())
+
+    def test_logs_nothing_by_default(self):
+        lines = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                lines.append(record.getMessage())
+
+        logger = logging.getLogger('profile_test.null')
+        logger.addHandler(Collect())
+        logger.setLevel(logging.INFO)
+        profile = CIF.from_path('files/1FAT.cif').profile
+        profile.log(logger=logger, name='1FAT')
+        self.assertEqual([], lines)
+        self.assertEqual('', profile.log_line(name='1FAT'))
+
+    def test_shares_a_profile(self):
+        profile = Profile()
+        for _ in xrange(2):
+            with open('files/1FAT.cif', 'rb') as raw:
+                CIF(raw, profile=profile)
+        self.assertEqual(2, profile.stats()['read']['calls'])
+
+    def test_profiles_loading_from_a_path(self):
+        cif = CIF.from_path('files/1FAT.cif', profile=True)
+        self.assertTrue('read' in cif.profile.stats())
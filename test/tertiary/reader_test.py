@@ -0,0 +1,291 @@
+from __future__ import with_statement
+
+import unittest
+
+from StringIO import StringIO
+
+from rnastructure.tertiary.reader import Reader
+from rnastructure.tertiary.reader import locate
+from rnastructure.tertiary.reader import tokenize
+from rnastructure.tertiary.reader import Selection
+from rnastructure.tertiary.reader import CIFSyntaxError
+from rnastructure.tertiary.reader import stream_categories
+
+SIMPLE = """data_TEST
+#
+_entry.id   TEST
+#
+_struct.title       'A "quoted" title'
+_struct.details
+;First line
+second line
+;
+#
+loop_
+_atom_site.id
+_atom_site.label_atom_id
+_atom_site.label_comp_id
+_atom_site.Cartn_x
+1 "O5'" A 1.000
+2 C5'   A 2.000 # A comment
+3 'N 1' ? .
+#
+"""
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_splits_simple_values(self):
+        val = tokenize('1 A  B\n2 C D\n')
+        ans = ['1', 'A', 'B', '2', 'C', 'D']
+        self.assertEqual(ans, val)
+
+    def test_removes_quotes(self):
+        val = tokenize("""'a b' "c d" e\n""")
+        ans = ['a b', 'c d', 'e']
+        self.assertEqual(ans, val)
+
+    def test_allows_quotes_inside_values(self):
+        val = tokenize("""'O5'' "O5'" x'y\n""")
+        ans = ["O5'", "O5'", "x'y"]
+        self.assertEqual(ans, val)
+
+    def test_skips_comments(self):
+        val = tokenize("1 2 # three\n# four\n5\n")
+        ans = ['1', '2', '5']
+        self.assertEqual(ans, val)
+
+    def test_keeps_empty_quoted_values(self):
+        val = tokenize("a '' b\n")
+        ans = ['a', '', 'b']
+        self.assertEqual(ans, val)
+
+
+class ReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = Reader(StringIO(SIMPLE)).read()
+        self.block = self.blocks[0]
+
+    def test_finds_one_block(self):
+        self.assertEqual(1, len(self.blocks))
+
+    def test_gets_block_name(self):
+        self.assertEqual('TEST', self.block.name)
+
+    def test_keeps_category_order(self):
+        val = self.block.order
+        ans = ['entry', 'struct', 'atom_site']
+        self.assertEqual(ans, val)
+
+    def test_reads_key_value_categories(self):
+        val = self.block.category('struct').row(0)[0]
+        ans = 'A "quoted" title'
+        self.assertEqual(ans, val)
+
+    def test_reads_text_fields(self):
+        val = self.block.category('struct').row(0)[1]
+        ans = 'First line\nsecond line'
+        self.assertEqual(ans, val)
+
+    def test_reads_loop_attributes(self):
+        val = self.block.category('atom_site').attributes
+        ans = ['id', 'label_atom_id', 'label_comp_id', 'Cartn_x']
+        self.assertEqual(ans, val)
+
+    def test_reads_loop_rows(self):
+        category = self.block.category('atom_site')
+        val = [category.row(i) for i in range(len(category))]
+        ans = [['1', "O5'", 'A', '1.000'],
+               ['2', "C5'", 'A', '2.000'],
+               ['3', 'N 1', '?', '.']]
+        self.assertEqual(ans, val)
+
+    def test_gets_a_column(self):
+        val = self.block.category('atom_site').column(1)
+        ans = ["O5'", "C5'", 'N 1']
+        self.assertEqual(ans, val)
+
+    def test_gives_none_for_missing_category(self):
+        self.assertTrue(self.block.category('bob') is None)
+
+    def test_reads_several_blocks(self):
+        blocks = Reader(StringIO(SIMPLE + SIMPLE.replace('TEST', 'OTHER')))
+        val = [block.name for block in blocks.read()]
+        ans = ['TEST', 'OTHER']
+        self.assertEqual(ans, val)
+
+    def test_complains_about_unterminated_text(self):
+        raw = StringIO("data_A\n_a.b\n;never closed\n")
+        self.assertRaises(CIFSyntaxError, Reader(raw).read)
+
+    def test_complains_about_incomplete_loops(self):
+        raw = StringIO("data_A\nloop_\n_a.b\n_a.c\n1 2 3\n")
+        self.assertRaises(CIFSyntaxError, Reader(raw).read)
+
+
+class LocateTest(unittest.TestCase):
+
+    def test_finds_each_category(self):
+        val = [(block, name) for block, name, _, _ in locate(SIMPLE)]
+        ans = [('TEST', 'entry'), ('TEST', 'struct'), ('TEST', 'atom_site')]
+        self.assertEqual(ans, val)
+
+    def test_finds_category_positions(self):
+        val = [SIMPLE[start:stop].split()[0]
+               for _, _, start, stop in locate(SIMPLE)]
+        ans = ['_entry.id', '_struct.title', 'loop_']
+        self.assertEqual(ans, val)
+
+    def test_ignores_tags_inside_text_fields(self):
+        raw = "data_A\n_a.b\n;\n_c.d 1\n;\n_a.e 2\n"
+        val = [name for _, name, _, _ in locate(raw)]
+        ans = ['a']
+        self.assertEqual(ans, val)
+
+
+class LazyReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.block = Reader(StringIO(SIMPLE)).read(lazy=True)[0]
+
+    def test_does_not_parse_categories(self):
+        self.assertEqual({}, self.block.categories)
+
+    def test_knows_all_categories(self):
+        self.assertTrue('atom_site' in self.block)
+        self.assertFalse('bob' in self.block)
+
+    def test_parses_requested_category(self):
+        val = self.block.category('atom_site').column(0)
+        ans = ['1', '2', '3']
+        self.assertEqual(ans, val)
+
+    def test_gives_same_data_as_full_parse(self):
+        full = Reader(StringIO(SIMPLE)).read()[0]
+        val = [(c.name, c.attributes, c.values) for c in self.block]
+        ans = [(c.name, c.attributes, c.values) for c in full]
+        self.assertEqual(ans, val)
+
+
+class FileReaderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.block = Reader(raw).read()[0]
+
+    def test_reads_all_atoms(self):
+        val = len(self.block.category('atom_site'))
+        ans = 7248
+        self.assertEqual(ans, val)
+
+    def test_reads_multiline_values(self):
+        val = self.block.category('entity_poly').row(0)[4].split('\n')[-1]
+        ans = 'LNLANLVLNKIL'
+        self.assertEqual(ans, val)
+
+    def test_reads_quoted_values(self):
+        val = self.block.category('entity').column(3)[1]
+        ans = 'SUGAR (N-ACETYL-D-GLUCOSAMINE)'
+        self.assertEqual(ans, val)
+
+
+class SelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.block = Reader(StringIO(SIMPLE)).read(lazy=True)[0]
+
+    def test_keeps_only_requested_attributes(self):
+        category = self.block.category('atom_site',
+                                       attributes=['Cartn_x', 'id'])
+        self.assertEqual(['id', 'Cartn_x'], category.attributes)
+        self.assertEqual(['1', '1.000', '2', '2.000', '3', '.'],
+                         category.values)
+
+    def test_keeps_only_matching_rows(self):
+        category = self.block.category(
+            'atom_site', predicate=lambda row: row['label_comp_id'] == 'A')
+        self.assertEqual(['1', '2'], category.column(0))
+
+    def test_filters_on_attributes_which_are_not_kept(self):
+        category = self.block.category(
+            'atom_site', attributes=['id'],
+            predicate=lambda row: row['label_atom_id'] == 'N 1')
+        self.assertEqual(['3'], category.values)
+
+    def test_selects_from_key_value_categories(self):
+        category = self.block.category('struct', attributes=['details'])
+        self.assertEqual(['First line\nsecond line'], category.values)
+
+    def test_selects_from_parsed_blocks(self):
+        block = Reader(StringIO(SIMPLE)).read()[0]
+        category = block.category('atom_site', attributes=['id'],
+                                  predicate=lambda row: row['id'] != '2')
+        self.assertEqual(['1', '3'], category.values)
+
+    def test_selects_rows_split_across_chunks(self):
+        selection = Selection(['a', 'b'], ['b'], lambda row: row['a'] != 'x')
+        selected = []
+        rest = selection.take(['1', '2', 'x', '3', '4'], selected)
+        rest = selection.take(rest + ['5'], selected)
+        self.assertEqual(['2', '5'], selected)
+        self.assertEqual([], rest)
+
+    def test_complains_about_incomplete_selected_loops(self):
+        raw = StringIO("data_A\nloop_\n_a.b\n_a.c\n1 2 3\n")
+        block = Reader(raw).read(lazy=True)[0]
+        self.assertRaises(CIFSyntaxError, block.category, 'a',
+                          attributes=['b'])
+
+
+class StreamTest(unittest.TestCase):
+
+    def parsed(self, text, **kwargs):
+        return [(name, c.name, c.attributes, c.values) for name, c, _ in
+                stream_categories(StringIO(text), **kwargs)]
+
+    def read(self, text):
+        return [(b.name, c.name, c.attributes, c.values)
+                for b in Reader(StringIO(text)).read() for c in b]
+
+    def test_gives_same_data_as_full_parse(self):
+        self.assertEqual(self.read(SIMPLE), self.parsed(SIMPLE))
+
+    def test_gives_same_data_in_small_chunks(self):
+        self.assertEqual(self.read(SIMPLE), self.parsed(SIMPLE, size=7))
+
+    def test_gives_same_data_for_a_file(self):
+        with open('files/1FAT.cif', 'rb') as raw:
+            text = raw.read()
+        self.assertEqual(self.read(text), self.parsed(text, size=4096))
+
+    def test_reads_text_fields_inside_loops(self):
+        text = "data_A\nloop_\n_a.b\n_a.c\n1\n;long\nvalue\n;\n2 3\n"
+        val = self.parsed(text)[0][3]
+        ans = ['1', 'long\nvalue', '2', '3']
+        self.assertEqual(ans, val)
+
+    def test_selects_while_reading(self):
+        found = list(stream_categories(
+            StringIO(SIMPLE), attributes={'atom_site': ['id']},
+            predicates={'atom_site': lambda row: row['Cartn_x'] != '.'}))
+        _, category, selected = found[-1]
+        self.assertEqual(['1', '2'], category.values)
+        self.assertTrue(selected)
+
+    def test_keeps_selected_categories_in_blocks(self):
+        block = Reader(StringIO(SIMPLE), stream=True).read(
+            attributes={'atom_site': ['id']},
+            predicates={'atom_site': lambda row: row['id'] != '2'})[0]
+        category = block.category('atom_site', attributes=['id'],
+                                  predicate=lambda row: row['id'] != '2')
+        self.assertEqual(['1', '3'], category.values)
+
+    def test_complains_about_unterminated_text(self):
+        stream = stream_categories(StringIO("data_A\n_a.b\n;text\n"))
+        self.assertRaises(CIFSyntaxError, list, stream)
+
+    def test_complains_about_incomplete_loops(self):
+        stream = stream_categories(StringIO("data_A\nloop_\n_a.b\n_a.c\n1\n"))
+        self.assertRaises(CIFSyntaxError, list, stream)
@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+
+from rnastructure.tertiary.spatial import Grid
+from rnastructure.tertiary.spatial import expand
+
+
+class ExpandTest(unittest.TestCase):
+
+    def test_expands_ranges(self):
+        owners, positions = expand(np.array([2, 7, 4]), np.array([4, 7, 5]))
+        self.assertEqual([0, 0, 2], owners.tolist())
+        self.assertEqual([2, 3, 4], positions.tolist())
+
+
+class GridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.points = np.array([[0.0, 0.0, 0.0],
+                                [1.0, 0.0, 0.0],
+                                [0.0, 3.5, 0.0],
+                                [10.0, 10.0, 10.0],
+                                [10.0, 10.0, 12.5]])
+        self.grid = Grid(self.points, size=2.0)
+
+    def brute(self, radius):
+        pairs = []
+        for i in range(len(self.points)):
+            for j in range(i + 1, len(self.points)):
+                delta = self.points[i] - self.points[j]
+                if np.dot(delta, delta) <= radius ** 2:
+                    pairs.append((i, j))
+        return pairs
+
+    def test_finds_atoms_near_a_point(self):
+        val = self.grid.within([[0.5, 0.5, 0.0]], 1.0).tolist()
+        ans = [0, 1]
+        self.assertEqual(ans, val)
+
+    def test_finds_nothing_far_away(self):
+        val = self.grid.within([[-50.0, 0.0, 0.0]], 3.0).tolist()
+        self.assertEqual([], val)
+
+    def test_queries_many_points(self):
+        points, atoms = self.grid.query([[0.0, 0.0, 0.0], [10, 10, 11]], 1.5)
+        val = zip(points.tolist(), atoms.tolist())
+        ans = [(0, 0), (0, 1), (1, 3), (1, 4)]
+        self.assertEqual(ans, val)
+
+    def test_finds_pairs_with_cell_size_cutoff(self):
+        val = zip(*[a.tolist() for a in self.grid.pairs(2.0)])
+        self.assertEqual(self.brute(2.0), val)
+
+    def test_finds_pairs_beyond_cell_size(self):
+        val = zip(*[a.tolist() for a in self.grid.pairs(3.6)])
+        self.assertEqual(self.brute(3.6), val)
+
+    def test_handles_no_atoms(self):
+        grid = Grid(np.zeros((0, 3)))
+        self.assertEqual([], grid.within([[0.0, 0.0, 0.0]], 5.0).tolist())
+
+    def test_rejects_bad_cell_size(self):
+        self.assertRaises(ValueError, Grid, self.points, 0)
@@ -0,0 +1,180 @@
+from __future__ import with_statement
+
+import unittest
+
+from StringIO import StringIO
+
+from rnastructure.tertiary.cif import CIF
+from rnastructure.tertiary.reader import Reader
+from rnastructure.tertiary.writer import quote
+from rnastructure.tertiary.writer import PDBFormatError
+
+from test.tertiary.cif_test import ASSEMBLY
+from test.tertiary.cif_test import ENSEMBLE
+
+
+def written(container, method, **kwargs):
+    out = StringIO()
+    getattr(container, method)(out, **kwargs)
+    return out.getvalue()
+
+
+class QuoteTest(unittest.TestCase):
+
+    def test_leaves_simple_values(self):
+        self.assertEqual('CA', quote('CA'))
+
+    def test_quotes_values_with_spaces_or_quotes(self):
+        self.assertEqual("'N 1'", quote('N 1'))
+        self.assertEqual('"\'a b\'"', quote("'a b'"))
+        self.assertEqual("'_a'", quote('_a'))
+
+    def test_leaves_quotes_inside_values(self):
+        self.assertEqual("O5'", quote("O5'"))
+
+    def test_uses_text_fields_for_multiline_values(self):
+        self.assertEqual('\n;a\nb\n;\n', quote('a\nb'))
+
+
+class WriteCifTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+        cls.chain = cls.cif.chain('1_555', '1', 'A')
+        text = written(cls.chain, 'write_cif')
+        cls.block = Reader(StringIO(text)).read()[0]
+
+    def test_writes_one_row_per_atom(self):
+        val = len(self.block.category('atom_site'))
+        ans = len(list(self.chain.atoms()))
+        self.assertEqual(ans, val)
+
+    def test_writes_every_column(self):
+        val = self.block.category('atom_site').attributes
+        ans = self.cif.atom_site.columns
+        self.assertEqual(ans, val)
+
+    def test_writes_values_unchanged(self):
+        category = self.block.category('atom_site')
+        atoms = list(self.chain.atoms())
+        for name in ['id', 'auth_atom_id', 'Cartn_x', 'pdbx_PDB_ins_code']:
+            index = category.attributes.index(name)
+            self.assertEqual([atom[name] for atom in atoms],
+                             category.column(index))
+
+    def test_can_be_read_as_structure(self):
+        text = written(CIF(StringIO(ASSEMBLY)).chain('1_555', '1', 'A'),
+                       'write_cif')
+        self.assertTrue(text.startswith('data_TEST\n'))
+        block = Reader(StringIO(text)).read()[0]
+        self.assertEqual(['TEST'], block.category('entry').values)
+
+    def test_applies_symmetry(self):
+        cif = CIF(StringIO(ASSEMBLY))
+        part = list(cif.assembly('1'))[1]
+        text = written(part, 'write_cif', symmetry=True)
+        category = Reader(StringIO(text)).read()[0].category('atom_site')
+        columns = [category.attributes.index(axis)
+                   for axis in ('Cartn_x', 'Cartn_y', 'Cartn_z')]
+        val = [[category.row(i)[c] for c in columns]
+               for i in xrange(len(category))]
+        ans = [['9.000', '-2.000', '8.000'], ['6.000', '-5.000', '11.000'],
+               ['3.000', '-8.000', '14.000']]
+        self.assertEqual(ans, val)
+
+    def test_can_be_loaded_as_a_cif(self):
+        cif = CIF(StringIO(written(self.chain, 'write_cif')))
+        chain = cif.chain('1_555', '1', 'A')
+        self.assertEqual(self.chain.unit_ids(), chain.unit_ids())
+        self.assertEqual(self.chain.coordinates().tolist(),
+                         chain.coordinates().tolist())
+
+    def test_writes_only_entities_of_written_atoms(self):
+        cif = CIF(StringIO(written(self.chain, 'write_cif')))
+        self.assertEqual(['1'], [entity['id'] for entity in cif.entity])
+
+    def test_keeps_operator_without_symmetry(self):
+        part = list(CIF(StringIO(ASSEMBLY)).assembly('1'))[1]
+        cif = CIF(StringIO(written(part, 'write_cif')))
+        loaded = list(cif.symmetry_operators())
+        self.assertEqual(['2_555'], [op['symmetry_operator'] for op in loaded])
+        self.assertEqual(part.coordinates().tolist(),
+                         loaded[0].coordinates().tolist())
+
+    def test_writes_identity_with_symmetry(self):
+        part = list(CIF(StringIO(ASSEMBLY)).assembly('1'))[1]
+        cif = CIF(StringIO(written(part, 'write_cif', symmetry=True)))
+        loaded = list(cif.symmetry_operators())
+        self.assertEqual(['1_555'], [op['symmetry_operator'] for op in loaded])
+        self.assertEqual(part.coordinates().tolist(),
+                         loaded[0].coordinates().tolist())
+        gen = cif.pdbx_struct_assembly_gen[0]
+        self.assertEqual('AA,BB', gen['asym_id_list'])
+
+
+class WritePdbTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('files/1FAT.cif', 'rb') as raw:
+            cls.cif = CIF(raw)
+
+    def lines(self, container, **kwargs):
+        return written(container, 'write_pdb', **kwargs).split('\n')
+
+    def test_writes_atom_records(self):
+        lines = self.lines(self.cif.chain('1_555', '1', 'A'))
+        ans = 'ATOM      2  CA  SER A   1      23.460  11.023  31.698' \
+            '  1.00 45.32           C'
+        self.assertEqual(ans, lines[1])
+
+    def test_writes_hetatm_records(self):
+        symmetry = self.cif.symmetry_operator('1_555', nonpolymers=True)
+        lines = [l for l in self.lines(symmetry) if l.startswith('HETATM')]
+        ans = 'HETATM 1794  C1  NAG A 253      43.384 -12.964  33.458' \
+            '  0.50  9.44           C'
+        self.assertEqual(ans, lines[0])
+
+    def test_ends_each_chain(self):
+        lines = self.lines(self.cif.model('1_555', 1))
+        self.assertEqual(4, lines.count('TER'))
+        self.assertEqual(['TER', 'END', ''], lines[-3:])
+
+    def test_writes_each_model(self):
+        cif = CIF(StringIO(ENSEMBLE))
+        lines = self.lines(cif.symmetry_operator('1_555'))
+        val = [l for l in lines if l.startswith(('MODEL', 'ENDMDL'))]
+        ans = ['MODEL        1', 'ENDMDL', 'MODEL        2', 'ENDMDL']
+        self.assertEqual(ans, val)
+
+    def test_applies_symmetry(self):
+        cif = CIF(StringIO(ASSEMBLY))
+        part = list(cif.assembly('1'))[1]
+        line = self.lines(part, symmetry=True)[0]
+        self.assertEqual('   9.000  -2.000   8.000', line[30:54])
+
+    def test_complains_about_long_chain_ids(self):
+        cif = CIF(StringIO(ASSEMBLY.replace(' A P 1\n', ' AB P 1\n')))
+        chain = cif.chain('1_555', '1', 'AB')
+        self.assertRaises(PDBFormatError, chain.write_pdb, StringIO())
+
+    def test_complains_about_coordinates_which_do_not_fit(self):
+        for value in ['-1000.0', '10000.0']:
+            cif = CIF(StringIO(ASSEMBLY.replace(' 1.0 2.0 3.0 ',
+                                                ' %s 2.0 3.0 ' % value)))
+            chain = cif.chain('1_555', '1', 'A')
+            self.assertRaises(PDBFormatError, chain.write_pdb, StringIO())
+
+    def test_writes_coordinates_at_the_edge_of_the_field(self):
+        cif = CIF(StringIO(ASSEMBLY.replace(' 1.0 2.0 3.0 ',
+                                            ' -999.999 9999.999 3.0 ')))
+        line = self.lines(cif.chain('1_555', '1', 'A'))[0]
+        self.assertEqual('-999.9999999.999   3.000', line[30:54])
+
+    def test_writes_nothing_but_end_for_empty_containers(self):
+        symmetry = self.cif.symmetry_operator('1_555')
+        empty = symmetry.model(1).chain('A')
+        empty._stop = empty._start
+        self.assertEqual('END\n', written(empty, 'write_pdb'))